@@ -7,7 +7,6 @@ import logging
 import os
 # pylint: disable=import-error
 import queue
-import random
 import re
 import requests
 import sys
@@ -16,12 +15,23 @@ import threading
 import time
 
 from ..core import provider
+from ..utils import aio as utils_aio
+from ..utils import bloom
+from ..utils import memo
 from ..utils import rnd
 
+from . import aio
+from . import cluster
+from . import pipeline
+from . import pool
+from . import scheduler
 from . import window
 
 logger = logging.getLogger('dice')
 
+# Catalogs of results whose new keys are new error signatures
+ERROR_CATALOGS = ('failure', 'unexpected_neg', 'unexpected_pass', 'timeout')
+
 
 class _TestThread(threading.Thread):
     """
@@ -108,6 +118,130 @@ class DiceApp(object):
             help='server authentication password',
             dest='password',
         )
+        self.parser.add_argument(
+            '--jobs',
+            action='store',
+            type=int,
+            help='number of worker processes running tests in parallel',
+            dest='jobs',
+            default=1,
+        )
+        self.parser.add_argument(
+            '--engine',
+            action='store',
+            choices=['process', 'asyncio', 'pipeline'],
+            help="engine to run tests. 'process' runs tests in --jobs "
+            "processes, 'asyncio' runs up to --concurrency tests in an "
+            "event loop, 'pipeline' generates tests in --generators "
+            "processes and runs them in --executors processes",
+            dest='engine',
+            default='process',
+        )
+        self.parser.add_argument(
+            '--concurrency',
+            action='store',
+            type=int,
+            help='maximum number of tests running concurrently with the '
+            'asyncio engine',
+            dest='concurrency',
+            default=64,
+        )
+        self.parser.add_argument(
+            '--generators',
+            action='store',
+            type=int,
+            help='number of processes generating tests with the pipeline '
+            'engine',
+            dest='generators',
+            default=1,
+        )
+        self.parser.add_argument(
+            '--executors',
+            action='store',
+            type=int,
+            help='number of processes running tests with the pipeline '
+            'engine',
+            dest='executors',
+            default=1,
+        )
+        self.parser.add_argument(
+            '--queue-size',
+            action='store',
+            type=int,
+            help='maximum number of tests queued between stages of the '
+            'pipeline engine',
+            dest='queue_size',
+            default=64,
+        )
+        self.parser.add_argument(
+            '--batch-size',
+            action='store',
+            type=int,
+            help='maximum number of tests generated at once by each '
+            'generator of the pipeline engine',
+            dest='batch_size',
+            default=16,
+        )
+        self.parser.add_argument(
+            '--dedup',
+            action='store_true',
+            help='skip running tests with the same options as tests '
+            'generated before',
+            dest='dedup',
+            default=False,
+        )
+        self.parser.add_argument(
+            '--dedup-error-rate',
+            action='store',
+            type=float,
+            help='probability of skipping a new test as a duplicate',
+            dest='dedup_error_rate',
+            default=0.001,
+        )
+        self.parser.add_argument(
+            '--dedup-memory',
+            action='store',
+            type=int,
+            help='memory in MiB used to remember generated tests of each '
+            'provider, shared by all processes of this machine',
+            dest='dedup_memory',
+            default=16,
+        )
+        self.parser.add_argument(
+            '--seed',
+            action='store',
+            type=int,
+            help='seed of the test campaign. Each test is generated with a '
+            'random generator seeded from it and a counter, so that it can '
+            'be regenerated from the seed saved in its result',
+            dest='seed',
+            default=None,
+        )
+        self.parser.add_argument(
+            '--stream',
+            action='store',
+            help="seed stream 'N/M' of a worker, the Nth of M workers "
+            "counting from 0. Workers with the same --seed must run "
+            "different streams so that their tests have distinct seeds",
+            dest='stream',
+            default=None,
+        )
+        self.parser.add_argument(
+            '--listen',
+            action='store',
+            help="run as coordinator collecting results from workers on "
+            "address '[HOST:]PORT'",
+            dest='listen',
+            default=None,
+        )
+        self.parser.add_argument(
+            '--connect',
+            action='store',
+            help="run as worker sending results to coordinator on address "
+            "'HOST:PORT'",
+            dest='connect',
+            default=None,
+        )
         self.parser.add_argument(
             '--no-ui',
             action='store_false',
@@ -122,6 +256,15 @@ class DiceApp(object):
             self.providers = self._process_providers()
         except provider.ProviderError as detail:
             exit(detail)
+        self.scheduler = scheduler.Scheduler(self.providers.keys())
+        if self.args.dedup:
+            for prvdr in self.providers.values():
+                prvdr.dedup = bloom.BloomFilter(
+                    error_rate=self.args.dedup_error_rate,
+                    max_bytes=self.args.dedup_memory * 1024 * 1024,
+                )
+        if self.args.seed is not None:
+            self._set_seed()
 
         self.stats = {
             "skip": {},
@@ -132,6 +275,7 @@ class DiceApp(object):
             "unexpected_neg": {},
             "unexpected_pass": {},
         }
+        self.metrics = {}
         self.QUEUE_MAX = 100
         self.exiting = False
         self.pause = False
@@ -144,6 +288,12 @@ class DiceApp(object):
         self.test_thread = _TestThread(self.test_excs, self)
         self.send_queue = []
         self.last_send_thread = None
+        self.link = None
+        # Worker pool or pipeline running tests in other processes, which
+        # report their cache statistics
+        self.engine = None
+        # Event loop of the asyncio engine
+        self.loop = None
         self.last_item = None
         self.cur_counter = 'failure'
 
@@ -158,6 +308,24 @@ class DiceApp(object):
         self.cur_class = (None, None)
         self.cur_item = (None, None)
 
+    def _set_seed(self):
+        """
+        Seed the providers with --seed and the stream of this worker.
+        """
+        stream, streams = 0, 1
+        if self.args.stream is not None:
+            try:
+                stream, streams = cluster.parse_stream(self.args.stream)
+            except cluster.ClusterError as detail:
+                exit(detail)
+        elif self.args.connect is not None:
+            exit('--stream is needed for workers running with --seed')
+        for prvdr in self.providers.values():
+            try:
+                prvdr.set_seed(self.args.seed, stream, streams)
+            except provider.ProviderError as detail:
+                exit(detail)
+
     def _update_items(self, cat_name, item_idx):
         self.cur_class = (cat_name, item_idx)
 
@@ -165,8 +333,11 @@ class DiceApp(object):
         self.cur_item = (cat_name, item_idx)
 
     def _merge_stat(self, panel):
-        self.pause = True
         cat_name, _ = panel.cur_key
+        # Metrics are shown in the panel but can't be merged
+        if cat_name not in self.stats:
+            return
+        self.pause = True
         text = self.window.get_input()
         match_keys = []
         for key in self.stats[cat_name]:
@@ -186,6 +357,9 @@ class DiceApp(object):
         """
         Categorizes and keep the count of a result of a test item depends on
         the expected failure patterns.
+
+        :return: True if the result has a new error signature, which is a
+                 new key in one of ERROR_CATALOGS.
         """
         res = item.res
         fail_patts = item.fail_patts
@@ -232,6 +406,7 @@ class DiceApp(object):
 
         stat = self.stats[catalog][key]
         stat.append(res)
+        return not found and catalog in ERROR_CATALOGS
 
     def _process_providers(self):
         """
@@ -279,32 +454,166 @@ class DiceApp(object):
         except requests.ConnectionError as detail:
             logger.debug('Failed to send result to server: %s', detail)
 
+    def _choose_provider(self):
+        """
+        Choose the provider to generate next test item from.
+        """
+        return self.providers[self.scheduler.choose()]
+
+    def _process_item(self, item):
+        """
+        Send a finished test item to the server and add it to statistics.
+        """
+        self.last_item = item
+
+        if self.link is not None:
+            self.link.send(item)
+
+        if self.args.server is not None:
+            self.send_queue.append(item)
+            if len(self.send_queue) > 200:
+                if self.last_send_thread:
+                    self.last_send_thread.join()
+                send_thread = threading.Thread(
+                    target=self._send,
+                    args=(self.send_queue,)
+                )
+                send_thread.start()
+                self.last_send_thread = send_thread
+                self.send_queue = []
+
+        found = self._stat_result(item)
+
+        # Workers of a coordinator may run with or without --dedup
+        if item.deduped:
+            self._count_duplicates(item)
+
+        run_cost = item.res.call_time if item.res else 0.0
+        self.scheduler.update(item.provider.name, item.gen_time, run_cost,
+                              1 if found else 0)
+
+    def _count_duplicates(self, item):
+        """
+        Update metrics of duplicated items dropped before running.
+        """
+        duplicates = self.metrics.get('dedup skipped', 0) + item.duplicates
+        unique = self.metrics.get('dedup unique', 0) + 1
+        self.metrics['dedup skipped'] = duplicates
+        self.metrics['dedup unique'] = unique
+        self.metrics['dedup rate (%)'] = int(
+            100.0 * duplicates / (duplicates + unique))
+
+    def _wait_paused(self):
+        """
+        Block while tests are paused.
+        """
+        while self.pause and not self.exiting:
+            time.sleep(0.5)
+
+    def _run_tests_parallel(self):
+        """
+        Iteratively run tests in a pool of worker processes.
+        """
+        workers = pool.WorkerPool(self.providers, self.args.jobs)
+        self.engine = workers
+        workers.start()
+        try:
+            while not self.exiting:
+                # Keep workers busy while current results are processed
+                while workers.pending < 2 * self.args.jobs:
+                    workers.submit(self._choose_provider().name)
+                try:
+                    item = workers.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                except pool.WorkerError as detail:
+                    logger.error('Worker failed to run an item:\n%s', detail)
+                    continue
+                self._process_item(item)
+                self._wait_paused()
+        finally:
+            workers.stop()
+
+    def _run_tests_pipeline(self):
+        """
+        Iteratively run tests in a pipeline of generator and executor
+        processes.
+        """
+        stages = pipeline.Pipeline(
+            self.providers,
+            generators=self.args.generators,
+            executors=self.args.executors,
+            queue_size=self.args.queue_size,
+            batch_size=self.args.batch_size,
+        )
+        self.engine = stages
+        stages.start()
+        try:
+            while not self.exiting:
+                stages.submit(lambda: self._choose_provider().name)
+                try:
+                    item = stages.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                except pipeline.WorkerError as detail:
+                    logger.error('Stage failed on an item:\n%s', detail)
+                    continue
+                finally:
+                    self.metrics.update(stages.metrics())
+                self._process_item(item)
+                self._wait_paused()
+        finally:
+            stages.stop()
+
+    def _run_coordinator(self):
+        """
+        Iteratively collect test results from workers.
+        """
+        host, port = cluster.parse_address(self.args.listen)
+        coordinator = cluster.Coordinator(self.providers, host, port)
+        coordinator.start()
+        try:
+            while not self.exiting:
+                try:
+                    item = coordinator.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is not None:
+                    self._process_item(item)
+                    self._wait_paused()
+        finally:
+            coordinator.close()
+
     def run_tests(self):
         """
         Iteratively run tests.
         """
+        if self.args.listen is not None:
+            self._run_coordinator()
+            return
+
+        if self.args.connect is not None:
+            host, port = cluster.parse_address(self.args.connect)
+            self.link = cluster.WorkerLink(self.providers, host, port)
+
+        if self.args.engine == 'asyncio':
+            aio.run_tests(self, self.args.concurrency, loop=self.loop)
+            return
+
+        if self.args.engine == 'pipeline':
+            self._run_tests_pipeline()
+            return
+
+        if self.args.jobs > 1:
+            self._run_tests_parallel()
+            return
+
         while not self.exiting:
-            item = random.choice(self.providers.values()).generate()
+            item = self._choose_provider().generate()
             item.run()
-            self.last_item = item
-
-            if self.args.server is not None:
-                self.send_queue.append(item)
-                if len(self.send_queue) > 200:
-                    if self.last_send_thread:
-                        self.last_send_thread.join()
-                    send_thread = threading.Thread(
-                        target=self._send,
-                        args=(self.send_queue,)
-                    )
-                    send_thread.start()
-                    self.last_send_thread = send_thread
-                    self.send_queue = []
-
-            self._stat_result(item)
-            if self.pause:
-                while self.pause and not self.exiting:
-                    time.sleep(0.5)
+            item.provider.report(item)
+            self._process_item(item)
+            self._wait_paused()
 
     def update_window(self):
         """
@@ -317,13 +626,23 @@ class DiceApp(object):
             for key, stat in self.stats[cat_name].items():
                 bundle = {'key': key, 'count': stat.counter}
                 panel.add_item(bundle, catalog=cat_name)
+        metrics = dict(self.metrics)
+        caches = memo.stats()
+        if self.engine is not None:
+            caches = memo.merge(caches, self.engine.cache_stats())
+        for name, stat in caches.items():
+            for key, value in stat.items():
+                metrics['%s %s' % (name, key)] = value
+        for key, value in sorted(metrics.items()):
+            bundle = {'key': key, 'count': value}
+            panel.add_item(bundle, catalog='metrics')
 
         # Set items panel content
         panel = self.window.items_panel
         panel.clear()
         cat_name, item_idx = self.cur_class
-        if cat_name is not None and item_idx is not None:
-            item_name, stat = self.stats[cat_name].items()[item_idx]
+        if cat_name in self.stats and item_idx is not None:
+            item_name, stat = list(self.stats[cat_name].items())[item_idx]
             try:
                 for item in self.stats[cat_name][item_name].queue:
                     bundle = {'item': item.cmdline}
@@ -335,8 +654,8 @@ class DiceApp(object):
         panel = self.window.detail_panel
         panel.clear()
         cat_name, item_idx = self.cur_class
-        if cat_name is not None and item_idx is not None:
-            item_name, stat = self.stats[cat_name].items()[item_idx]
+        if cat_name in self.stats and item_idx is not None:
+            item_name, stat = list(self.stats[cat_name].items())[item_idx]
             items = self.stats[cat_name][item_name].queue
 
             item_name, item_idx = self.cur_item
@@ -360,6 +679,11 @@ class DiceApp(object):
         os.environ["EDITOR"] = "echo"
 
         self.last_item = None
+        if self.args.engine == 'asyncio':
+            # Create the event loop in the main thread, which watches the
+            # subprocesses of the test thread before Python 3.8
+            self.loop = utils_aio.new_event_loop()
+
         if self.args.ui:
             try:
                 self.test_thread.start()
@@ -370,7 +694,7 @@ class DiceApp(object):
                     if self.exiting:
                         break
 
-                    if not self.test_thread.isAlive():
+                    if not self.test_thread.is_alive():
                         break
             except KeyboardInterrupt:
                 pass
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import traceback
+
+from ..utils import aio
+
+logger = logging.getLogger('dice')
+
+
+async def _run_item(item):
+    """
+    Run an item in the event loop. Items which only override run() or use a
+    launcher are run in the default executor.
+    """
+    cmdline = None
+    if item.launcher is None:
+        try:
+            cmdline = item.command()
+        except NotImplementedError:
+            pass
+
+    if cmdline is None:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, item.run)
+    else:
+        item.res = await aio.run(cmdline, timeout=item.timeout)
+    item.provider.report(item)
+    return item
+
+
+async def _run_tests(app, concurrency):
+    # Like the other engines, items are chosen and processed by the app
+    # pylint: disable=protected-access
+    running = set()
+    try:
+        while not app.exiting:
+            if app.pause:
+                await asyncio.sleep(0.5)
+                continue
+
+            while len(running) < concurrency:
+                item = app._choose_provider().generate()
+                running.add(asyncio.ensure_future(_run_item(item)))
+
+            done, running = await asyncio.wait(
+                running, timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    item = task.result()
+                except Exception:  # pylint: disable=broad-except
+                    logger.error('Failed to run an item:\n%s',
+                                 traceback.format_exc())
+                    continue
+                app._process_item(item)
+    finally:
+        # Kill the subprocesses of unfinished items
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+def run_tests(app, concurrency, loop=None):
+    """
+    Iteratively run tests with a bounded number of items running
+    concurrently in an asyncio event loop. Items which fail to run are
+    logged and don't stop the others.
+
+    :param app: The DICE application to run tests for.
+    :param concurrency: Maximum number of items running at the same time.
+    :param loop: Event loop created by dice.utils.aio.new_event_loop() to
+                 run tests in, which is closed afterwards. Default to a new
+                 one, which requires the main thread before Python 3.8.
+    """
+    if loop is None:
+        loop = aio.new_event_loop()
+    try:
+        loop.run_until_complete(_run_tests(app, concurrency))
+    finally:
+        loop.close()
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import socket
+import threading
+
+# pylint: disable=import-error
+import queue
+
+logger = logging.getLogger('dice')
+
+
+class ClusterError(Exception):
+    """
+    Class for coordinator and worker connection specific exceptions.
+    """
+    pass
+
+
+def parse_address(address, default_host=''):
+    """
+    Parse an address like 'HOST:PORT' or 'PORT'.
+
+    :param address: The address string.
+    :param default_host: Host used if it's not in the address.
+    :return: A tuple of host and port.
+    """
+    host, _, port = address.rpartition(':')
+    try:
+        return host or default_host, int(port)
+    except ValueError:
+        raise ClusterError('Invalid address %s' % address) from None
+
+
+def parse_stream(stream):
+    """
+    Parse a seed stream of a worker like 'N/M', the Nth of M streams
+    counting from 0.
+
+    :param stream: The stream string.
+    :return: A tuple of stream index and number of streams.
+    """
+    index, _, count = stream.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ClusterError('Invalid stream %s' % stream) from None
+    if not 0 <= index < count:
+        raise ClusterError('Stream index of %s should be between 0 and %s' %
+                           (stream, count - 1))
+    return index, count
+
+
+class _WorkerConnection(threading.Thread):
+    """
+    Thread reading result records from a connected worker.
+    """
+
+    def __init__(self, coordinator, sock, address):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.coordinator = coordinator
+        self.sock = sock
+        self.address = address
+        self.worker_name = '%s:%s' % address
+        self.count = 0
+
+    def run(self):
+        try:
+            for line in self.sock.makefile('rb'):
+                record = json.loads(line.decode('utf-8'))
+                if record.get('type') == 'hello':
+                    self.worker_name = record['name']
+                    self.coordinator.join(self, record['providers'])
+                elif record.get('type') == 'result':
+                    self.count += 1
+                    self.coordinator.results.put(record)
+        except (IOError, OSError, ValueError, KeyError) as detail:
+            logger.warning('Connection to worker %s broken: %s',
+                           self.worker_name, detail)
+        finally:
+            self.sock.close()
+            self.coordinator.leave(self)
+
+
+class Coordinator(object):
+    """
+    Coordinator accepting connections of workers and collecting result
+    records streamed by them.
+    """
+
+    def __init__(self, providers, host='', port=8068):
+        """
+        :param providers: A dict of providers keyed by provider name, used
+                          to rebuild items from records.
+        :param host: Host to listen on.
+        :param port: Port to listen on. 0 to pick a free port.
+        """
+        self.providers = providers
+        self.results = queue.Queue(10000)
+        self.workers = set()
+        self.lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(16)
+        self.address = self.sock.getsockname()
+        self.accept_thread = threading.Thread(target=self._accept)
+        self.accept_thread.daemon = True
+
+    def start(self):
+        """
+        Start accepting workers.
+        """
+        self.accept_thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self.sock.accept()
+            except (IOError, OSError):
+                # Listening socket closed
+                break
+            _WorkerConnection(self, sock, address).start()
+
+    def join(self, conn, providers):
+        with self.lock:
+            self.workers.add(conn)
+        unknown = set(providers) - set(self.providers)
+        if unknown:
+            logger.warning('Worker %s runs unknown providers %s',
+                           conn.worker_name, ', '.join(sorted(unknown)))
+        logger.info('Worker %s joined', conn.worker_name)
+
+    def leave(self, conn):
+        with self.lock:
+            self.workers.discard(conn)
+        logger.info('Worker %s left after %s results',
+                    conn.worker_name, conn.count)
+
+    def get(self, timeout=None):
+        """
+        Get an item rebuilt from a result record sent by a worker.
+
+        :param timeout: Seconds to wait for a record before queue.Empty is
+                        raised.
+        :return: The rebuilt item, or None if the record is from an unknown
+                 provider.
+        """
+        record = self.results.get(timeout=timeout)
+        prvdr = self.providers.get(record['provider'])
+        if prvdr is None:
+            return None
+        return prvdr.Item.from_dict(prvdr, record)
+
+    def close(self):
+        """
+        Stop accepting workers and close all worker connections.
+        """
+        self.sock.close()
+        with self.lock:
+            for conn in self.workers:
+                try:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+                except (IOError, OSError):
+                    pass
+
+
+class WorkerLink(object):
+    """
+    Connection of a worker streaming result records to the coordinator.
+    """
+
+    def __init__(self, providers, host, port, name=None):
+        """
+        :param providers: A dict of providers run by this worker.
+        :param host: Host of the coordinator.
+        :param port: Port of the coordinator.
+        :param name: Name of the worker. Default to 'HOSTNAME-PID'.
+        """
+        if name is None:
+            name = '%s-%s' % (socket.gethostname(), os.getpid())
+        self.name = name
+        try:
+            self.sock = socket.create_connection((host, port))
+        except (IOError, OSError) as detail:
+            raise ClusterError('Failed to connect coordinator %s:%s: %s' %
+                               (host, port, detail)) from detail
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_record({
+            'type': 'hello',
+            'name': name,
+            'providers': sorted(providers),
+        })
+
+    def _send_record(self, record):
+        data = json.dumps(record).encode('utf-8') + b'\n'
+        try:
+            self.sock.sendall(data)
+        except (IOError, OSError) as detail:
+            raise ClusterError('Connection to coordinator broken: %s' %
+                               detail) from detail
+
+    def send(self, item):
+        """
+        Send the result record of an item to the coordinator.
+
+        :param item: The finished item.
+        """
+        record = item.serialize()
+        record['type'] = 'result'
+        self._send_record(record)
+
+    def close(self):
+        self.sock.close()
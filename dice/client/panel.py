@@ -198,8 +198,7 @@ class ListPanel(_PanelBase):
             cat_name = None
             item_idx = None
             if self.catalogs:
-                # pylint: disable=unsubscriptable-object
-                cat_name = self.catalogs.keys()[0]
+                cat_name = next(iter(self.catalogs))
                 items = self.catalogs[cat_name].items
                 if items:
                     item_idx = 0
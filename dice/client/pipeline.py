@@ -0,0 +1,269 @@
+import collections
+import multiprocessing
+import os
+import random
+import time
+import traceback
+
+# pylint: disable=import-error
+import queue
+
+from .pool import WorkerError
+from ..utils import memo
+
+# Processes are forked to inherit the loaded providers, which pickled items
+# refer to by name
+_context = multiprocessing.get_context('fork')
+
+
+def _get_task(tasks, stopping, parent_pid):
+    """
+    Get a task from a queue. Return None if the pipeline is stopping or the
+    parent process exits.
+    """
+    while not stopping.is_set():
+        try:
+            return tasks.get(timeout=0.2)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                break
+    return None
+
+
+def _send_caches(caches):
+    """
+    Send cache statistics of current process to the parent, unless the queue
+    is full. Statistics are cumulative, so a dropped one is only outdated.
+    """
+    try:
+        caches.put_nowait((os.getpid(), memo.stats()))
+    except queue.Full:
+        pass
+
+
+def _generate(providers, tasks, items, results, feedback, caches, counter,
+              stopping, parent_pid, batch_size, stream, streams):
+    """
+    Main loop of a generator process. Take up to batch_size provider names
+    from the task queue, generate items from them in batches and put the
+    items to the item queue until the pipeline stops.
+    """
+    # Forked generators share the random state and item seeds of their
+    # parent
+    random.seed()
+    for prvdr in providers.values():
+        prvdr.split_seeds(stream, streams)
+    while True:
+        name = _get_task(tasks, stopping, parent_pid)
+        if name is None:
+            break
+
+        # Learn from results of items run by executors
+        while True:
+            try:
+                item = feedback.get_nowait()
+            except queue.Empty:
+                break
+            item.provider.report(item)
+
+        counts = collections.Counter([name])
+        while sum(counts.values()) < batch_size:
+            try:
+                counts[tasks.get_nowait()] += 1
+            except queue.Empty:
+                break
+
+        try:
+            batch = []
+            for name, count in counts.items():
+                if count == 1:
+                    batch.append(providers[name].generate())
+                else:
+                    batch.extend(providers[name].generate_batch(count))
+        except Exception:  # pylint: disable=broad-except
+            # Report the error, which is logged by the parent
+            results.put((None, traceback.format_exc()))
+            continue
+        finally:
+            _send_caches(caches)
+        for item in batch:
+            items.put(item)
+        with counter.get_lock():
+            counter.value += len(batch)
+
+
+def _execute(items, results, caches, counter, stopping, parent_pid):
+    """
+    Main loop of an executor process. Take an item from the item queue, run
+    it and put it to the result queue until the pipeline stops.
+    """
+    while True:
+        item = _get_task(items, stopping, parent_pid)
+        if item is None:
+            break
+        try:
+            item.run()
+        except Exception:  # pylint: disable=broad-except
+            # Report the error, which is logged by the parent
+            results.put((None, traceback.format_exc()))
+            continue
+        finally:
+            _send_caches(caches)
+        results.put((item, None))
+        with counter.get_lock():
+            counter.value += 1
+
+
+class Pipeline(object):
+    """
+    A pipeline of generator and executor processes connected by bounded
+    queues, so that generating items overlaps with running them.
+
+    The parent process feeds provider names to generators and classifies
+    the results from executors. Each queue blocks its producers when it's
+    full. Finished items are fed back to generators, each of which is reported
+    to the provider of the generator that receives it.
+    """
+
+    def __init__(self, providers, generators=1, executors=1, queue_size=64,
+                 batch_size=1):
+        """
+        :param providers: A dict of providers keyed by provider name.
+        :param generators: Number of generator processes.
+        :param executors: Number of executor processes.
+        :param queue_size: Maximum size of each queue between stages.
+        :param batch_size: Maximum number of items a generator generates at
+                           once.
+        """
+        self.providers = providers
+        self.generators = generators
+        self.executors = executors
+        self.batch_size = batch_size
+        self.tasks = _context.Queue(queue_size)
+        self.items = _context.Queue(queue_size)
+        self.results = _context.Queue(queue_size)
+        self.feedback = _context.Queue(queue_size)
+        self.caches = _context.Queue(queue_size)
+        # Latest cache statistics keyed by stage process ID
+        self.worker_caches = {}
+        self.generated = _context.Value('L', 0)
+        self.executed = _context.Value('L', 0)
+        self.classified = 0
+        self.stopping = _context.Event()
+        self.workers = []
+
+    def start(self):
+        """
+        Start the generator and executor processes.
+        """
+        parent_pid = os.getpid()
+        for idx in range(self.generators):
+            self.workers.append(_context.Process(
+                target=_generate,
+                args=(self.providers, self.tasks, self.items, self.results,
+                      self.feedback, self.caches, self.generated,
+                      self.stopping, parent_pid, self.batch_size, idx,
+                      self.generators),
+            ))
+        for _ in range(self.executors):
+            self.workers.append(_context.Process(
+                target=_execute,
+                args=(self.items, self.results, self.caches,
+                      self.executed, self.stopping, parent_pid),
+            ))
+        # Not daemonic so that executors can start processes for in-process
+        # items
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, choose):
+        """
+        Fill the task queue with provider names.
+
+        :param choose: A function returns the next provider name.
+        """
+        while True:
+            try:
+                self.tasks.put_nowait(choose())
+            except queue.Full:
+                break
+
+    def get(self, timeout=None):
+        """
+        Get a finished item and feed its result back to generators.
+
+        :param timeout: Seconds to wait for a result before queue.Empty is
+                        raised.
+        :return: The item run by an executor.
+        """
+        item, error = self.results.get(timeout=timeout)
+        while True:
+            try:
+                pid, caches = self.caches.get_nowait()
+            except queue.Empty:
+                break
+            self.worker_caches[pid] = caches
+        if error is not None:
+            raise WorkerError(error)
+        self.classified += 1
+
+        # Feedback is dropped rather than blocking when generators are behind
+        try:
+            self.feedback.put_nowait(item)
+        except queue.Full:
+            pass
+        return item
+
+    def cache_stats(self):
+        """
+        Get statistics of caches summed over stage processes, as of their
+        latest finished tasks.
+
+        :return: A dict like the one returned by memo.stats().
+        """
+        return memo.merge(*list(self.worker_caches.values()))
+
+    def metrics(self):
+        """
+        Get counters and queue depths of each stage.
+
+        :return: A dict of metric values keyed by metric name.
+        """
+        return {
+            'generated': self.generated.value,
+            'executed': self.executed.value,
+            'classified': self.classified,
+            'tasks queued': self.tasks.qsize(),
+            'items queued': self.items.qsize(),
+            'results queued': self.results.qsize(),
+        }
+
+    def stop(self, timeout=5.0):
+        """
+        Stop all the generator and executor processes. Unfinished items are
+        discarded.
+
+        :param timeout: Seconds to wait before running processes are killed.
+        """
+        self.stopping.set()
+        # Tasks, feedback and statistics left in queues won't be consumed
+        # any more
+        self.tasks.cancel_join_thread()
+        self.feedback.cancel_join_thread()
+        self.caches.cancel_join_thread()
+
+        # Drain queues so that processes blocked on sending could exit
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            while worker.is_alive() and time.monotonic() < deadline:
+                for que in (self.items, self.results, self.caches):
+                    try:
+                        while True:
+                            que.get_nowait()
+                    except queue.Empty:
+                        pass
+                worker.join(0.1)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.workers = []
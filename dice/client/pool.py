@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import random
+import traceback
+
+# pylint: disable=import-error
+import queue
+
+from ..utils import memo
+
+# Workers are forked to inherit the loaded providers, which pickled items
+# refer to by name
+_context = multiprocessing.get_context('fork')
+
+
+class WorkerError(Exception):
+    """
+    Exception raised when a worker process failed to generate or run an item.
+    """
+    pass
+
+
+def _work(providers, tasks, results, parent_pid, stream, streams):
+    """
+    Main loop of a worker process. Take a provider name from the task queue,
+    generate and run an item from it and put the item to the result queue
+    until a None task is received or the parent process exits. Failed items
+    are reported as errors and don't stop the worker. Each result comes with
+    the cache statistics of the worker.
+    """
+    # Forked workers share the random state and item seeds of their parent
+    random.seed()
+    for prvdr in providers.values():
+        prvdr.split_seeds(stream, streams)
+    while True:
+        try:
+            name = tasks.get(timeout=1.0)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                break
+            continue
+        if name is None:
+            break
+        try:
+            item = providers[name].generate()
+            item.run()
+            item.provider.report(item)
+        except Exception:  # pylint: disable=broad-except
+            # Answer the task with the error, which is logged by the parent
+            results.put((None, traceback.format_exc(), os.getpid(),
+                         memo.stats()))
+            continue
+        results.put((item, None, os.getpid(), memo.stats()))
+
+
+class WorkerPool(object):
+    """
+    A pool of worker processes generating and running test items in parallel.
+
+    Workers are forked after the providers are loaded, so they inherit the
+    providers from the parent process. Items are sent back with pickle, in
+    which a provider is referred by its name.
+    """
+
+    def __init__(self, providers, jobs):
+        """
+        :param providers: A dict of providers keyed by provider name.
+        :param jobs: Number of worker processes.
+        """
+        self.providers = providers
+        self.jobs = jobs
+        self.tasks = _context.Queue()
+        self.results = _context.Queue()
+        self.workers = []
+        self.pending = 0
+        # Latest cache statistics keyed by worker process ID
+        self.worker_caches = {}
+
+    def start(self):
+        """
+        Start the worker processes.
+        """
+        for idx in range(self.jobs):
+            worker = _context.Process(
+                target=_work,
+                args=(self.providers, self.tasks, self.results,
+                      os.getpid(), idx, self.jobs),
+            )
+            # Not daemonic so that workers can start processes for
+            # in-process items
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, name):
+        """
+        Ask a worker to generate and run an item from a provider.
+
+        :param name: Name of the provider to generate item from.
+        """
+        self.tasks.put(name)
+        self.pending += 1
+
+    def get(self, timeout=None):
+        """
+        Get a finished item.
+
+        :param timeout: Seconds to wait for a result before queue.Empty is
+                        raised.
+        :return: The item run by a worker.
+        :raise WorkerError: If the worker failed to generate or run the item.
+        """
+        item, error, pid, caches = self.results.get(timeout=timeout)
+        self.pending -= 1
+        self.worker_caches[pid] = caches
+        if error is not None:
+            raise WorkerError(error)
+        return item
+
+    def cache_stats(self):
+        """
+        Get statistics of caches summed over workers, as of their latest
+        results.
+
+        :return: A dict like the one returned by memo.stats().
+        """
+        return memo.merge(*list(self.worker_caches.values()))
+
+    def stop(self, timeout=5.0):
+        """
+        Stop all the worker processes. Unfinished items are discarded.
+
+        :param timeout: Seconds to wait before running workers are killed.
+        """
+        for _ in self.workers:
+            self.tasks.put(None)
+
+        # Drain results so that workers blocked on sending could exit
+        while self.pending > 0:
+            try:
+                self.results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            self.pending -= 1
+
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
@@ -0,0 +1,77 @@
+import random
+
+
+class _Arm(object):
+    """
+    Discounted statistics of a provider for the scheduler.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.finds = 0.0
+        self.cost = 0.0
+        self.gen_cost = 0.0
+        self.run_cost = 0.0
+
+
+class Scheduler(object):
+    """
+    Choose providers by the rate of new error signatures found per second
+    spent on generating and running their items.
+
+    The rate of each provider is treated as a multi-armed bandit with a
+    Gamma posterior and chosen by Thompson sampling. Statistics are
+    discounted on every update, so that a provider which stopped finding new
+    signatures loses its share, while a provider not chosen for a long time
+    gets explored again.
+    """
+
+    def __init__(self, names, prior_finds=1.0, prior_cost=1.0, decay=0.999):
+        """
+        :param names: Names of providers to choose from.
+        :param prior_finds: Prior number of signatures found of a provider.
+        :param prior_cost: Prior cost in seconds of a provider.
+        :param decay: Discount factor applied to statistics on every update.
+        """
+        self.arms = dict((name, _Arm(name)) for name in names)
+        self.prior_finds = prior_finds
+        self.prior_cost = prior_cost
+        self.decay = decay
+
+    def choose(self):
+        """
+        Choose a provider.
+
+        :return: Name of the chosen provider.
+        """
+        if len(self.arms) == 1:
+            return next(iter(self.arms))
+
+        best, best_rate = None, -1.0
+        for arm in self.arms.values():
+            rate = random.gammavariate(arm.finds + self.prior_finds,
+                                       1.0 / (arm.cost + self.prior_cost))
+            if rate > best_rate:
+                best, best_rate = arm.name, rate
+        return best
+
+    def update(self, name, gen_cost, run_cost, finds):
+        """
+        Update statistics with a finished item.
+
+        :param name: Name of the provider generated the item.
+        :param gen_cost: Seconds spent on generating the item.
+        :param run_cost: Seconds spent on running the item.
+        :param finds: Number of new error signatures found by the item.
+        """
+        for arm in self.arms.values():
+            arm.finds *= self.decay
+            arm.cost *= self.decay
+
+        arm = self.arms[name]
+        arm.runs += 1
+        arm.finds += finds
+        arm.cost += gen_cost + run_cost
+        arm.gen_cost += gen_cost
+        arm.run_cost += run_cost
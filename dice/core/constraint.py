@@ -1,12 +1,44 @@
 import ast
+import collections
 import copy
+import functools
+import glob
+import hashlib
+import logging
 import os
+import pickle
 import random
 import re
-import yaml
 import shutil
+import sys
+import yaml
 
 from . import trace
+from .. import __version__
+from ..utils import data_dir
+
+logger = logging.getLogger(__name__)
+
+# Directory of parsed constraints cached by content of oracle files
+CACHE_DIR = os.path.join(data_dir.USER_BASE_DIR, 'cache')
+
+# Use the much faster LibYAML based loader when it's available
+_yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest():
+    """
+    Get the digest of the sources of dice.core, which define the classes of
+    pickled constraints and traces, so that caches made by other versions of
+    them are never loaded.
+    """
+    digest = hashlib.sha1()
+    for fpath in sorted(glob.glob(os.path.join(os.path.dirname(__file__),
+                                               '*.py'))):
+        with open(fpath, 'rb') as fp:
+            digest.update(fp.read())
+    return digest.hexdigest()
 
 
 class ConstraintError(Exception):
@@ -16,6 +48,120 @@ class ConstraintError(Exception):
     pass
 
 
+class Condition(object):
+    """
+    A logical expression on the status of other constraints, compiled once
+    into a predicate.
+
+    Names in the expression refer to the status of the constraints with
+    these names, or to the status literal itself like ``success``. A bare
+    name is true if that constraint succeeded. Expressions can be combined
+    with ``and``, ``or``, ``not`` and chained comparisons with ``is``,
+    ``is not``, ``==``, ``!=``, ``in`` and ``not in``.
+    """
+    _compare_ops = {
+        ast.Is: lambda a, b: a == b,
+        ast.Eq: lambda a, b: a == b,
+        ast.IsNot: lambda a, b: a != b,
+        ast.NotEq: lambda a, b: a != b,
+        ast.In: lambda a, b: a in b,
+        ast.NotIn: lambda a, b: a not in b,
+    }
+
+    def __init__(self, expr):
+        """
+        :param expr: A string of logical expression, or a list of
+                     constraint names which all should succeed.
+        """
+        if isinstance(expr, list):
+            expr = ' and '.join(expr)
+        self.expr = expr
+        self.names = set()
+        self._predicate = self._compile(expr)
+
+    def _compile(self, expr):
+        try:
+            module = ast.parse(expr)
+        except SyntaxError as detail:
+            raise ConstraintError('Invalid condition %r: %s' %
+                                  (expr, detail)) from detail
+        if len(module.body) != 1 or not isinstance(module.body[0], ast.Expr):
+            raise ConstraintError('Condition %r is not an expression' % expr)
+        return self._compile_test(module.body[0].value)
+
+    def _compile_value(self, node):
+        if isinstance(node, ast.Name):
+            name = node.id
+            default = name.lower()
+            self.names.add(name)
+            return lambda status: status.get(name, default)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            value = node.value.lower()
+            return lambda status: value
+        # String literals are parsed as ast.Str before Python 3.8
+        elif sys.version_info < (3, 8) and isinstance(node, ast.Str):
+            value = node.s.lower()
+            return lambda status: value
+        elif isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            elts = [self._compile_value(elt) for elt in node.elts]
+            return lambda status: [elt(status) for elt in elts]
+        raise ConstraintError('Unknown value node type: %s' %
+                              node.__class__.__name__)
+
+    def _compile_test(self, node):
+        if isinstance(node, ast.BoolOp):
+            values = [self._compile_test(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda status: all(v(status) for v in values)
+            return lambda status: any(v(status) for v in values)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = self._compile_test(node.operand)
+            return lambda status: not operand(status)
+        elif isinstance(node, ast.Compare):
+            operands = [self._compile_value(node.left)]
+            operands += [self._compile_value(c) for c in node.comparators]
+            ops = []
+            for op in node.ops:
+                if op.__class__ not in self._compare_ops:
+                    raise ConstraintError('Operator %s is not handled' %
+                                          op.__class__.__name__)
+                ops.append(self._compare_ops[op.__class__])
+
+            def _compare(status):
+                left = operands[0](status)
+                for op, operand in zip(ops, operands[1:]):
+                    right = operand(status)
+                    if not op(left, right):
+                        return False
+                    left = right
+                return True
+            return _compare
+        elif isinstance(node, ast.Name):
+            name = node.id
+            self.names.add(name)
+            return lambda status: status.get(name) == 'success'
+        raise ConstraintError('Unknown test node type: %s' %
+                              node.__class__.__name__)
+
+    def __call__(self, status):
+        """
+        Evaluate the condition.
+
+        :param status: A dict of constraint status keyed by constraint name.
+        :return: True if the condition holds.
+        """
+        return self._predicate(status)
+
+    def __getstate__(self):
+        return {'expr': self.expr}
+
+    def __setstate__(self, state):
+        self.__init__(state['expr'])
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.expr)
+
+
 class ConstraintManager(object):
     """
     Manager class contains and manipulates all constraints.
@@ -27,8 +173,12 @@ class ConstraintManager(object):
         self.provider = provider
         path = os.path.join(provider.path, 'oracles')
         self.constraints = self._load_constraints(path)
+        self.plan = self._plan(self.constraints)
         self.item = None
         self.status = {}
+        self.child_cache = {}
+        self.traces = {}
+        self._index_traces(self.constraints)
 
     def _load_constraints(self, path):
         """
@@ -38,48 +188,227 @@ class ConstraintManager(object):
         """
         cstrs = []
         for root, _, files in os.walk(path):
-            for fname in files:
-                fpath = os.path.join(root, fname)
-                with open(fpath) as fp:
-                    cstrs.extend(yaml.load(fp))
+            for fname in sorted(files):
+                cstrs.extend(self._load_file(os.path.join(root, fname)))
+        return cstrs
+
+    def _load_file(self, fpath):
+        """
+        Load constraints from a YAML file. Parsed constraints are pickled to
+        the cache directory, keyed by the path and content of the file, the
+        provider name, versions of DICE and Python and the sources of
+        dice.core. Caches of previous contents of the file are removed.
 
-        cstrs = [Constraint.from_dict(self.provider, c) for c in cstrs]
+        :param fpath: Path of the YAML file.
+        :return: A list of constraints.
+        """
+        with open(fpath, 'rb') as fp:
+            content = fp.read()
+
+        digest = hashlib.sha1()
+        for key in (self.provider.name, __version__, sys.version,
+                    _source_digest()):
+            digest.update(key.encode('utf-8') + b'\0')
+        digest.update(content)
+        source = hashlib.sha1(('%s\0%s' % (
+            self.provider.name, os.path.abspath(fpath))).encode('utf-8'))
+        cache_path = os.path.join(CACHE_DIR, '%s-%s.pickle' % (
+            source.hexdigest()[:16], digest.hexdigest()))
+
+        try:
+            with open(cache_path, 'rb') as fp:
+                return pickle.load(fp)
+        except (IOError, OSError):
+            pass
+        except Exception as detail:  # pylint: disable=broad-except
+            logger.debug('Ignore broken cache %s of %s: %s',
+                         cache_path, fpath, detail)
+
+        cstrs = [Constraint.from_dict(self.provider, c)
+                 for c in yaml.load(content, Loader=_yaml_loader) or []]
+
+        # Write to a temporary file first so that concurrent loaders never
+        # read a partial cache
+        tmp_path = '%s.%s.tmp' % (cache_path, os.getpid())
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR)
+            with open(tmp_path, 'wb') as fp:
+                pickle.dump(cstrs, fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+            self._prune_cache(cache_path)
+        except (IOError, OSError, pickle.PicklingError, TypeError,
+                AttributeError) as detail:
+            logger.debug('Failed to cache %s: %s', fpath, detail)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
         return cstrs
 
-    def _assumption_valid(self, constraint):
+    def _index_traces(self, cstrs):
+        for cstr in cstrs:
+            for t in cstr.traces:
+                self.traces[t.key] = t
+
+    @staticmethod
+    def _prune_cache(cache_path):
         """
-        Check whether the assumption of a constraint is valid.
+        Remove caches of the same oracle file not newer than a newly written
+        one, which are left by previous contents of the file.
 
-        :param constraint: The constraint whose assumption to be checked.
+        :param cache_path: Path of the newly written cache.
         """
-        if constraint.require is None:
-            return True
+        prefix = os.path.basename(cache_path).split('-')[0] + '-'
+        mtime = os.stat(cache_path).st_mtime_ns
+        for fname in os.listdir(CACHE_DIR):
+            fpath = os.path.join(CACHE_DIR, fname)
+            if (fpath == cache_path or not fname.startswith(prefix) or
+                    not fname.endswith('.pickle')):
+                continue
+            try:
+                if os.stat(fpath).st_mtime_ns <= mtime:
+                    os.remove(fpath)
+            except OSError:
+                # Removed by a concurrent loader
+                pass
+
+    @staticmethod
+    def _plan(cstrs):
+        """
+        Sort constraints topologically by the constraints their depends_on
+        and require refer to, keeping the loaded order where possible.
+        Constraints out of the list are assumed to be applied before.
 
-        module = ast.parse(constraint.require)
-        assert len(module.body) == 1
-        expr = module.body[0]
-        assert isinstance(expr, ast.Expr)
+        :param cstrs: A list of constraints.
+        :return: A list of constraints in the order to be applied.
+        """
+        names = set(c.name for c in cstrs)
+        prereqs = {}
+        dependents = collections.defaultdict(list)
+        for cstr in cstrs:
+            refs = set()
+            for cond in (cstr.depends_on, cstr.require):
+                if cond is not None:
+                    refs |= cond.names & names
+            prereqs[cstr.name] = len(refs)
+            for ref in refs:
+                dependents[ref].append(cstr)
+
+        plan = []
+        ready = collections.deque(c for c in cstrs if not prereqs[c.name])
+        while ready:
+            cstr = ready.popleft()
+            plan.append(cstr)
+            for dependent in dependents[cstr.name]:
+                prereqs[dependent.name] -= 1
+                if not prereqs[dependent.name]:
+                    ready.append(dependent)
+
+        if len(plan) != len(cstrs):
+            cycle = sorted(c.name for c in cstrs if prereqs[c.name])
+            raise ConstraintError('Circular dependency among constraints: %s' %
+                                  ', '.join(cycle))
+        return plan
+
+    @staticmethod
+    def _stat_files(path):
+        """
+        Get paths, inodes, modification times and sizes of all files in a
+        directory.
+        """
+        stamps = []
+        for root, _, files in os.walk(path):
+            for fname in files:
+                fpath = os.path.join(root, fname)
+                stat = os.stat(fpath)
+                stamps.append((fpath, stat.st_ino, stat.st_mtime_ns,
+                               stat.st_size))
+        stamps.sort()
+        return stamps
+
+    @staticmethod
+    def _hash_files(stamps):
+        """
+        Get the digest of contents of files.
+        """
+        digest = hashlib.sha1()
+        for fpath, _, _, _ in stamps:
+            digest.update(fpath.encode('utf-8'))
+            with open(fpath, 'rb') as fp:
+                digest.update(fp.read())
+        return digest.hexdigest()
+
+    def _load_child(self, path):
+        """
+        Load child constraints from a directory. Parsed and planned
+        constraints are cached and reused until files in the directory are
+        modified or the directory is removed.
 
-        compare = expr.value
-        assert isinstance(compare, ast.Compare)
+        :param path: Directory to load constraint YAML file from.
+        :return: A list of constraints in the order to be applied.
+        """
+        entry = self.child_cache.get(path)
+        stamps = self._stat_files(path)
+        if entry is not None:
+            if entry['stamps'] == stamps:
+                return entry['constraints']
+            # Files are rebuilt or touched but not necessarily modified
+            digest = self._hash_files(stamps)
+            entry['stamps'] = stamps
+            if entry['digest'] == digest:
+                return entry['constraints']
+        else:
+            digest = self._hash_files(stamps)
+
+        cstrs = self._plan(self._load_constraints(path))
+        self._index_traces(cstrs)
+        self.child_cache[path] = {
+            'stamps': stamps,
+            'digest': digest,
+            'constraints': cstrs,
+        }
+        return cstrs
 
-        assert len(compare.ops) == 1
-        left = compare.left
-        if isinstance(left, ast.Name):
-            left = left.id
-        op = compare.ops[0].__class__.__name__
-        right = compare.comparators[0]
+    def _remove_children(self, paths):
+        """
+        Remove directories of child constraints generated for an item. Their
+        cached stamps are dropped, so that contents of directories rebuilt
+        later are always checked.
 
-        if isinstance(right, ast.Name):
-            right = right.id
+        :param paths: Directories of child constraints.
+        """
+        for path in paths:
+            entry = self.child_cache.get(path)
+            if entry is not None:
+                entry['stamps'] = None
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def _assumption_valid(self, constraint, status):
+        """
+        Check whether the assumption of a constraint is valid.
 
-        if left in self.status:
-            left = self.status[left]
+        :param constraint: The constraint whose assumption to be checked.
+        :param status: A dict of constraint status keyed by constraint name.
+        """
+        if constraint.depends_on is not None:
+            if not constraint.depends_on(status):
+                return False
+        if constraint.require is not None:
+            return constraint.require(status)
+        return True
+
+    def report(self, item):
+        """
+        Record the result of an item to the traces chosen for it.
 
-        if op == 'Is':
-            return left.lower() == right.lower()
-        else:
-            raise ConstraintError('Operator %s is not handled' % op)
+        :param item: The item constrained by this manager and run.
+        """
+        if not item.res:
+            return
+        for key in item.trace_keys:
+            t = self.traces.get(key)
+            if t is not None:
+                t.outcomes.add(item.res.exit_status)
 
     def constrain(self, item):
         """
@@ -90,27 +419,61 @@ class ConstraintManager(object):
         self.item = item
         self.status = {c.name: 'untouched'
                        for c in self.constraints}
-        cst_temp = self.constraints[:]
-        path_temp = None
-        while any(s == 'untouched' for s in self.status.values()):
-            while len(cst_temp) > 0:
-                if self._assumption_valid(cst_temp[0]):
-                    result = cst_temp[0].apply(item)
-                    if result == "success":
-                        if cst_temp[0].child is not None:
-                            path_temp = os.path.join(self.provider.path,
-                                                     'oracles',
-                                                     cst_temp[0].child)
-                            cst_temp += self._load_constraints(path_temp)
+        pending = collections.deque(self.plan)
+        children = set()
+        while pending:
+            cstr = pending.popleft()
+            if self._assumption_valid(cstr, self.status):
+                result = cstr.apply(item)
+                if result == "success" and cstr.child is not None:
+                    path_temp = os.path.join(self.provider.path, 'oracles',
+                                             cstr.child)
+                    children.add(path_temp)
+                    # Child constraints are planned after all pending ones
+                    pending.extend(self._load_child(path_temp))
+            else:
+                result = 'skipped'
+            self.status[cstr.name] = result
+        self._remove_children(children)
 
-                else:
-                    result = 'skipped'
+    def constrain_batch(self, items):
+        """
+        Apply constraints to a batch of items. Each constraint is applied to
+        all items satisfying its assumption at once, so that traces solve
+        items chosen them together.
 
-                self.status[cst_temp[0].name] = result
-                cst_temp.remove(cst_temp[0])
-            if path_temp is not None:
-                if os.path.isdir(path_temp):
-                    shutil.rmtree(path_temp)
+        :param items: A list of items for constraints to apply on.
+        """
+        statuses = [{c.name: 'untouched' for c in self.constraints}
+                    for _ in items]
+        pending = collections.deque((c, range(len(items))) for c in self.plan)
+        children = set()
+        while pending:
+            cstr, idxs = pending.popleft()
+            valid = []
+            for idx in idxs:
+                if self._assumption_valid(cstr, statuses[idx]):
+                    valid.append(idx)
+                else:
+                    statuses[idx][cstr.name] = 'skipped'
+
+            results = cstr.apply_batch([items[idx] for idx in valid])
+            succeeded = []
+            for idx, result in zip(valid, results):
+                statuses[idx][cstr.name] = result
+                if result == 'success':
+                    succeeded.append(idx)
+
+            if succeeded and cstr.child is not None:
+                path_temp = os.path.join(self.provider.path, 'oracles',
+                                         cstr.child)
+                children.add(path_temp)
+                pending.extend((c, succeeded)
+                               for c in self._load_child(path_temp))
+        self._remove_children(children)
+        if items:
+            self.item = items[-1]
+            self.status = statuses[-1]
 
 
 class Constraint(object):
@@ -124,21 +487,30 @@ class Constraint(object):
                  fail_ratio=0.1, alpha=20, beta=1.8):
         """
         :param name: Unique string name of the constraint.
-        :param depends_on: A logical expression shows prerequisite to apply
-                           this constraint.
+        :param depends_on: A logical expression or a list of constraint
+                           names shows prerequisite to apply this constraint.
         :param require: Logical expression shows the limit of this constraint.
+                        Both expressions are compiled into Condition.
         :param oracle: A block of code shows the details of this constraint.
         """
         self.name = name
         self.provider = provider
-        self.depends_on = depends_on
-        self.require = require
+        self.depends_on = None
+        if depends_on is not None:
+            self.depends_on = Condition(depends_on)
+        self.require = None
+        if require is not None:
+            self.require = Condition(require)
         self.child = child
         self.oracle = oracle
         self.fail_ratio = fail_ratio
         self.alpha = alpha
         self.beta = beta
         self.traces = self._oracle2traces(oracle)
+        for idx, t in enumerate(self.traces):
+            t.key = '%s:%s' % (name, idx)
+        self.passes = [t for t in self.traces if t.result == 'success']
+        self.fails = [t for t in self.traces if t.result == 'fail']
 
     @classmethod
     def from_dict(cls, provider, data):
@@ -272,33 +644,62 @@ class Constraint(object):
                         'Unknown node type: %s' % v.__class__.__name__)
         return traces
 
-    def _choose(self, fail_ratio=None):
-        fails = []
-        passes = []
+    @staticmethod
+    def _balance(traces, rng):
+        """
+        Choose a trace, preferring those run fewer times or have led to fewer
+        distinct outcomes, so that rare branches are covered sooner.
+        """
+        if len(traces) == 1:
+            return traces[0]
+        weights = [1.0 / ((1 + t.runs) * (1 + len(t.outcomes)))
+                   for t in traces]
+        return rng.choices(traces, weights)[0]
 
-        for t in self.traces:
-            if t.result == 'success':
-                passes.append(t)
-            elif t.result == 'fail':
-                fails.append(t)
+    def _choose(self, fail_ratio=None, rng=None, key=None):
+        """
+        Choose a trace to solve an item.
 
+        :param rng: The random generator to draw from. None for the global
+                    one of the random module.
+        :param key: Key of the trace to be chosen instead, when an item is
+                    regenerated. The same random numbers are drawn, so that
+                    the rest of the item follows.
+        """
         if fail_ratio is None:
             fail_ratio = self.fail_ratio
+        if rng is None:
+            rng = random
 
-        if not fails and not passes:
+        if not self.fails and not self.passes:
             raise ConstraintError(
                 "Need return function fail() or success() in oracle '%s'" %
                 self.name)
 
-        if not fails:
-            return random.choice(passes)
-        if not passes:
-            return random.choice(fails)
-
-        if random.random() < fail_ratio:
-            return random.choice(fails)
+        if not self.fails:
+            traces = self.passes
+        elif not self.passes:
+            traces = self.fails
+        elif rng.random() < fail_ratio:
+            traces = self.fails
         else:
-            return random.choice(passes)
+            traces = self.passes
+
+        t = self._balance(traces, rng)
+        if key is not None and key != t.key:
+            t = self.traces[int(key.rsplit(':', 1)[1])]
+        t.runs += 1
+        return t
+
+    def _choose_for(self, item):
+        """
+        Choose a trace for an item with its random generator, or the trace
+        chosen before if the item is regenerated.
+        """
+        key = None
+        if item.replay_keys is not None:
+            key = item.replay_keys.get(self.name)
+        return self._choose(rng=item.rng, key=key)
 
     def apply(self, item):
         """
@@ -307,23 +708,48 @@ class Constraint(object):
         :param item: The item to be applied on.
         :return: Expected result of constraint item.
         """
-        def _name2path(name):
-            if not name.startswith(self.path_prefix):
-                return name
-            return name[len(self.path_prefix):].replace('_', '/')
+        t = self._choose_for(item)
+        item.trace_keys.append(t.key)
+        self._set_solution(item, t, t.solve(item, self.alpha, self.beta))
+        return t.result
 
-        t = self._choose()
-        sols = t.solve(item, self.alpha, self.beta)
+    def apply_batch(self, items):
+        """
+        Apply this constraint to a batch of items. Items choosing the same
+        trace are solved together.
+
+        :param items: A list of items to be applied on.
+        :return: A list of expected results of items.
+        """
+        groups = collections.OrderedDict()
+        chosen = []
+        for item in items:
+            t = self._choose_for(item)
+            item.trace_keys.append(t.key)
+            groups.setdefault(t.key, (t, []))[1].append(item)
+            chosen.append(t)
+
+        for t, group in groups.values():
+            sols = t.solve_batch(group, self.alpha, self.beta)
+            for item, sol in zip(group, sols):
+                self._set_solution(item, t, sol)
+        return [t.result for t in chosen]
+
+    def _set_solution(self, item, t, sols):
         for name, sol in sols.items():
-            item.set(_name2path(name), sol)
+            item.set(self._name2path(name), sol)
 
         patts = t.result_patts
         if patts is not None:
             if isinstance(patts, list):
-                item.fail_patts |= patts
+                item.fail_patts.update(patts)
             else:
                 item.fail_patts.add(patts)
-        return t.result
+
+    def _name2path(self, name):
+        if not name.startswith(self.path_prefix):
+            return name
+        return name[len(self.path_prefix):].replace('_', '/')
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, self.name)
@@ -1,3 +1,10 @@
+import hashlib
+import sys
+
+from .. import utils
+from ..utils import inproc
+
+
 class ItemError(Exception):
     """
     Class for Item specific exceptions.
@@ -9,18 +16,72 @@ class ItemBase(object):
     """
     Base class for an item. This should be overridden in the providers item.py.
     """
+    # An object whose run() is called instead of utils.run() to run the
+    # command, like dice.utils.forksrv.launcher.
+    launcher = None
+
     def __init__(self, provider):
         self.provider = provider
         self.res = ''
         self.fail_patts = set()
+        self.trace_keys = []
+        self.timeout = 10
+        self.gen_time = 0.0
+        # Whether duplicated items were dropped when generating this one,
+        # and the number of them dropped before
+        self.deduped = False
+        self.duplicates = 0
+        # Seed of the random generator the options are drawn from, with
+        # which the item can be regenerated by Provider.regenerate()
+        self.seed = None
+        self.rng = None
+        # Trace keys chosen before keyed by constraint name when the item
+        # is regenerated
+        self.replay_keys = None
+        self._option_paths = set()
 
-    def run(self):
+    def command(self):
         """
-        Run the item. Must be overridden in the providers.
+        Get the command line to run the item. Either this or run() must be
+        overridden in the providers.
+
+        :return: A command line string run by the shell, or a list of
+                 arguments run directly.
         """
-        raise NotImplementedError("run() not implemented for class '%s'" %
+        raise NotImplementedError("command() not implemented for class '%s'" %
                                   self.__class__.__name__)
 
+    def run(self):
+        """
+        Run the item. By default the command line returned by command() is
+        run, with the launcher if it's set.
+        """
+        if self.launcher is not None:
+            self.res = self.launcher.run(self.command(), timeout=self.timeout)
+        else:
+            self.res = utils.run(self.command(), timeout=self.timeout)
+
+    def call(self, func, args=(), kwargs=None, timeout=None):
+        """
+        Run the item by calling a Python callable in a pool of long-lived
+        worker processes instead of running a command.
+
+        :param func: The callable or its name like 'module.function' in the
+                     provider's utils package.
+        :param args: Positional arguments of the call.
+        :param kwargs: Keyword arguments of the call.
+        :param timeout: After which the worker process is killed. Default to
+                        the timeout of the item.
+        """
+        if not callable(func):
+            mod_name, func_name = func.rsplit('.', 1)
+            mod = sys.modules['_'.join([self.provider.name, 'utils']) + '.' +
+                              mod_name]
+            func = getattr(mod, func_name)
+        if timeout is None:
+            timeout = self.timeout
+        self.res = inproc.call(func, args, kwargs, timeout)
+
     def set(self, path, value):
         """
         Set value for specific item option.
@@ -28,6 +89,7 @@ class ItemBase(object):
         :param path: An XPath-like string for the setting target.
         :param value: Option value to be set.
         """
+        self._option_paths.add(path)
         setattr(self, path, value)
 
     def get(self, path):
@@ -39,5 +101,65 @@ class ItemBase(object):
         """
         return getattr(self, path, None)
 
+    def fingerprint(self):
+        """
+        Get a canonical digest of the options of the item, which is equal for
+        items would run the same test.
+
+        :return: The digest bytes, or None if no option is set by set().
+        """
+        if not self._option_paths:
+            return None
+        options = [(path, self.get(path))
+                   for path in sorted(self._option_paths)]
+        digest = hashlib.sha1(self.provider.name.encode('utf-8'))
+        digest.update(repr(options).encode('utf-8'))
+        return digest.digest()
+
+    def serialize(self):
+        """
+        Serialize the item result to a JSON-compatible dictionary.
+
+        :return: The serialized dictionary.
+        """
+        data = {
+            'provider': self.provider.name,
+            'fail_patts': sorted(self.fail_patts),
+            'trace_keys': self.trace_keys,
+            'gen_time': self.gen_time,
+            'deduped': self.deduped,
+            'duplicates': self.duplicates,
+            'seed': self.seed,
+            'res': None,
+        }
+        if self.res:
+            data['res'] = {
+                'cmdline': self.res.cmdline,
+                'stdout': self.res.stdout,
+                'stderr': self.res.stderr,
+                'exit_code': self.res.exit_code,
+                'exit_status': self.res.exit_status,
+                'call_time': self.res.call_time,
+            }
+        return data
+
+    @classmethod
+    def from_dict(cls, provider, data):
+        """
+        Rebuild an item with its result from a serialized dictionary.
+        """
+        item = cls(provider=provider)
+        item.fail_patts = set(data['fail_patts'])
+        item.trace_keys = data['trace_keys']
+        item.gen_time = data['gen_time']
+        item.deduped = data.get('deduped', False)
+        item.duplicates = data.get('duplicates', 0)
+        item.seed = data.get('seed')
+        if data['res'] is not None:
+            item.res = utils.CmdResult(data['res']['cmdline'])
+            for key, value in data['res'].items():
+                setattr(item.res, key, value)
+        return item
+
     def save(self, path="./saved_item.txt"):
         pass  # TODO
@@ -1,14 +1,20 @@
 import fnmatch
-import imp
-import importlib
+import importlib.util
 import inspect
+import itertools
 import logging
 import os
+import random
+import sys
+import time
 
 from . import constraint
+from . import timing
 
 logger = logging.getLogger('dice')
 
+_providers = {}
+
 
 class ProviderError(Exception):
     """
@@ -17,10 +23,27 @@ class ProviderError(Exception):
     pass
 
 
+def lookup(name):
+    """
+    Get a loaded provider by its name.
+
+    :param name: Name of the provider.
+    :return: The provider loaded in current process.
+    """
+    try:
+        return _providers[name]
+    except KeyError:
+        raise ProviderError("Provider %s is not loaded." % name) from None
+
+
 class Provider(object):
     """
     Class for a dice test provider.
     """
+    # Maximum duplicated items dropped in a row, after which a duplicated
+    # item is returned in case all options are exhausted
+    max_duplicates = 100
+
     def __init__(self, path):
         """
         :param path: Path of the directory this provider locates.
@@ -30,6 +53,7 @@ class Provider(object):
 
         self.name = os.path.basename(os.path.abspath(os.path.normpath(path)))
         self.path = path
+        _providers[self.name] = self
 
         self.modules = {}
 
@@ -55,8 +79,12 @@ class Provider(object):
                 mod_name = ''
             ns_list = [ns for ns in [root_ns, mod_name] if ns]
             mod_ns = '.'.join(ns_list)
-            imp.load_source(mod_ns, os.path.join(root, file_name))
-            self.modules[mod_ns] = importlib.import_module(mod_ns)
+            spec = importlib.util.spec_from_file_location(
+                mod_ns, os.path.join(root, file_name))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[mod_ns] = module
+            spec.loader.exec_module(module)
+            self.modules[mod_ns] = module
 
         try:
             os.remove(init_path)
@@ -79,13 +107,147 @@ class Provider(object):
 
         self.Item = self.modules['%s.item' % root_ns].Item
         self.constraint_manager = constraint.ConstraintManager(self)
+        self.timeouts = timing.TimeoutEstimator()
+        # A filter like dice.utils.bloom.BloomFilter to drop duplicated
+        # items, None to disable
+        self.dedup = None
+        self.set_seed(None)
+
+    def __reduce__(self):
+        # Loaded modules can't be pickled. Pickle a provider by name and
+        # resolve it to the provider loaded in the unpickling process.
+        return (lookup, (self.name,))
+
+    def set_seed(self, seed, stream=0, streams=1):
+        """
+        Seed items generated afterwards. Each item gets a random generator
+        seeded with '(seed << 64) | counter', from which all its options are
+        drawn, so that it can be regenerated from the item seed alone.
+
+        :param seed: The campaign seed, a non-negative integer less than
+                     2 ** 64. None to draw options from the global random
+                     generator, which is faster.
+        :param stream: Index of current stream among streams generating
+                       items with the same campaign seed, like worker
+                       machines of a coordinator. Each stream uses a
+                       distinct share of the counters.
+        :param streams: Number of streams.
+        """
+        if seed is not None and not 0 <= seed < 2 ** 64:
+            raise ProviderError('Seed should be between 0 and 2 ** 64 - 1')
+        if not 0 <= stream < streams:
+            raise ProviderError('Stream should be between 0 and %s' %
+                                (streams - 1))
+        self.seed = seed
+        self.stream = stream
+        self.streams = streams
+        self.counters = itertools.count(stream, streams)
+
+    def split_seeds(self, index, count):
+        """
+        Split the share of counters of current stream among processes
+        forked from current process, which share its counters otherwise.
+
+        :param index: Index of current process among the forked processes.
+        :param count: Number of the forked processes.
+        """
+        self.set_seed(self.seed, self.stream + self.streams * index,
+                      self.streams * count)
+
+    def _new_item(self, seed=None):
+        item = self.Item(provider=self)
+        if seed is None and self.seed is not None:
+            seed = (self.seed << 64) | next(self.counters)
+        if seed is not None:
+            item.seed = seed
+            item.rng = random.Random(seed)
+        return item
+
+    @staticmethod
+    def _finish(item, gen_time):
+        # The random generator is only needed while generating
+        item.rng = None
+        item.replay_keys = None
+        item.gen_time = gen_time
 
     def generate(self):
         """
-        Generate a new constrained test item.
+        Generate a new constrained test item. If dedup is set, items with the
+        same options as generated before are dropped and generated again, up
+        to max_duplicates times.
 
         :return: Constrained item.
         """
-        item = self.Item(provider=self)
+        start = time.monotonic()
+        duplicates = 0
+        while True:
+            item = self._new_item()
+            self.constraint_manager.constrain(item)
+            if self.dedup is None or duplicates >= self.max_duplicates:
+                break
+            fingerprint = item.fingerprint()
+            if fingerprint is None or not self.dedup.add(fingerprint):
+                break
+            duplicates += 1
+        item.deduped = self.dedup is not None
+        item.duplicates = duplicates
+        item.timeout = self.timeouts.timeout(item.trace_keys)
+        self._finish(item, time.monotonic() - start)
+        return item
+
+    def generate_batch(self, size):
+        """
+        Generate a batch of new constrained test items, which is faster than
+        generating them one by one. Duplicated items are replaced by ones
+        from generate() if dedup is set.
+
+        :param size: Number of items to generate.
+        :return: A list of constrained items.
+        """
+        start = time.monotonic()
+        items = [self._new_item() for _ in range(size)]
+        self.constraint_manager.constrain_batch(items)
+        gen_time = (time.monotonic() - start) / max(size, 1)
+
+        for idx, item in enumerate(items):
+            if self.dedup is not None:
+                fingerprint = item.fingerprint()
+                if fingerprint is not None and self.dedup.add(fingerprint):
+                    items[idx] = item = self.generate()
+                    item.duplicates += 1
+                    continue
+                item.deduped = True
+            item.timeout = self.timeouts.timeout(item.trace_keys)
+            self._finish(item, gen_time)
+        return items
+
+    def regenerate(self, seed, trace_keys=None):
+        """
+        Regenerate an item from its seed, which has the same options as the
+        item generated before with the same oracles and helpers.
+
+        :param seed: The seed of the item.
+        :param trace_keys: Trace keys of the item. Since traces are chosen
+                           by their past results, the same traces are chosen
+                           only if they are given.
+        :return: The regenerated item.
+        """
+        start = time.monotonic()
+        item = self._new_item(seed)
+        if trace_keys is not None:
+            item.replay_keys = dict((key.rsplit(':', 1)[0], key)
+                                    for key in trace_keys)
         self.constraint_manager.constrain(item)
+        item.timeout = self.timeouts.timeout(item.trace_keys)
+        self._finish(item, time.monotonic() - start)
         return item
+
+    def report(self, item):
+        """
+        Learn from the result of an item run in current process.
+
+        :param item: The item generated by this provider and run.
+        """
+        if item.res:
+            self.timeouts.record(item.trace_keys, item.res)
+        self.constraint_manager.report(item)
@@ -1,13 +1,32 @@
-import os
+import functools
+import inspect
+import math
 import random
 import string
 
+from ..utils import entropy
+
+_PRINTABLE = string.printable.encode('ascii')
+
+
+class SymbolError(Exception):
+    """
+    Class for symbol specific exceptions.
+    """
+    pass
+
 
 class SymbolBase(object):
     """
     Base class for a symbol object represent a catalog of data to be
     randomized.
     """
+    # Maximum values drawn in a row before giving up finding one which is
+    # not excluded
+    max_retries = 100
+    # Maximum size of scope filtered by exclusions at once. Larger scopes
+    # are sampled with retries first.
+    max_domain = 1024
 
     def __init__(self, scope=None, excs=None, exc_types=None):
         """
@@ -19,66 +38,202 @@ class SymbolBase(object):
         self.excs = excs
         self.exc_types = exc_types
 
-    def generate(self, alpha=20, beta=1.8):
+    def generate(self, alpha=20, beta=1.8, rng=random):
         """
         Generate a random instance of this symbol without considering scope,
         excs or exc_types. Must be overridden.
+
+        :param rng: The random generator to draw from, like a seeded
+                    random.Random instance.
         """
         raise NotImplementedError("Method 'generate' not implemented for %s" %
                                   self.__class__.__name__)
 
-    def model(self, alpha=20, beta=1.8):
+    @classmethod
+    def accepts(cls, value):  # pylint: disable=unused-argument
+        """
+        Whether a value could be an instance of this symbol, which excludes
+        the value from symbols with this class in exc_types.
+        """
+        return False
+
+    def _exclusions(self):
+        """
+        Split the values in excs into a set of the hashable ones and a list
+        of the unhashable ones, which are compared by equality.
+        """
+        excs = set()
+        others = []
+        for exc in self.excs or []:
+            try:
+                excs.add(exc)
+            except TypeError:
+                others.append(exc)
+        return excs, others
+
+    def _exc_classes(self):
+        classes = []
+        for name in self.exc_types or []:
+            cls = globals().get(name)
+            if not (inspect.isclass(cls) and issubclass(cls, SymbolBase)):
+                raise SymbolError('Unknown symbol type %s in exc_types' %
+                                  name)
+            classes.append(cls)
+        return classes
+
+    def _excluder(self):
+        """
+        Precompute a function telling whether a value is excluded by excs
+        or exc_types, None if nothing is excluded.
+        """
+        excs, others = self._exclusions()
+        classes = self._exc_classes()
+        if not (excs or others or classes):
+            return None
+
+        def _excluded(value):
+            try:
+                if value in excs:
+                    return True
+            except TypeError:
+                # Unhashable values like lists in scope can only equal
+                # other values in excs
+                pass
+            if others and value in others:
+                return True
+            return any(cls.accepts(value) for cls in classes)
+        return _excluded
+
+    def _retry(self, draw, excluded):
+        """
+        Draw values until one is not excluded, up to max_retries times.
+        """
+        if excluded is None:
+            return draw()
+        for _ in range(self.max_retries):
+            res = draw()
+            if not excluded(res):
+                return res
+        raise SymbolError('Failed to generate %s not excluded by %s excs '
+                          'and exc_types %s after %s tries' %
+                          (self.__class__.__name__, len(self.excs or []),
+                           self.exc_types, self.max_retries))
+
+    def _sample_scope(self, count, excluded, rng):
+        scope = self.scope
+        domain = scope
+        if excluded is not None:
+            if len(scope) > self.max_domain:
+                # Filtering a large scope costs more than a few retries,
+                # which are enough unless most of the scope is excluded
+                try:
+                    return [self._retry(functools.partial(rng.choice, scope),
+                                        excluded) for _ in range(count)]
+                except SymbolError:
+                    pass
+            domain = [value for value in scope if not excluded(value)]
+        if not domain:
+            raise SymbolError('Unsatisfiable %s. All %s values in scope are '
+                              'excluded by %s excs and exc_types %s' %
+                              (self.__class__.__name__, len(scope),
+                               len(self.excs or []), self.exc_types))
+        return [rng.choice(domain) for _ in range(count)]
+
+    def model(self, alpha=20, beta=1.8, rng=None):
         """
         Generate a random instance of this symbol.
+
+        :param rng: The random generator to draw from. None for the global
+                    one of the random module.
         """
-        if self.scope is None:
-            res = self.generate()
-            if self.excs is not None:
-                while res in self.excs:
-                    res = self.generate(alpha, beta)
-            return res
-        else:
-            res = random.choice(self.scope)
-            if self.excs is not None:
-                while res in self.excs:
-                    res = random.choice(self.scope)
-            return res
+        return self.model_batch(1, alpha, beta, rng)[0]
+
+    def model_batch(self, count, alpha=20, beta=1.8, rng=None):
+        """
+        Generate a list of random instances of this symbol. The values
+        allowed by scope, excs and exc_types are precomputed once and
+        sampled directly if possible.
+
+        :param count: Number of instances to generate.
+        """
+        if rng is None:
+            rng = random
+        excluded = self._excluder()
+        if self.scope is not None:
+            return self._sample_scope(count, excluded, rng)
+        draw = functools.partial(self.generate, alpha, beta, rng)
+        return [self._retry(draw, excluded) for _ in range(count)]
+
+
+def _entropy(rng):
+    """
+    Get the entropy pool of random bytes following a random generator.
+    """
+    if rng is random:
+        return entropy.pool
+    return entropy.from_rng(rng)
 
 
 class Bytes(SymbolBase):
     """
     Symbol class for a string contains random bytes (1~255).
     """
-    def generate(self, alpha=20, beta=1.8):
+    @classmethod
+    def accepts(cls, value):
+        return isinstance(value, (bytes, str))
+
+    def _exclusions(self):
+        excs, others = super(Bytes, self)._exclusions()
+        # String literals in oracles also exclude their encoded bytes
+        excs.update([exc.encode('utf-8') for exc in excs
+                     if isinstance(exc, str)])
+        return excs, others
+
+    def generate(self, alpha=20, beta=1.8, rng=random):
         """
         Generate a random bytes string.
         """
-        cnt = int(random.weibullvariate(alpha, beta))
-        return ''.join(bt for bt in os.urandom(cnt) if bt != b'\x00')
+        cnt = int(rng.weibullvariate(alpha, beta))
+        return _entropy(rng).nonzero_bytes(cnt)
 
 
 class NonEmptyBytes(Bytes):
     """
     Symbol class for a random byte(1-255) string except empty string.
     """
-    def generate(self, alpha=20, beta=1.8):
+    @classmethod
+    def accepts(cls, value):
+        return isinstance(value, (bytes, str)) and len(value) > 0
+
+    def generate(self, alpha=20, beta=1.8, rng=random):
         """
         Generate a random non-empty bytes string.
         """
-        cnt = int(random.weibullvariate(alpha, beta)) + 1
-        return ''.join(bt for bt in os.urandom(cnt) if bt != b'\x00')
+        cnt = int(rng.weibullvariate(alpha, beta)) + 1
+        pool = _entropy(rng)
+        res = pool.nonzero_bytes(cnt)
+        while not res:
+            res = pool.nonzero_bytes(cnt)
+        return res
 
 
 class String(Bytes):
     """
     Symbol class for a random printable string.
     """
-    def generate(self, alpha=20, beta=1.8):
+    @classmethod
+    def accepts(cls, value):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        return (isinstance(value, bytes) and
+                not value.translate(None, _PRINTABLE))
+
+    def generate(self, alpha=20, beta=1.8, rng=random):
         """
         Generate a random printable string.
         """
-        cnt = int(random.weibullvariate(alpha, beta))
-        return ''.join(random.choice(string.printable) for _ in range(cnt))
+        cnt = int(rng.weibullvariate(alpha, beta))
+        return _entropy(rng).printable(cnt)
 
 
 class StringList(SymbolBase):
@@ -94,50 +249,97 @@ class StringList(SymbolBase):
         super(StringList, self).__init__()
         self.scopes = []
 
-    def generate(self, alpha=20, beta=1.8):
+    def generate(self, alpha=20, beta=1.8, rng=random):
         """
         Generate a random printable strings.
         """
-        cnt = int(random.weibullvariate(alpha, beta))
-        return ''.join(random.choice(string.printable) for _ in range(cnt))
+        cnt = int(rng.weibullvariate(alpha, beta))
+        return ''.join(rng.choice(string.printable) for _ in range(cnt))
 
-    def model(self, alpha=3, beta=1.8):
+    def model(self, alpha=3, beta=1.8, rng=None):
         """
         Generate a random-numbered list contains random printable strings.
         """
-        cnt = int(random.weibullvariate(alpha, beta))
+        if rng is None:
+            rng = random
+        cnt = int(rng.weibullvariate(alpha, beta))
         res = set()
         for _ in range(cnt):
             entry = None
             if self.scopes:
                 for scope, _, _ in self.scopes:
                     if scope:
-                        entry = random.choice(scope)
+                        entry = rng.choice(scope)
             else:
-                entry = self.generate()
+                entry = self.generate(rng=rng)
             if entry:
                 res.add(entry)
         return list(res)
 
+    def model_batch(self, count, alpha=3, beta=1.8, rng=None):
+        """
+        Generate a list of random string lists. Each list is modeled on its
+        own from the scopes, which the sampling of SymbolBase doesn't know.
+        """
+        return [self.model(alpha, beta, rng) for _ in range(count)]
+
+
+def _survival(mag, alpha, beta):
+    """
+    Probability that the magnitude '2 ** weibull(alpha, beta) - 1' is not
+    less than a number.
+    """
+    return math.exp(-(math.log(mag + 1, 2) / alpha) ** beta)
+
+
+def _sample_magnitude(low, high, s_low, s_high, alpha, beta, rng=random):
+    """
+    Sample an integer magnitude in [low, high] by inverting the distribution
+    of '2 ** weibull(alpha, beta) - 1'.
+
+    :param low: Minimum magnitude, not less than 0.
+    :param high: Maximum magnitude. None for unbounded.
+    :param s_low: Survival probability of low.
+    :param s_high: Survival probability of high + 1, 0 if unbounded.
+    :param rng: The random generator to draw from.
+    """
+    if s_low > s_high:
+        # Uniformly choose a survival probability in (s_high, s_low]
+        surv = s_low - rng.random() * (s_low - s_high)
+        weibull = alpha * (-math.log(surv)) ** (1.0 / beta)
+        try:
+            mag = int(2.0 ** weibull - 1.0)
+        except OverflowError:
+            mag = None
+        if mag is not None:
+            mag = max(mag, low)
+            if high is not None:
+                mag = min(mag, high)
+            return mag
+
+    # The range is too far in the tail to be distinguished by floats
+    if high is None:
+        return low
+    return rng.randint(low, high)
+
 
 class Integer(SymbolBase):
     """
     Symbol class for a random integer.
     """
+    # Probability to choose a bound of allowed intervals directly
+    boundary_ratio = 0.05
+
     def __init__(self, scope=None, excs=None, exc_types=None):
         """
         :param scope: A list limits the scope of generated results.
         :param excs: A list won't exist in generated results.
         :param exc_types: A list of types won't exist in generated results.
         """
-        super(Integer, self).__init__(scope)
+        super(Integer, self).__init__(scope, excs, exc_types)
         self.maximum = None
         self.minimum = None
 
-        self.exc_types = []
-        if exc_types is not None:
-            self.exc_types = exc_types
-
     def __repr__(self):
         maximum, minimum = self.maximum, self.minimum
         if self.maximum is None:
@@ -146,23 +348,124 @@ class Integer(SymbolBase):
             minimum = '-Inf'
         return '<%s %s~%s>' % (self.__class__.__name__, minimum, maximum)
 
-    def generate(self, alpha=30, beta=1.1):
-        """
-        Generate a random integer.
-        """
-        maximum = self.maximum
-        minimum = self.minimum
-        while True:
-            sign = 1.0 if random.random() > 0.5 else -1.0
-            res = sign * (2.0 ** (random.weibullvariate(alpha, beta)) - 1.0)
-            if maximum is not None:
-                if maximum >= 0 and res > maximum + 1:
-                    continue
-                if maximum < 0 and res > maximum:
-                    continue
-            if minimum is not None:
-                if minimum >= 0 and res < minimum:
-                    continue
-                if minimum < 0 and res < minimum - 1:
-                    continue
-            return int(res)
+    def intervals(self):
+        """
+        Get the allowed values as sorted disjoint intervals, which are within
+        minimum and maximum and split by integers in excs.
+
+        :return: A list of (low, high) tuples. Unbounded ends are None.
+        """
+        low, high = self.minimum, self.maximum
+        if low is not None and high is not None and low > high:
+            return []
+
+        excs = set()
+        for exc in self.excs or []:
+            if not isinstance(exc, int):
+                continue
+            if low is not None and exc < low:
+                continue
+            if high is not None and exc > high:
+                continue
+            excs.add(exc)
+
+        intervals = []
+        for exc in sorted(excs):
+            if low is None or exc > low:
+                intervals.append((low, exc - 1))
+            low = exc + 1
+        if low is None or high is None or low <= high:
+            intervals.append((low, high))
+        return intervals
+
+    def _domain(self, alpha, beta):
+        """
+        Precompute the finite bounds and magnitude ranges of both signs of
+        allowed integers, with cumulative probability masses of the ranges.
+        """
+        intervals = self.intervals()
+        if not intervals:
+            raise SymbolError('No integer satisfies %r with excs %s' %
+                              (self, self.excs))
+
+        bounds = [b for interval in intervals for b in interval
+                  if b is not None]
+
+        # Split intervals into magnitude ranges of both signs like
+        # int(sign * magnitude), in which 0 is shared by both signs.
+        pieces = []
+        for low, high in intervals:
+            if high is None or high >= 0:
+                mag_low = 0 if low is None else max(low, 0)
+                pieces.append((1, mag_low, high))
+            if low is None or low <= 0:
+                mag_low = 0 if high is None else max(-high, 0)
+                pieces.append((-1, mag_low, None if low is None else -low))
+
+        ranges = []
+        cum_weights = []
+        total = 0.0
+        for sign, mag_low, mag_high in pieces:
+            s_low = _survival(mag_low, alpha, beta)
+            s_high = 0.0
+            if mag_high is not None:
+                s_high = _survival(mag_high + 1, alpha, beta)
+            ranges.append((sign, mag_low, mag_high, s_low, s_high))
+            total += s_low - s_high
+            cum_weights.append(total)
+        if total <= 0:
+            cum_weights = None
+        return bounds, ranges, cum_weights
+
+    def _draw(self, domain, alpha, beta, rng):
+        bounds, ranges, cum_weights = domain
+        if bounds and rng.random() < self.boundary_ratio:
+            return rng.choice(bounds)
+
+        if cum_weights is None:
+            sign, mag_low, mag_high, s_low, s_high = rng.choice(ranges)
+        else:
+            sign, mag_low, mag_high, s_low, s_high = rng.choices(
+                ranges, cum_weights=cum_weights)[0]
+        return sign * _sample_magnitude(mag_low, mag_high, s_low, s_high,
+                                        alpha, beta, rng)
+
+    def generate(self, alpha=30, beta=1.1, rng=random):
+        """
+        Generate a random integer. The magnitude follows
+        '2 ** weibull(alpha, beta) - 1' restricted to the allowed intervals,
+        which is sampled directly instead of being rejected until allowed.
+        """
+        return self._draw(self._domain(alpha, beta), alpha, beta, rng)
+
+    @classmethod
+    def accepts(cls, value):
+        if isinstance(value, bool):
+            return False
+        if isinstance(value, int):
+            return True
+        if isinstance(value, (bytes, str)):
+            try:
+                int(value)
+            except ValueError:
+                return False
+            return True
+        return False
+
+    def model_batch(self, count, alpha=20, beta=1.8, rng=None):
+        """
+        Generate a list of random integers, sharing the precomputed domain.
+        """
+        if self.scope is not None:
+            return super(Integer, self).model_batch(count, alpha, beta, rng)
+        if rng is None:
+            rng = random
+        # Integers are generated with default parameters of generate().
+        # Integer excs are excluded by the domain already, so retries are
+        # only for exc_types.
+        domain = self._domain(30, 1.1)
+        draw = functools.partial(self._draw, domain, 30, 1.1, rng)
+        if not self.exc_types:
+            return [draw() for _ in range(count)]
+        excluded = self._excluder()
+        return [self._retry(draw, excluded) for _ in range(count)]
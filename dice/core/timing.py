@@ -0,0 +1,125 @@
+import collections
+
+
+class LatencyStats(object):
+    """
+    Running statistics of latencies over a window of recent samples.
+    """
+
+    def __init__(self, size=1000):
+        """
+        :param size: Maximum number of recent samples kept.
+        """
+        self.samples = collections.deque([], size)
+        self.count = 0
+        self.strikes = 0
+        self._sorted = []
+        self._unsorted = 0
+
+    def add(self, latency):
+        """
+        Add a latency sample.
+
+        :param latency: Latency in seconds.
+        """
+        self.samples.append(latency)
+        self.count += 1
+        self._unsorted += 1
+
+    def quantile(self, q):
+        """
+        Get a quantile of the samples.
+
+        :param q: The quantile between 0 and 1.
+        :return: The latency at the quantile, None if there's no sample.
+        """
+        if not self.samples:
+            return None
+        # Sorting is amortized by only resorting after 5% samples changed
+        if self._unsorted > len(self._sorted) // 20:
+            self._sorted = sorted(self.samples)
+            self._unsorted = 0
+        idx = min(int(q * len(self._sorted)), len(self._sorted) - 1)
+        return self._sorted[idx]
+
+
+class TimeoutEstimator(object):
+    """
+    Estimate timeouts of items from latencies observed for the provider and
+    for each trace chosen by the items.
+
+    The timeout of an item is the largest quantile latency of its traces
+    multiplied by a factor, limited between the floor and the ceiling. Items
+    choosing a trace without enough samples get the ceiling, and items
+    without traces are estimated from the latencies of the provider. A
+    timed out run is a sample of its limit, which is less than its real
+    latency. Every consecutive timeout of a trace halves the ceiling for it.
+    """
+
+    def __init__(self, quantile=0.99, factor=5.0, floor=1.0, ceiling=10.0,
+                 min_samples=20):
+        """
+        :param quantile: Quantile of latencies to estimate timeout from.
+        :param factor: Multiplier applied to the quantile latency.
+        :param floor: Minimum timeout in seconds.
+        :param ceiling: Maximum timeout in seconds, also used before enough
+                        samples are observed.
+        :param min_samples: Number of samples needed to estimate from.
+        """
+        self.quantile = quantile
+        self.factor = factor
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+        self.overall = LatencyStats()
+        self.traces = {}
+
+    def _estimate(self, stats):
+        if stats.count < self.min_samples:
+            return None
+        return stats.quantile(self.quantile) * self.factor
+
+    def timeout(self, trace_keys):
+        """
+        Get the timeout of an item.
+
+        :param trace_keys: Keys of traces chosen by the item.
+        :return: Timeout in seconds.
+        """
+        estimates = []
+        ceiling = self.ceiling
+        for key in trace_keys:
+            stats = self.traces.get(key)
+            estimate = None
+            if stats is not None:
+                estimate = self._estimate(stats)
+                strikes = min(stats.strikes, 32)
+                ceiling = min(ceiling, self.ceiling / 2 ** strikes)
+            estimates.append(estimate)
+        if not trace_keys:
+            estimates.append(self._estimate(self.overall))
+
+        if None in estimates:
+            timeout = self.ceiling
+        else:
+            timeout = max(estimates)
+        return max(min(timeout, ceiling), self.floor)
+
+    def record(self, trace_keys, res):
+        """
+        Record the result of an item.
+
+        :param trace_keys: Keys of traces chosen by the item.
+        :param res: The CmdResult of the item.
+        """
+        timed_out = res.exit_status == 'timeout'
+        self.overall.add(res.call_time)
+        for key in trace_keys:
+            if key not in self.traces:
+                self.traces[key] = LatencyStats()
+            stats = self.traces[key]
+            if timed_out:
+                stats.strikes += 1
+            else:
+                stats.strikes = 0
+            stats.add(res.call_time)
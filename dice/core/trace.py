@@ -5,6 +5,7 @@ import logging
 import sys
 
 from . import symbol
+from ..utils import rnd
 
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,289 @@ class TraceError(Exception):
     pass
 
 
+def _symbol_classes():
+    """
+    Get all symbol classes keyed by class name.
+    """
+    classes = {}
+    for name in dir(symbol):
+        obj = getattr(symbol, name)
+        if inspect.isclass(obj) and issubclass(obj, symbol.SymbolBase):
+            classes[name] = obj
+    return classes
+
+
+_known_symbols = _symbol_classes()
+
+
+def _is_num(node):
+    """
+    Whether a node is a number literal.
+    """
+    if isinstance(node, ast.Constant):
+        return (isinstance(node.value, (int, float, complex)) and
+                not isinstance(node.value, bool))
+    # Literals are parsed as ast.Num and ast.Str before Python 3.8
+    return sys.version_info < (3, 8) and isinstance(node, ast.Num)
+
+
+def _is_str(node):
+    """
+    Whether a node is a string literal.
+    """
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, str)
+    return sys.version_info < (3, 8) and isinstance(node, ast.Str)
+
+
+def _literal_value(node):
+    """
+    Get the value of a number or string literal node.
+    """
+    if isinstance(node, ast.Constant):
+        return node.value
+    # Only ast.Num and ast.Str literals are left before Python 3.8
+    if isinstance(node, ast.Num):
+        return node.n
+    return node.s
+
+
+class _Call(object):
+    """
+    A prebound call to a function in provider utilities with options of the
+    item as arguments.
+    """
+
+    def __init__(self, provider, node):
+        if not (isinstance(node.func, ast.Attribute) and
+                isinstance(node.func.value, ast.Name)):
+            raise TraceError('Unknown function: %s' % ast.dump(node.func))
+        self.mod_name = '.'.join([provider.name + '_utils',
+                                  node.func.value.id])
+        self.func_name = node.func.attr
+        self.arg_names = []
+        for arg in node.args:
+            if isinstance(arg, ast.Name):
+                self.arg_names.append(arg.id)
+            else:
+                raise TraceError('Unknown argument type: %s' % arg)
+        self.func = None
+
+    def __call__(self, item):
+        if self.func is None:
+            # Resolve lazily since utilities may be loaded after constraints
+            self.func = getattr(sys.modules[self.mod_name], self.func_name)
+        return self.func(*[item.get(name) for name in self.arg_names])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['func'] = None
+        return state
+
+
+def _apply_eq(sym, value, call_ret):  # pylint: disable=unused-argument
+    if sym.scope and value not in sym.scope:
+        raise TraceError(
+            'Unsatisfiable condition. Need equal to "%s", '
+            'but scope is %s' % (value, sym.scope)
+        )
+    sym.scope = [value]
+
+
+def _apply_not_eq(sym, value, call_ret):  # pylint: disable=unused-argument
+    # Copy since excs may be a cached result of a helper function
+    sym.excs = list(sym.excs or []) + [value]
+
+
+def _apply_lt(sym, value, call_ret):  # pylint: disable=unused-argument
+    if sym.__class__ is symbol.Integer:
+        sym.maximum = value - 1
+
+
+def _apply_lte(sym, value, call_ret):  # pylint: disable=unused-argument
+    if sym.__class__ is symbol.Integer:
+        sym.maximum = value
+
+
+def _apply_gt(sym, value, call_ret):  # pylint: disable=unused-argument
+    if sym.__class__ is symbol.Integer:
+        sym.minimum = value + 1
+
+
+def _apply_gte(sym, value, call_ret):  # pylint: disable=unused-argument
+    if sym.__class__ is symbol.Integer:
+        sym.minimum = value
+
+
+def _apply_in(sym, value, call_ret):  # pylint: disable=unused-argument
+    sym.scope = call_ret
+
+
+def _apply_not_in(sym, value, call_ret):  # pylint: disable=unused-argument
+    sym.excs = call_ret
+
+
+_compare_ops = {
+    'Is': None,
+    'IsNot': None,
+    'Eq': _apply_eq,
+    'NotEq': _apply_not_eq,
+    'Lt': _apply_lt,
+    'LtE': _apply_lte,
+    'Gt': _apply_gt,
+    'GtE': _apply_gte,
+    'In': _apply_in,
+    'NotIn': _apply_not_in,
+}
+
+
+class _Compare(object):
+    """
+    A compiled comparison limiting a symbol, like 'a > 1' or 'a in f(b)'.
+    """
+
+    def __init__(self, provider, node):
+        if not (len(node.ops) == 1 and len(node.comparators) == 1 and
+                isinstance(node.left, ast.Name)):
+            raise TraceError('Unsupported comparison: %s' % ast.dump(node))
+
+        self.left = node.left.id
+        self.op = node.ops[0].__class__.__name__
+        if self.op not in _compare_ops:
+            raise TraceError('Unknown operator: %s' % self.op)
+        self.apply = _compare_ops[self.op]
+        comparator = node.comparators[0]
+
+        self.exc_types = []
+        self.right_value = None
+        self.sym_cls = None
+        self.call = None
+        if isinstance(comparator, ast.Name):
+            if comparator.id not in _known_symbols:
+                raise TraceError("Unknown symbol '%s'" % comparator.id)
+            if self.op == 'IsNot':
+                # Random bytes are almost always accepted by Bytes types
+                # other than String, so integers are used to exclude them.
+                exc_cls = _known_symbols[comparator.id]
+                if (issubclass(exc_cls, symbol.Bytes) and
+                        exc_cls is not symbol.String):
+                    self.sym_cls = symbol.Integer
+                else:
+                    self.sym_cls = symbol.Bytes
+                self.exc_types.append(comparator.id)
+            else:
+                self.sym_cls = _known_symbols[comparator.id]
+        elif _is_num(comparator):
+            self.sym_cls = symbol.Integer
+            self.right_value = _literal_value(comparator)
+        elif _is_str(comparator):
+            self.sym_cls = symbol.Bytes
+            self.right_value = _literal_value(comparator)
+        elif isinstance(comparator, ast.Call):
+            self.call = _Call(provider, comparator)
+        else:
+            raise TraceError('Unknown comparator type: %s' %
+                             comparator.__class__.__name__)
+
+    def __call__(self, item, symbols):
+        sym_cls = self.sym_cls
+        call_ret = None
+        if self.call is not None:
+            call_ret = self.call(item)
+
+            test_val = call_ret
+            if isinstance(call_ret, (list, tuple)):
+                test_val = call_ret[0]
+
+            if isinstance(test_val, builtins.str):
+                sym_cls = symbol.Bytes
+            elif isinstance(test_val, int):
+                sym_cls = symbol.Integer
+            else:
+                raise TraceError('Unknown type of function result: %s' %
+                                 type(test_val))
+
+        sym = symbols.get(self.left)
+        if sym is None:
+            sym = symbols[self.left] = sym_cls()
+        for name in self.exc_types:
+            if isinstance(sym, _known_symbols[name]):
+                raise TraceError('Unsatisfiable %s(operator: %s) of %s' %
+                                 (name, self.op, sym.__class__.__name__))
+        if self.exc_types:
+            sym.exc_types = list(sym.exc_types or []) + self.exc_types
+
+        if self.op != 'IsNot':
+            if not isinstance(sym, sym_cls):
+                raise TraceError(
+                    'Unmatched type %s(operator: %s). Should be %s' %
+                    (sym_cls.__name__, self.op, sym.__class__.__name__))
+
+        if self.apply is not None:
+            self.apply(sym, self.right_value, call_ret)
+
+
+class _Build(object):
+    """
+    A compiled 'build(f(a))' call run for its side effects.
+    """
+
+    def __init__(self, provider, node):
+        self.call = _Call(provider, node.args[0])
+
+    def __call__(self, item, symbols):
+        self.call(item)
+
+
+class _Quantify(object):
+    """
+    A compiled 'any(...)' or 'all(...)' comparison between a symbol and the
+    result of a function.
+    """
+
+    def __init__(self, provider, node):
+        self.func_name = node.func.id
+        if not (len(node.args) == 1 and
+                isinstance(node.args[0], ast.Compare)):
+            raise TraceError('Unsupported %s() argument' % self.func_name)
+        comp = node.args[0]
+        self.op = comp.ops[0].__class__.__name__
+        left = comp.left
+        right = comp.comparators[0]
+        if isinstance(left, ast.Name):
+            if not isinstance(right, ast.Call):
+                raise TraceError('Need a function call right of %s' %
+                                 self.op)
+            if self.op not in ['In', 'NotIn']:
+                raise TraceError('Unknown operator: %s' % self.op)
+            self.sym_name = left.id
+            self.call = _Call(provider, right)
+            self.scopes = {
+                ('all', 'In'): [(True, 0)],
+                ('all', 'NotIn'): [(False, 1)],
+                ('any', 'In'): [(True, 1), (False, 0)],
+                ('any', 'NotIn'): [(True, 0), (False, 1)],
+            }[(self.func_name, self.op)]
+            self.excludes = False
+        elif isinstance(left, ast.Call):
+            self.sym_name = right.id
+            self.call = _Call(provider, left)
+            self.scopes = []
+            self.excludes = self.func_name == 'all' and self.op == 'NotIn'
+        else:
+            raise TraceError('Unknown left type %s' % left)
+
+    def __call__(self, item, symbols):
+        sym = symbols[self.sym_name]
+        ret = self.call(item)
+        if self.scopes and not isinstance(ret, (list, tuple)):
+            raise TraceError('Function result should be a list or tuple')
+        for included, count in self.scopes:
+            sym.scopes.append((ret, included, count))
+        if self.excludes:
+            sym.excludes = ret
+
+
 class Trace(object):
     """
     Class represent a condition trace in constraint oracle code. It contains a
@@ -28,6 +312,10 @@ class Trace(object):
         :param trace_list: A list contains code of the trace.
         """
         self.item = None
+        self.key = None
+        # Times chosen and distinct exit status of items for balancing
+        self.runs = 0
+        self.outcomes = set()
         self.provider = provider
         self.symbols = {}
         self.trace = trace_list[:]
@@ -37,7 +325,8 @@ class Trace(object):
         args = ret.value.args
         self.result_patts = None
         if args:
-            self.result_patts = args[0].s
+            self.result_patts = _literal_value(args[0])
+        self.plan = self._compile()
 
     def __repr__(self):
         lines = []
@@ -51,158 +340,73 @@ class Trace(object):
             lines.append(s)
         return repr(lines)
 
-    def _exec_call(self, node):
-        func_name = node.func.attr
-        pkg_name = node.func.value.id
-        mod_name = '.'.join([self.provider.name + '_utils', pkg_name])
-        mod = sys.modules[mod_name]
-        func = getattr(mod, func_name)
-        args = []
-        for arg in node.args:
-            if isinstance(arg, ast.Name):
-                name = arg.id
-                args.append(self.item.get(name))
-            else:
-                raise TraceError('Unknown argument type: %s' % arg)
-        return func(*args)
-
-    def _proc_compare(self, node):
-        assert len(node.ops) == 1
-        assert len(node.comparators) == 1
-        assert isinstance(node.left, ast.Name)
-
-        left = node.left.id
-        op = node.ops[0].__class__.__name__
-        comparator = node.comparators[0]
-
-        known_symbols = []
-        for name in dir(symbol):
-            obj = getattr(symbol, name)
-            if inspect.isclass(obj) and issubclass(obj, symbol.SymbolBase):
-                known_symbols.append(name)
-
-        exc_types = []
-        right_value = None
-        if isinstance(comparator, ast.Name):
-            if comparator.id not in known_symbols:
-                raise TraceError("Unknown symbol '%s'" % comparator.id)
-            if op == 'IsNot':
-                sym_type = 'Bytes'
-                exc_types.append(comparator.id)
+    def _compile(self):
+        """
+        Compile the trace into a list of operations, each of which takes the
+        item and a dict of symbols to be constrained.
+        """
+        plan = []
+        for node in self.trace[:-1]:
+            if isinstance(node, ast.Compare):
+                plan.append(_Compare(self.provider, node))
+            elif isinstance(node, ast.Call):
+                func_name = getattr(node.func, 'id', None)
+                if func_name == 'build':
+                    plan.append(_Build(self.provider, node))
+                elif func_name in ['any', 'all']:
+                    plan.append(_Quantify(self.provider, node))
+                else:
+                    raise TraceError('Unknown function: %s' % func_name)
             else:
-                sym_type = comparator.id
-        elif isinstance(comparator, ast.Num):
-            sym_type = 'Integer'
-            right_value = comparator.n
-        elif isinstance(comparator, ast.Str):
-            sym_type = 'Bytes'
-            right_value = comparator.s
-
-        if isinstance(comparator, ast.Call):
-            call_ret = self._exec_call(comparator)
+                raise TraceError('Unknown node type: %s' % type(node))
+        return plan
 
-            test_val = call_ret
-            if isinstance(call_ret, (list, tuple)):
-                test_val = call_ret[0]
+    def _item_independent(self):
+        """
+        Whether solving this trace doesn't depend on the item, so that the
+        symbols built for an item can be modeled for others.
+        """
+        for operation in self.plan:
+            if isinstance(operation, _Build):
+                return False
+            call = getattr(operation, 'call', None)
+            if call is not None and call.arg_names:
+                return False
+        return True
 
-            if isinstance(test_val, builtins.str):
-                sym_type = 'Bytes'
-            elif isinstance(test_val, int):
-                sym_type = 'Integer'
+    def solve_batch(self, items, alpha=20, beta=1.8):
+        """
+        Generate satisfiable random options for a batch of items. If the
+        trace doesn't depend on the items, symbols are built only once.
 
-        if left not in self.symbols:
-            self.symbols[left] = getattr(
-                symbol, sym_type)(exc_types=[exc_types])
+        :param items: A list of items to which generated options apply.
+        :param alpha: Alpha to Weibull distribution.
+        :param beta: Beta to Weibull distribution.
+        :return: A list of generated random options of items.
+        """
+        # Seeded items draw from their own random generators
+        if (len(items) <= 1 or not self._item_independent() or
+                any(item.rng is not None for item in items)):
+            return [self.solve(item, alpha, beta) for item in items]
 
-        sleft = self.symbols[left]
-        sleft_type = sleft.__class__.__name__
+        self.item = items[0]
+        self.symbols = {}
+        for operation in self.plan:
+            operation(items[0], self.symbols)
 
-        if op != 'IsNot':
-            if not issubclass(sleft.__class__, getattr(symbol, sym_type)):
-                raise TraceError(
-                    'Unmatched type %s(operator: %s). Should be %s' %
-                    (sym_type, op, sleft_type))
-
-        if op == 'Is':
-            pass
-        elif op == 'IsNot':
-            pass
-        elif op == 'Eq':
-            if sleft.scope and right_value not in sleft.scope:
-                raise Exception(
-                    'Unsatisfiable condition. Need equal to "%s", '
-                    'but scope is %s' % (right_value, sleft.scope)
-                )
-            sleft.scope = [right_value]
-        elif op == 'NotEq':
-            if sleft.excs is None:
-                sleft.excs = []
-            sleft.excs.append(right_value)
-        elif op == 'Lt':
-            if sleft_type == 'Integer':
-                sleft.maximum = right_value - 1
-        elif op == 'LtE':
-            if sleft_type == 'Integer':
-                sleft.maximum = right_value
-        elif op == 'Gt':
-            if sleft_type == 'Integer':
-                sleft.minimum = right_value + 1
-        elif op == 'GtE':
-            if sleft_type == 'Integer':
-                sleft.minimum = right_value
-        elif op == 'In':
-            sleft.scope = call_ret
-        elif op == 'NotIn':
-            sleft.excs = call_ret
-        else:
-            raise TraceError('Unknown operator: %s' % op)
-
-    def _proc_call(self, node):
-        func_name = node.func.id
-        assert func_name in ['any', 'all', 'build']
-        if func_name == 'build':
-            self._exec_call(node.args[0])
-            return
-        assert isinstance(node.args[0], ast.Compare)
-        comp = node.args[0]
-        op = comp.ops[0].__class__.__name__
-        left = comp.left
-        right = comp.comparators[0]
-        if isinstance(left, ast.Name):
-            sym_left = self.symbols[left.id]
-            assert isinstance(right, ast.Call)
-            right = self._exec_call(right)
-            assert isinstance(right, (list, tuple))
-            assert op in ['In', 'NotIn']
-            if func_name == 'all':
-                if op == 'In':
-                    sym_left.scopes.append((right, True, 0))
-                elif op == 'NotIn':
-                    sym_left.scopes.append((right, False, 1))
-            elif func_name == 'any':
-                if op == 'In':
-                    sym_left.scopes.append((right, True, 1))
-                    sym_left.scopes.append((right, False, 0))
-                elif op == 'NotIn':
-                    sym_left.scopes.append((right, True, 0))
-                    sym_left.scopes.append((right, False, 1))
-        elif isinstance(left, ast.Call):
-            sym_right = self.symbols[right.id]
-            left = self._exec_call(left)
-            if func_name == 'all':
-                if op == 'In':
-                    pass  # TODO
-                elif op == 'NotIn':
-                    sym_right.excludes = left
-            elif func_name == 'any':
-                if op == 'In':
-                    pass  # TODO
-        else:
-            raise TraceError('Unknown left type %s' % left)
+        results = [{} for _ in items]
+        for name, sym in self.symbols.items():
+            values = sym.model_batch(len(items), alpha, beta)
+            for result, value in zip(results, values):
+                result[name] = value
+        return results
 
     def solve(self, item, alpha=20, beta=1.8):
         """
-        Generate a satisfiable random option according to this trace.
+        Generate a satisfiable random option according to this trace. Values
+        are drawn from the random generator of the item if it's seeded, which
+        is also used by rnd helpers called by the trace.
+
         :param item: Item to which generated option applies.
         :param alpha: Alpha to Weibull distribution.
         :param beta: Beta to Weibull distribution.
@@ -210,16 +414,11 @@ class Trace(object):
         """
         self.item = item
         self.symbols = {}
+        with rnd.using(item.rng):
+            for operation in self.plan:
+                operation(item, self.symbols)
 
-        for node in self.trace:
-            if isinstance(node, ast.Compare):
-                self._proc_compare(node)
-            elif isinstance(node, ast.Call):
-                self._proc_call(node)
-            elif isinstance(node, ast.Return):
-                result = {}
-                for name, sym in self.symbols.items():
-                    result[name] = sym.model(alpha, beta)
-                return result
-            else:
-                raise TraceError('Unknown node type: %s' % type(node))
+            result = {}
+            for name, sym in self.symbols.items():
+                result[name] = sym.model(alpha, beta, item.rng)
+        return result
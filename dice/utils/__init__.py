@@ -5,6 +5,7 @@ import random
 import select
 import signal
 import subprocess
+import threading
 import time
 
 
@@ -56,6 +57,8 @@ def weighted_choice(choices):
 
 
 def escape(org_str):
+    if isinstance(org_str, bytes):
+        org_str = org_str.decode('utf-8', 'backslashreplace')
     escapes = """~()[]{}<>|&$#?'"`*; \n\t\r\\"""
     new_str = ""
     for char in org_str:
@@ -82,68 +85,301 @@ def kernel_pids():
     return results
 
 
-def run(cmdline, timeout=10):
+def _pidfd_open(pid):
+    """
+    Open a file descriptor becomes readable when process exits. Return None
+    if pidfd is not supported by the system.
+    """
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+
+def _exit_pipe(pid):
+    """
+    Open a file descriptor becomes readable when process exits, which is
+    the read end of a pipe closed by a thread waiting for the process
+    without reaping it. Return None if waitid() is not supported by the
+    system.
+    """
+    if not hasattr(os, 'waitid'):
+        return None
+    read_fd, write_fd = os.pipe()
+
+    def _wait():
+        try:
+            os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        except ChildProcessError:
+            # Already reaped after a timeout
+            pass
+        finally:
+            os.close(write_fd)
+
+    thread = threading.Thread(target=_wait)
+    thread.daemon = True
+    thread.start()
+    return read_fd
+
+
+class _OutputBuffer(object):
+    """
+    A preallocated byte buffer for reading output of a process.
+    """
+
+    def __init__(self, size=65536):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.length = 0
+
+    def read_from(self, fd):
+        """
+        Read available bytes from a non-blocking file descriptor into buffer.
+
+        :param fd: The file descriptor to read from.
+        :return: False if end of file is reached, otherwise True.
+        """
+        while True:
+            if self.length == len(self.data):
+                # A bytearray can't be resized while a view is exported
+                self.view.release()
+                self.data.extend(bytearray(len(self.data)))
+                self.view = memoryview(self.data)
+            try:
+                cnt = os.readv(fd, [self.view[self.length:]])
+            except OSError as detail:
+                if detail.errno == errno.EAGAIN:
+                    return True
+                raise
+            if cnt == 0:
+                return False
+            self.length += cnt
+
+    def decode(self):
+        return self.data[:self.length].decode('utf-8', 'replace')
+
+
+def _fork_exec(argv, env, out_w, err_w):
+    """
+    Fork and execute a process in a new session with its stdout and stderr
+    redirected, for platforms without os.posix_spawnp(). Like subprocess,
+    the child sends the errno of a failed exec back through a pipe closed
+    on exec.
+
+    :param argv: Argument list of the process.
+    :param env: Environment variables of the process.
+    :param out_w: File descriptor to redirect stdout to.
+    :param err_w: File descriptor to redirect stderr to.
+    :return: ID of the process.
+    :raise OSError: If the process can't be executed.
+    """
+    exc_r, exc_w = os.pipe()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.setsid()
+                os.dup2(out_w, 1)
+                os.dup2(err_w, 2)
+                os.execvpe(argv[0], argv, env)
+            except OSError as detail:
+                os.write(exc_w, str(detail.errno).encode('ascii'))
+            finally:
+                os._exit(127)
+        os.close(exc_w)
+        exc_w = None
+        data = b''
+        while True:
+            chunk = os.read(exc_r, 64)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        os.close(exc_r)
+        if exc_w is not None:
+            os.close(exc_w)
+
+    if data:
+        os.waitpid(pid, 0)
+        code = int(data)
+        raise OSError(code, os.strerror(code), argv[0])
+    return pid
+
+
+def _spawn(argv, env):
+    """
+    Spawn a process in a new session with its stdout and stderr redirected
+    to pipes.
+
+    :param argv: Argument list of the process.
+    :param env: Environment variables of the process.
+    :return: A tuple of process ID and the file descriptors to read stdout
+             and stderr from.
+    """
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    try:
+        if hasattr(os, 'posix_spawnp'):
+            pid = os.posix_spawnp(
+                argv[0], argv, env,
+                file_actions=[
+                    (os.POSIX_SPAWN_DUP2, out_w, 1),
+                    (os.POSIX_SPAWN_DUP2, err_w, 2),
+                ],
+                setsid=True,
+            )
+        else:
+            pid = _fork_exec(argv, env, out_w, err_w)
+    except OSError:
+        os.close(out_r)
+        os.close(err_r)
+        raise
+    finally:
+        os.close(out_w)
+        os.close(err_w)
+    return pid, out_r, err_r
+
+
+def _spawn_failure(cmdline, detail):
+    """
+    Get the result of a command which can't be executed. Like the shell,
+    the exit code is 127 and the error is written to stderr.
+
+    :param cmdline: The command line failed to be executed.
+    :param detail: The OSError raised when executing the command.
+    :returns: CmdResult -- the command result.
+    """
+    result = CmdResult(cmdline)
+    result.stderr = '%s\n' % detail
+    result.exit_code = 127
+    result.exit_status = "failure"
+    return result
+
+
+def _exit_code(status):
+    """
+    Convert a wait status to an exit code. Like subprocess, a negative exit
+    code -N means the process is terminated by signal N.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _reap(pid, deadline=None):
+    """
+    Reap an exited process.
+
+    :param pid: ID of the process.
+    :param deadline: Monotonic time to wait until for the process to exit.
+                     Wait forever if it's None.
+    :return: The exit code or None if the process is still running.
+    """
+    if deadline is None:
+        _, status = os.waitpid(pid, 0)
+        return _exit_code(status)
+
+    delay = 0.0005
+    while True:
+        wait_pid, status = os.waitpid(pid, os.WNOHANG)
+        if wait_pid == pid:
+            return _exit_code(status)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+def run(cmdline, timeout=10, env=None):
     """Run the command line and return the result with a CmdResult object.
 
-    :param cmdline: The command line to run.
-    :type cmdline: str.
+    :param cmdline: The command line to run. A string is run by the shell,
+                    while a list of arguments is run directly without any
+                    escaping.
+    :type cmdline: str or list.
     :param timeout: After which the calling processing is killed.
     :type timeout: float.
+    :param env: Environment variables for the command. Default to the
+                environment of current process.
+    :type env: dict.
     :returns: CmdResult -- the command result.
-    :raises:
-    """
-
-    start = time.time()
-    process = subprocess.Popen(
-        cmdline,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        shell=True,
-        preexec_fn=os.setsid,
-    )
-
-    fcntl.fcntl(
-        process.stdout,
-        fcntl.F_SETFL,
-        fcntl.fcntl(process.stdout, fcntl.F_GETFL) | os.O_NONBLOCK,
-    )
-    fcntl.fcntl(
-        process.stderr,
-        fcntl.F_SETFL,
-        fcntl.fcntl(process.stderr, fcntl.F_GETFL) | os.O_NONBLOCK,
-    )
+    """
+    if isinstance(cmdline, list):
+        argv = cmdline
+        cmdline = ' '.join(escape(arg) for arg in argv)
+    else:
+        argv = ['/bin/sh', '-c', cmdline]
+    if env is None:
+        env = os.environ
+
+    start = time.monotonic()
+    deadline = start + timeout
+    try:
+        pid, out_fd, err_fd = _spawn(argv, env)
+    except OSError as detail:
+        return _spawn_failure(cmdline, detail)
 
     result = CmdResult(cmdline)
 
+    buffers = {}
+    poller = select.poll()
+    for fd in (out_fd, err_fd):
+        fcntl.fcntl(fd, fcntl.F_SETFL,
+                    fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        buffers[fd] = _OutputBuffer()
+        poller.register(fd, select.POLLIN)
+
+    # Get notified on exit of the process by pidfd if it's supported, or by
+    # a pipe closed after the exit. Otherwise wait for the process after it
+    # closed its output.
+    exit_fd = _pidfd_open(pid)
+    if exit_fd is None:
+        exit_fd = _exit_pipe(pid)
+    if exit_fd is not None:
+        poller.register(exit_fd, select.POLLIN)
+
+    exit_code = None
+    opened = len(buffers)
     try:
-        while True:
-            exit_code = process.poll()
-            result.call_time = (time.time() - start)
+        while exit_code is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
 
-            select.select([process.stdout, process.stderr], [], [], 0.1)
-            try:
-                out_lines = process.stdout.read()
-                if out_lines:
-                    result.stdout += out_lines
-                err_lines = process.stderr.read()
-                if err_lines:
-                    result.stderr += err_lines
-            except IOError as detail:
-                if detail.errno != errno.EAGAIN:
-                    raise detail
-
-            if exit_code is not None:
-                result.exit_code = exit_code
-                if exit_code == 0:
-                    result.exit_status = "success"
-                else:
-                    result.exit_status = "failure"
-                return result
-
-            if result.call_time > timeout:
-                return result
+            if opened == 0 and exit_fd is None:
+                exit_code = _reap(pid, deadline)
+                break
+
+            for fd, _ in poller.poll(remaining * 1000):
+                if fd == exit_fd:
+                    exit_code = _reap(pid)
+                elif not buffers[fd].read_from(fd):
+                    poller.unregister(fd)
+                    opened -= 1
+
+        # Collect output left in pipes after exit
+        for fd, buf in buffers.items():
+            buf.read_from(fd)
+
+        result.call_time = time.monotonic() - start
+        result.stdout = buffers[out_fd].decode()
+        result.stderr = buffers[err_fd].decode()
+        if exit_code is not None:
+            result.exit_code = exit_code
+            if exit_code == 0:
+                result.exit_status = "success"
+            else:
+                result.exit_status = "failure"
+        return result
     finally:
-        if result.exit_code is None:
-            pgid = os.getpgid(process.pid)
-            os.killpg(pgid, signal.SIGKILL)
+        if exit_code is None:
+            os.killpg(pid, signal.SIGKILL)
+            _reap(pid)
             result.exit_status = "timeout"
+        if exit_fd is not None:
+            os.close(exit_fd)
+        os.close(out_fd)
+        os.close(err_fd)
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+
+from . import CmdResult
+from . import _spawn_failure
+from . import escape
+
+
+def new_event_loop():
+    """Create an event loop which can run subprocesses from any thread.
+
+    Before Python 3.8, children are watched by a SIGCHLD handler of the event
+    loop, so this must be called from the main thread.
+
+    :returns: The new event loop.
+    """
+    loop = asyncio.new_event_loop()
+    if sys.version_info < (3, 8):
+        asyncio.set_event_loop(loop)
+        asyncio.get_child_watcher().attach_loop(loop)
+    return loop
+
+
+async def run(cmdline, timeout=10, env=None):
+    """Run the command line in a subprocess of the running event loop and
+    return the result with a CmdResult object.
+
+    :param cmdline: The command line to run. A string is run by the shell,
+                    while a list of arguments is run directly without any
+                    escaping.
+    :type cmdline: str or list.
+    :param timeout: After which the calling processing is killed.
+    :type timeout: float.
+    :param env: Environment variables for the command. Default to the
+                environment of current process.
+    :type env: dict.
+    :returns: CmdResult -- the command result.
+    """
+    if isinstance(cmdline, list):
+        argv = cmdline
+        cmdline = ' '.join(escape(arg) for arg in argv)
+    else:
+        argv = ['/bin/sh', '-c', cmdline]
+
+    start = time.monotonic()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+    except OSError as detail:
+        return _spawn_failure(cmdline, detail)
+
+    result = CmdResult(cmdline)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(),
+                                                timeout)
+    except asyncio.TimeoutError:
+        result.call_time = time.monotonic() - start
+        result.exit_status = "timeout"
+        return result
+    finally:
+        if process.returncode is None:
+            os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+
+    result.call_time = time.monotonic() - start
+    result.stdout = stdout.decode('utf-8', 'replace')
+    result.stderr = stderr.decode('utf-8', 'replace')
+    result.exit_code = process.returncode
+    if process.returncode == 0:
+        result.exit_status = "success"
+    else:
+        result.exit_status = "failure"
+    return result
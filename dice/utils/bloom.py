@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import math
+import mmap
+import multiprocessing
+
+logger = logging.getLogger('dice')
+
+
+class BloomFilter(object):
+    """
+    A memory-bounded probabilistic set of byte strings. A key added before
+    is always reported as present, while a key never added is reported as
+    present at about the given error rate.
+
+    The capacity is derived from the memory budget and the error rate. When
+    more keys than the capacity are added, the filter is cleared to keep the
+    error rate bounded, forgetting keys added before.
+
+    The bit array and the key count are in shared memory, so the filter is
+    shared with forked processes within the same memory budget. Concurrent
+    updates are not locked, which may rarely lose a key or a count.
+    """
+
+    def __init__(self, error_rate=0.001, max_bytes=16 * 1024 * 1024):
+        """
+        :param error_rate: Probability of reporting a new key as present.
+        :param max_bytes: Memory budget of the bit array in bytes.
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError('Error rate should be between 0 and 1')
+        self.error_rate = error_rate
+        self.num_bits = max(max_bytes, 1) * 8
+        self.num_hashes = max(int(round(-math.log(error_rate, 2))), 1)
+        self.capacity = max(int(self.num_bits * math.log(2) ** 2 /
+                                -math.log(error_rate)), 1)
+        # An anonymous mapping is shared with forked processes
+        self.bits = mmap.mmap(-1, self.num_bits // 8)
+        self._count = multiprocessing.RawValue('L', 0)
+
+    @property
+    def count(self):
+        """
+        Number of keys added since the filter is cleared.
+        """
+        return self._count.value
+
+    def _indexes(self, key):
+        digest = hashlib.sha1(key).digest()
+        # Derive all hashes from two by double hashing
+        hash1 = int.from_bytes(digest[:8], 'little')
+        hash2 = int.from_bytes(digest[8:16], 'little') | 1
+        for idx in range(self.num_hashes):
+            yield (hash1 + idx * hash2) % self.num_bits
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[idx >> 3] & (1 << (idx & 7))
+                   for idx in self._indexes(key))
+
+    def add(self, key):
+        """
+        Add a key to the filter.
+
+        :param key: A byte string.
+        :return: True if the key is probably added before.
+        """
+        if self.count >= self.capacity:
+            logger.info('Bloom filter of %s keys is full, clear it',
+                        self.count)
+            self.clear()
+
+        bits = self.bits
+        present = True
+        for idx in self._indexes(key):
+            mask = 1 << (idx & 7)
+            if not bits[idx >> 3] & mask:
+                present = False
+                bits[idx >> 3] |= mask
+        if not present:
+            self._count.value += 1
+        return present
+
+    def clear(self):
+        # Clear in place to keep sharing the bits with forked processes
+        self.bits[:] = bytes(len(self.bits))
+        self._count.value = 0
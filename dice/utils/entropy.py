@@ -0,0 +1,111 @@
+import os
+import string
+import threading
+
+# Map random bytes to printable characters without bias. Bytes not less
+# than a multiple of the number of characters are deleted.
+_PRINTABLE = string.printable.encode('ascii')
+_PRINTABLE_LIMIT = 256 // len(_PRINTABLE) * len(_PRINTABLE)
+_PRINTABLE_TABLE = bytes(_PRINTABLE[b % len(_PRINTABLE)] for b in range(256))
+_PRINTABLE_DELETE = bytes(range(_PRINTABLE_LIMIT, 256))
+
+
+class EntropyPool(object):
+    """
+    A pool of random bytes read from the source in large blocks and handed
+    out as slices without copying.
+    """
+
+    def __init__(self, block_size=65536, source=os.urandom):
+        """
+        :param block_size: Number of bytes read from the source at once.
+        :param source: A function returns the given number of random bytes.
+        """
+        self.block_size = block_size
+        self.source = source
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Forked processes must not hand out the same bytes as their parent
+        self.pid = os.getpid()
+        self.block = memoryview(b'')
+        self.offset = 0
+
+    def read(self, size):
+        """
+        Get random bytes.
+
+        :param size: Number of bytes.
+        :return: A read-only memoryview of the bytes.
+        """
+        if size > self.block_size:
+            return memoryview(self.source(size))
+        with self.lock:
+            if os.getpid() != self.pid:
+                self._reset()
+            if self.offset + size > len(self.block):
+                self.block = memoryview(self.source(self.block_size))
+                self.offset = 0
+            view = self.block[self.offset:self.offset + size]
+            self.offset += size
+        return view
+
+    def nonzero_bytes(self, size):
+        """
+        Get random bytes without NUL. NUL bytes are stripped, so the result
+        may be shorter than size.
+
+        :param size: Number of bytes before NUL is stripped.
+        """
+        return self.read(size).tobytes().translate(None, b'\0')
+
+    def printable(self, size):
+        """
+        Get a string of uniformly random printable characters.
+
+        :param size: Number of characters.
+        """
+        chunks = []
+        length = 0
+        while length < size:
+            # Read a bit more than needed since some bytes are deleted
+            raw = self.read((size - length) * 256 // _PRINTABLE_LIMIT + 8)
+            chunk = raw.tobytes().translate(_PRINTABLE_TABLE,
+                                            _PRINTABLE_DELETE)
+            chunks.append(chunk)
+            length += len(chunk)
+        return b''.join(chunks)[:size].decode('ascii')
+
+
+# The pool shared by symbols
+pool = EntropyPool()
+
+
+def _randbytes(rng):
+    """
+    Get a function returning random bytes from a random generator. Before
+    Python 3.9, which added Random.randbytes(), bytes are drawn the same way
+    as it does.
+
+    :param rng: A random.Random instance.
+    """
+    if hasattr(rng, 'randbytes'):
+        return rng.randbytes
+
+    def _source(size):
+        # getrandbits(0) raises ValueError before Python 3.9
+        if size == 0:
+            return b''
+        return rng.getrandbits(size * 8).to_bytes(size, 'little')
+    return _source
+
+
+def from_rng(rng):
+    """
+    Get a pool reading bytes from a random generator without buffering, so
+    that the bytes read follow the state of the generator.
+
+    :param rng: A random.Random instance.
+    """
+    return EntropyPool(block_size=0, source=_randbytes(rng))
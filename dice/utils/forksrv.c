@@ -0,0 +1,151 @@
+/*
+ * Fork server shim for DICE.
+ *
+ * Preloaded into a target binary with LD_PRELOAD, it takes over
+ * __libc_start_main so the target stops right before main() after dynamic
+ * linking and libc initialization. Then for each request read from the
+ * control pipe, it forks a child running main() with the requested
+ * arguments.
+ *
+ * Protocol, all integers are in native byte order:
+ *
+ *   server -> dice: uint32 magic when the server is ready.
+ *   dice -> server: uint32 size, then size bytes of NUL-terminated argv.
+ *   server -> dice: int32 pid of the forked child, -1 if fork failed.
+ *   server -> dice: int32 wait status of the child when it exits.
+ *
+ * Build with:
+ *
+ *   cc -shared -fPIC -o forksrv.so forksrv.c -ldl
+ */
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#define FORKSRV_MAGIC 0x44494345
+
+typedef int (*main_fn)(int, char **, char **);
+typedef int (*start_fn)(main_fn, int, char **, void (*)(void),
+                        void (*)(void), void (*)(void), void *);
+
+extern char **environ;
+
+static main_fn real_main;
+
+static int read_all(int fd, void *buf, size_t len)
+{
+    char *p = buf;
+    while (len > 0) {
+        ssize_t cnt = read(fd, p, len);
+        if (cnt < 0 && errno == EINTR)
+            continue;
+        if (cnt <= 0)
+            return -1;
+        p += cnt;
+        len -= cnt;
+    }
+    return 0;
+}
+
+static int write_all(int fd, const void *buf, size_t len)
+{
+    const char *p = buf;
+    while (len > 0) {
+        ssize_t cnt = write(fd, p, len);
+        if (cnt < 0 && errno == EINTR)
+            continue;
+        if (cnt <= 0)
+            return -1;
+        p += cnt;
+        len -= cnt;
+    }
+    return 0;
+}
+
+static int serve(int argc, char **argv, char **envp)
+{
+    const char *ctl_env = getenv("DICE_FORKSRV_CTL");
+    const char *st_env = getenv("DICE_FORKSRV_ST");
+    int ctl_fd, st_fd;
+    uint32_t magic = FORKSRV_MAGIC;
+
+    if (ctl_env == NULL || st_env == NULL)
+        return real_main(argc, argv, envp);
+
+    ctl_fd = atoi(ctl_env);
+    st_fd = atoi(st_env);
+
+    /* Processes started by children don't run as fork servers */
+    unsetenv("DICE_FORKSRV_CTL");
+    unsetenv("DICE_FORKSRV_ST");
+    unsetenv("LD_PRELOAD");
+
+    if (write_all(st_fd, &magic, sizeof(magic)) < 0)
+        _exit(1);
+
+    for (;;) {
+        uint32_t size;
+        char *buf, *p;
+        char **args;
+        int nargs = 0, i, status;
+        int32_t result;
+        pid_t pid;
+
+        if (read_all(ctl_fd, &size, sizeof(size)) < 0)
+            _exit(0);
+
+        buf = malloc(size + 1);
+        if (buf == NULL || read_all(ctl_fd, buf, size) < 0)
+            _exit(1);
+        buf[size] = '\0';
+
+        for (p = buf; p < buf + size; p += strlen(p) + 1)
+            nargs++;
+        args = malloc((nargs + 1) * sizeof(char *));
+        if (args == NULL)
+            _exit(1);
+        for (i = 0, p = buf; i < nargs; i++, p += strlen(p) + 1)
+            args[i] = p;
+        args[nargs] = NULL;
+
+        pid = fork();
+        if (pid == 0) {
+            close(ctl_fd);
+            close(st_fd);
+            setsid();
+            exit(real_main(nargs, args, environ));
+        }
+        free(buf);
+        free(args);
+
+        result = pid;
+        if (write_all(st_fd, &result, sizeof(result)) < 0)
+            _exit(1);
+        if (pid < 0)
+            continue;
+
+        while (waitpid(pid, &status, 0) < 0) {
+            if (errno != EINTR)
+                _exit(1);
+        }
+        result = status;
+        if (write_all(st_fd, &result, sizeof(result)) < 0)
+            _exit(1);
+    }
+}
+
+int __libc_start_main(main_fn main, int argc, char **argv,
+                      void (*init)(void), void (*fini)(void),
+                      void (*rtld_fini)(void), void *stack_end)
+{
+    start_fn real_start = (start_fn)dlsym(RTLD_NEXT, "__libc_start_main");
+
+    real_main = main;
+    return real_start(serve, argc, argv, init, fini, rtld_fini, stack_end);
+}
@@ -0,0 +1,271 @@
+import os
+import select
+import signal
+import struct
+import subprocess
+import threading
+import time
+
+from . import CmdResult
+from . import data_dir
+from . import escape
+from . import _exit_code
+from . import _OutputBuffer
+
+FORKSRV_MAGIC = 0x44494345
+
+SHIM_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'forksrv.c')
+SHIM_PATH = os.path.join(data_dir.USER_BASE_DIR, 'forksrv.so')
+
+
+class ForkServerError(Exception):
+    """
+    Class for fork server specific exceptions.
+    """
+    pass
+
+
+def build_shim():
+    """
+    Build the fork server shim library if it's not built or outdated.
+
+    :return: Path of the shim library.
+    """
+    if (not os.path.exists(SHIM_PATH) or
+            os.path.getmtime(SHIM_PATH) < os.path.getmtime(SHIM_SOURCE)):
+        temp_path = '%s.%s' % (SHIM_PATH, os.getpid())
+        cmd = [os.environ.get('CC', 'cc'), '-shared', '-fPIC', '-O2',
+               '-o', temp_path, SHIM_SOURCE, '-ldl']
+        try:
+            subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError) as detail:
+            raise ForkServerError('Failed to build fork server shim: %s' %
+                                  detail) from detail
+        os.rename(temp_path, SHIM_PATH)
+    return SHIM_PATH
+
+
+class ForkServer(object):
+    """
+    A target binary started with the fork server shim preloaded. It forks a
+    fresh child running main() of the binary for each run, which skips
+    execve, dynamic linking and libc initialization.
+    """
+
+    def __init__(self, binary, env=None, start_timeout=10):
+        """
+        :param binary: Path of the target binary. It must be dynamically
+                       linked against glibc.
+        :param env: Environment variables of the server and all runs.
+        :param start_timeout: Seconds to wait for the server to be ready.
+        """
+        self.binary = binary
+        self.lock = threading.Lock()
+
+        ctl_r, self.ctl_w = os.pipe()
+        self.st_r, st_w = os.pipe()
+        self.out_r, out_w = os.pipe()
+        self.err_r, err_w = os.pipe()
+
+        env = dict(os.environ if env is None else env)
+        env['LD_PRELOAD'] = build_shim()
+        env['DICE_FORKSRV_CTL'] = str(ctl_r)
+        env['DICE_FORKSRV_ST'] = str(st_w)
+        try:
+            self.process = subprocess.Popen(
+                [binary],
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=out_w,
+                stderr=err_w,
+                pass_fds=(ctl_r, st_w),
+                start_new_session=True,
+            )
+        except OSError:
+            self._close_fds()
+            raise
+        finally:
+            for fd in (ctl_r, st_w, out_w, err_w):
+                os.close(fd)
+
+        self.buffers = {self.out_r: _OutputBuffer(),
+                        self.err_r: _OutputBuffer()}
+        self.poller = select.poll()
+        for fd in (self.st_r, self.out_r, self.err_r):
+            os.set_blocking(fd, False)
+            self.poller.register(fd, select.POLLIN)
+
+        try:
+            magic = self._read_int(time.monotonic() + start_timeout)
+        except ForkServerError:
+            self.close()
+            raise
+        if magic is None or magic & 0xffffffff != FORKSRV_MAGIC:
+            self.close()
+            raise ForkServerError(
+                'Fork server of %s failed to start. Is it dynamically '
+                'linked?' % binary)
+
+    def _close_fds(self):
+        for fd in (self.ctl_w, self.st_r, self.out_r, self.err_r):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _read_int(self, deadline=None):
+        """
+        Read an integer from the status pipe while collecting output of the
+        running child.
+
+        :param deadline: Monotonic time to wait until. Wait forever if it's
+                         None.
+        :return: The integer read, or None if deadline is reached.
+        """
+        data = b''
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0) * 1000
+            events = self.poller.poll(timeout)
+            if not events:
+                return None
+            for fd, _ in events:
+                if fd == self.st_r:
+                    try:
+                        chunk = os.read(fd, 4 - len(data))
+                    except BlockingIOError:
+                        continue
+                    if not chunk:
+                        raise ForkServerError(
+                            'Fork server of %s exited unexpectedly' %
+                            self.binary)
+                    data += chunk
+                else:
+                    self.buffers[fd].read_from(fd)
+            if len(data) == 4:
+                return struct.unpack('=i', data)[0]
+
+    def run(self, argv, timeout=10):
+        """
+        Run main() of the binary with given arguments in a forked child and
+        return the result with a CmdResult object.
+
+        :param argv: Argument list of the run. The first argument is passed
+                     to main() as program name.
+        :param timeout: After which the child is killed.
+        :returns: CmdResult -- the run result.
+        :raises: ForkServerError if the server is broken.
+        """
+        with self.lock:
+            result = CmdResult(' '.join(escape(arg) for arg in argv))
+            for buf in self.buffers.values():
+                buf.length = 0
+
+            payload = b''.join(os.fsencode(arg) + b'\0' for arg in argv)
+            start = time.monotonic()
+            try:
+                os.write(self.ctl_w,
+                         struct.pack('=I', len(payload)) + payload)
+            except OSError as detail:
+                raise ForkServerError('Failed to send request to fork '
+                                      'server: %s' % detail) from detail
+
+            pid = self._read_int(start + timeout)
+            if pid is None or pid < 0:
+                raise ForkServerError('Fork server failed to fork')
+
+            status = self._read_int(start + timeout)
+            result.call_time = time.monotonic() - start
+            if status is None:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    # The child may not have called setsid() yet
+                    os.kill(pid, signal.SIGKILL)
+                self._read_int()
+                result.exit_status = "timeout"
+
+            # Collect output left in pipes after exit
+            for fd, buf in self.buffers.items():
+                buf.read_from(fd)
+            result.stdout = self.buffers[self.out_r].decode()
+            result.stderr = self.buffers[self.err_r].decode()
+
+            if status is not None:
+                result.exit_code = _exit_code(status)
+                if result.exit_code == 0:
+                    result.exit_status = "success"
+                else:
+                    result.exit_status = "failure"
+            return result
+
+    def close(self):
+        """
+        Stop the fork server.
+        """
+        if self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        self._close_fds()
+
+
+class Launcher(object):
+    """
+    Launcher running commands through fork servers, one for each binary. It
+    can be used as ItemBase.launcher in place of utils.run.
+    """
+
+    def __init__(self):
+        self.servers = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def _get_server(self, binary, env):
+        with self.lock:
+            # Servers of the parent can't be used in a forked process
+            if self.pid != os.getpid():
+                self.servers = {}
+                self.pid = os.getpid()
+            if binary not in self.servers:
+                self.servers[binary] = ForkServer(binary, env=env)
+            return self.servers[binary]
+
+    def run(self, cmdline, timeout=10, env=None):
+        """Run the command through the fork server of its binary and return
+        the result with a CmdResult object.
+
+        :param cmdline: The argument list to run.
+        :type cmdline: list.
+        :param timeout: After which the child is killed.
+        :type timeout: float.
+        :param env: Environment variables for the fork server. It only takes
+                    effect when the server of the binary is started.
+        :type env: dict.
+        :returns: CmdResult -- the command result.
+        :raises: ForkServerError if the command can't be run.
+        """
+        if not isinstance(cmdline, list):
+            raise ForkServerError('Fork server can only run an argument list')
+        server = self._get_server(cmdline[0], env)
+        try:
+            return server.run(cmdline, timeout)
+        except ForkServerError:
+            with self.lock:
+                self.servers.pop(cmdline[0], None)
+            server.close()
+            raise
+
+    def close(self):
+        """
+        Stop all fork servers.
+        """
+        with self.lock:
+            for server in self.servers.values():
+                server.close()
+            self.servers = {}
+
+
+# A launcher shared by all items
+launcher = Launcher()
@@ -0,0 +1,277 @@
+import ctypes
+import io
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from . import CmdResult
+
+# Default settings of the shared call pool
+POOL_SIZE = 1
+MAX_CALLS = 1000
+MAX_RSS = 512 * 1024 * 1024
+
+# Workers are forked to inherit the modules of callables, like the utilities
+# loaded by providers, which can't be imported by name in a new process
+_context = multiprocessing.get_context('fork')
+
+
+def _rss():
+    """
+    Get the resident set size of current process in bytes.
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as fp:
+            pages = int(fp.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return 0
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _flush_libc():
+    """
+    Flush the stdio buffers of C extensions, which are fully buffered when
+    writing to files.
+    """
+    try:
+        ctypes.CDLL(None).fflush(None)
+    except (OSError, AttributeError):
+        pass
+
+
+def _serve(conn):
+    """
+    Main loop of a call worker process. Receive a callable with arguments,
+    call it and send back output, exit code and RSS after the call.
+    """
+    # Output is captured at file descriptor level, so that output written by
+    # C extensions is captured too and won't mess up the terminal.
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    files = (tempfile.TemporaryFile(), tempfile.TemporaryFile())
+    for fd, fp in zip((1, 2), files):
+        os.dup2(fp.fileno(), fd)
+    stdout, stderr = [
+        io.TextIOWrapper(io.FileIO(fd, 'w', closefd=False),
+                         write_through=True)
+        for fd in (1, 2)]
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        # Descriptors duplicated from the files share their offsets
+        for fp in files:
+            fp.seek(0)
+            fp.truncate()
+
+        func, args, kwargs = request
+        sys.stdout, sys.stderr = stdout, stderr
+        exit_code = 0
+        try:
+            func(*args, **kwargs)
+        except SystemExit as detail:
+            if isinstance(detail.code, int):
+                exit_code = detail.code
+            elif detail.code is not None:
+                stderr.write('%s\n' % detail.code)
+                exit_code = 1
+        except Exception as detail:  # pylint: disable=broad-except
+            stderr.write('%s: %s' % (detail.__class__.__name__, detail))
+            exit_code = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            stdout.flush()
+            stderr.flush()
+            _flush_libc()
+
+        output = []
+        for fp in files:
+            fp.seek(0)
+            output.append(fp.read().decode('utf-8', 'replace'))
+        conn.send((output[0], output[1], exit_code, _rss()))
+
+
+class _Worker(object):
+    """
+    A long-lived process calling Python callables for the call pool.
+    """
+
+    def __init__(self):
+        self.conn, child_conn = _context.Pipe()
+        self.process = _context.Process(target=_serve, args=(child_conn,))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.calls = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.conn.close()
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self):
+        try:
+            os.kill(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+
+class CallPool(object):
+    """
+    A pool of long-lived worker processes to call Python callables in.
+
+    A worker is recycled after it handled max_calls calls or its resident
+    set size exceeds max_rss. A worker running a call exceeding its timeout
+    is killed.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_calls=MAX_CALLS, max_rss=MAX_RSS):
+        """
+        :param size: Maximum number of worker processes.
+        :param max_calls: Number of calls before a worker is recycled.
+        :param max_rss: Resident set size in bytes before a worker is
+                        recycled.
+        """
+        self.size = size
+        self.max_calls = max_calls
+        self.max_rss = max_rss
+        self.cond = threading.Condition()
+        self.idle = []
+        self.busy = 0
+        self.pid = os.getpid()
+
+    def _acquire(self):
+        with self.cond:
+            # Workers of the parent can't be used in a forked process
+            if self.pid != os.getpid():
+                self.idle = []
+                self.busy = 0
+                self.pid = os.getpid()
+
+            while not self.idle and self.busy >= self.size:
+                self.cond.wait()
+            self.busy += 1
+            if self.idle:
+                return self.idle.pop()
+        try:
+            return _Worker()
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, worker):
+        with self.cond:
+            self.busy -= 1
+            if worker is not None:
+                self.idle.append(worker)
+            self.cond.notify()
+
+    def call(self, func, args=(), kwargs=None, timeout=10):
+        """
+        Call a Python callable in a worker process and return the result
+        with a CmdResult object.
+
+        :param func: The callable to call. It must be picklable, i.e. defined
+                     at the top level of a module.
+        :param args: Positional arguments of the call.
+        :param kwargs: Keyword arguments of the call.
+        :param timeout: After which the worker process is killed.
+        :returns: CmdResult -- the call result.
+        """
+        if kwargs is None:
+            kwargs = {}
+
+        params = [repr(arg) for arg in args]
+        params += ['%s=%r' % (key, val) for key, val in kwargs.items()]
+        result = CmdResult('%s.%s(%s)' % (func.__module__, func.__name__,
+                                          ', '.join(params)))
+
+        worker = self._acquire()
+        start = time.monotonic()
+        # Exit code is None if the call timed out
+        stdout, stderr, exit_code, rss = '', '', None, 0
+        try:
+            worker.conn.send((func, args, kwargs))
+            if worker.conn.poll(timeout):
+                stdout, stderr, exit_code, rss = worker.conn.recv()
+        except (EOFError, IOError, OSError):
+            worker.kill()
+            stdout, stderr, exit_code, rss = (
+                '', 'Worker exited with code %s' % worker.process.exitcode,
+                1, 0)
+            worker = None
+        except Exception:
+            worker.kill()
+            self._release(None)
+            raise
+        result.call_time = time.monotonic() - start
+
+        if exit_code is None:
+            worker.kill()
+            self._release(None)
+            result.exit_status = "timeout"
+            return result
+
+        if worker is not None:
+            worker.calls += 1
+            if worker.calls >= self.max_calls or rss > self.max_rss:
+                worker.stop()
+                worker = None
+        self._release(worker)
+
+        result.stdout = stdout
+        result.stderr = stderr
+        result.exit_code = exit_code
+        if exit_code == 0:
+            result.exit_status = "success"
+        else:
+            result.exit_status = "failure"
+        return result
+
+    def close(self):
+        """
+        Stop all idle worker processes.
+        """
+        with self.cond:
+            for worker in self.idle:
+                worker.stop()
+            self.idle = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def call(func, args=(), kwargs=None, timeout=10):
+    """
+    Call a Python callable in the shared call pool. The pool is created on
+    first call with POOL_SIZE, MAX_CALLS and MAX_RSS settings.
+
+    :param func: The callable to call.
+    :param args: Positional arguments of the call.
+    :param kwargs: Keyword arguments of the call.
+    :param timeout: After which the worker process is killed.
+    :returns: CmdResult -- the call result.
+    """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = CallPool()
+    return _pool.call(func, args, kwargs, timeout)
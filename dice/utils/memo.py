@@ -0,0 +1,154 @@
+import collections
+import functools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('dice')
+
+# All caches created by cached(), for statistics
+_caches = []
+
+
+class _Cache(object):
+    """
+    A LRU cache of results of a function keyed by positional arguments.
+    Entries older than the TTL are still returned while being refreshed in
+    a background thread.
+    """
+
+    def __init__(self, func, ttl, maxsize):
+        self.func = func
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = '%s.%s' % (func.__module__, func.__name__)
+        self.entries = collections.OrderedDict()
+        self._reset()
+
+    def _reset(self):
+        # Threads and locks are not inherited by forked processes, and
+        # forked processes count their own statistics
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def __call__(self, *args):
+        if os.getpid() != self.pid:
+            self._reset()
+        try:
+            hash(args)
+        except TypeError:
+            self.misses += 1
+            return self.func(*args)
+
+        with self.lock:
+            entry = self.entries.get(args)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(args)
+                value, stamp = entry
+                if (self.ttl is not None and
+                        time.monotonic() - stamp > self.ttl and
+                        args not in self.refreshing):
+                    self.refreshing.add(args)
+                    thread = threading.Thread(target=self._refresh,
+                                              args=(args,))
+                    thread.daemon = True
+                    thread.start()
+                return value
+            self.misses += 1
+
+        value = self.func(*args)
+        self._store(args, value)
+        return value
+
+    def _store(self, args, value):
+        with self.lock:
+            self.entries[args] = (value, time.monotonic())
+            self.entries.move_to_end(args)
+            if self.maxsize is not None:
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+
+    def _refresh(self, args):
+        try:
+            value = self.func(*args)
+        except Exception as detail:  # pylint: disable=broad-except
+            logger.warning('Failed to refresh %s%r: %s',
+                           self.name, args, detail)
+        else:
+            self._store(args, value)
+            self.refreshes += 1
+        finally:
+            with self.lock:
+                self.refreshing.discard(args)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        if os.getpid() != self.pid:
+            self._reset()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'size': len(self.entries),
+        }
+
+
+def cached(ttl=None, maxsize=128):
+    """
+    Decorator caching results of a helper function by its positional
+    arguments. Calls with unhashable arguments are not cached. Cached results
+    are shared by callers, so they should not be modified.
+
+    :param ttl: Seconds before a cached result is refreshed. A stale result
+                is still returned while it's refreshed in background. None
+                to never refresh.
+    :param maxsize: Maximum number of cached results, of which the least
+                    recently used is dropped first. None for unlimited.
+    """
+    def _decorator(func):
+        cache = _Cache(func, ttl, maxsize)
+        _caches.append(cache)
+
+        @functools.wraps(func)
+        def _wrapper(*args):
+            return cache(*args)
+        _wrapper.cache = cache
+        return _wrapper
+    return _decorator
+
+
+def stats():
+    """
+    Get statistics of all caches in current process.
+
+    :return: A dict of hits, misses, background refreshes and size of each
+             cache keyed by the name of cached function.
+    """
+    return dict((cache.name, cache.stats()) for cache in _caches)
+
+
+def merge(*all_stats):
+    """
+    Sum statistics of caches, like the ones from stats() of several
+    processes.
+
+    :param all_stats: Dicts returned by stats().
+    :return: A dict of summed statistics of each cache keyed by the name of
+             cached function.
+    """
+    total = {}
+    for stats_ in all_stats:
+        for name, stat in stats_.items():
+            cache_total = total.setdefault(name, {})
+            for key, value in stat.items():
+                cache_total[key] = cache_total.get(key, 0) + value
+    return total
@@ -1,18 +1,85 @@
+import contextlib
+import functools
 import logging
+import os
 import random
+import re
 import string
+import threading
+
+# pylint: disable=import-error,no-name-in-module,deprecated-module
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 logger = logging.getLogger(__name__)
 
+_numpy_rng = None
+_numpy_rng_pid = None
+
+# Random generator used by current thread, set by using()
+_local = threading.local()
+
+
+def _rng():
+    """
+    Get the random generator of current thread, default to the global one
+    of the random module.
+    """
+    rng = getattr(_local, 'rng', None)
+    if rng is None:
+        return random
+    return rng
+
+
+@contextlib.contextmanager
+def using(rng):
+    """
+    Context manager making helpers in current thread draw from a random
+    generator, so that values generated for a seeded item are reproducible.
+
+    :param rng: A random.Random instance, or None for the global one.
+    """
+    prev = getattr(_local, 'rng', None)
+    _local.rng = rng
+    try:
+        yield rng
+    finally:
+        _local.rng = prev
+
+
+def _get_numpy_rng():
+    """
+    Get the NumPy random generator of current process. Forked processes
+    get new generators instead of repeating the values of their parent.
+    A generator seeded from the random generator of current thread is used
+    if it's set by using().
+    """
+    global _numpy_rng, _numpy_rng_pid  # pylint: disable=global-statement
+    rng = getattr(_local, 'rng', None)
+    if rng is not None:
+        return numpy.random.default_rng(rng.getrandbits(64))
+    if _numpy_rng is None or _numpy_rng_pid != os.getpid():
+        _numpy_rng = numpy.random.default_rng()
+        _numpy_rng_pid = os.getpid()
+    return _numpy_rng
+
 
 def cpuset(min_inc=0, max_inc=100, max_len=1000, used_vcpu=None):
+    rng = _rng()
     cnt = int_exp(1, max_len)
 
     cpus = []
     cpusets = set()
     for _ in range(cnt):
-        choice = random.randint(0, 2)
+        choice = rng.randint(0, 2)
         if choice == 0:
             # Number
             num = int_exp(min_inc, max_inc)
@@ -48,15 +115,66 @@ def cpuset(min_inc=0, max_inc=100, max_len=1000, used_vcpu=None):
     return cpu_str
 
 
+def cpuset_array(size, min_inc=0, max_inc=100, max_len=1000):
+    """
+    Generate a list of CPU set strings distributed like cpuset() without
+    used_vcpu. Kinds and numbers of entries of all strings are generated at
+    once.
+
+    :param size: Number of strings to generate.
+    """
+    # Lower bounds of ranges are only drawn at once when they are positive
+    if min_inc < 0:
+        return [cpuset(min_inc, max_inc, max_len) for _ in range(size)]
+
+    counts = int_exp_array(size, 1, max_len)
+    total = sum(counts)
+    kinds = integer_array(total, 0, 2)
+    nums = int_exp_array(total, min_inc, max_inc)
+    uppers = int_exp_array(total, min_inc, max_inc - 1)
+    shifts = int_exp_array(total)
+
+    entries = []
+    for kind, num, upper, shift in zip(kinds, nums, uppers, shifts):
+        if kind == 0:
+            # Number
+            entries.append(str(num))
+        elif kind == 1:
+            # Range, whose lower bound is distributed like
+            # int_exp(min_inc, upper)
+            lower = min_inc
+            if upper != min_inc:
+                lower += shift % (upper - min_inc)
+            entries.append('%s-%s' % (lower, upper))
+        else:
+            # Negation
+            entries.append('^%s' % num)
+
+    res = []
+    start = 0
+    for cnt in counts:
+        res.append(','.join(entries[start:start + cnt]))
+        start += cnt
+    return res
+
+
 def count(min_inc=0, max_inc=None, lambd=0.1):
     return int_exp(min_inc=min_inc, max_inc=max_inc, lambd=lambd)
 
 
+def count_array(size, min_inc=0, max_inc=None, lambd=0.1):
+    """
+    Generate a list of integers distributed like count().
+    """
+    return int_exp_array(size, min_inc=min_inc, max_inc=max_inc, lambd=lambd)
+
+
 def int_exp(min_inc=0, max_inc=None, lambd=0.01):
     """
     A non accurate exponentially distributed integer generator.
     """
-    shift = int(random.expovariate(lambd))
+    rng = _rng()
+    shift = int(rng.expovariate(lambd))
     if max_inc is not None:
         if max_inc - min_inc == 0:
             shift = 0
@@ -65,236 +183,334 @@ def int_exp(min_inc=0, max_inc=None, lambd=0.01):
     if min_inc is not None and min_inc >= 0:
         return min_inc + shift
     else:
-        minus = random.random() > 0.5
+        minus = rng.random() > 0.5
         if min_inc is not None and minus and shift > - min_inc:
             shift %= - min_inc
         return - shift if minus else shift
 
 
+def int_exp_array(size, min_inc=0, max_inc=None, lambd=0.01):
+    """
+    Generate a list of integers distributed like int_exp(). Values are
+    generated at once with NumPy if it's available.
+
+    :param size: Number of integers to generate.
+    """
+    if numpy is None:
+        return [int_exp(min_inc, max_inc, lambd) for _ in range(size)]
+
+    rng = _get_numpy_rng()
+    shift = numpy.floor(rng.exponential(1.0 / lambd, size)).astype('int64')
+    if max_inc is not None:
+        if max_inc - min_inc == 0:
+            shift[:] = 0
+        else:
+            shift %= max_inc - min_inc
+    if min_inc is not None and min_inc >= 0:
+        return (shift + min_inc).tolist()
+
+    minus = rng.random(size) > 0.5
+    if min_inc is not None:
+        wrap = minus & (shift > -min_inc)
+        shift[wrap] %= -min_inc
+    return numpy.where(minus, -shift, shift).tolist()
+
+
 def integer(min_inc=0, max_inc=10):
-    return random.randint(min_inc, max_inc)
+    return _rng().randint(min_inc, max_inc)
 
 
-def text(min_len=5, max_len=10, charset=None, excludes=None):
+def integer_array(size, min_inc=0, max_inc=10):
     """
-    Generate a randomized string.
+    Generate a list of integers distributed like integer().
+
+    :param size: Number of integers to generate.
+    """
+    if numpy is None:
+        rng = _rng()
+        return [rng.randint(min_inc, max_inc) for _ in range(size)]
+    return _get_numpy_rng().integers(min_inc, max_inc + 1, size).tolist()
+
+
+@functools.lru_cache(maxsize=64)
+def _text_chars(charset, excludes):
+    """
+    Get the tuple of choices of text(), each of which is an element of the
+    charset or a printable character not excluded.
     """
+    if charset:
+        return charset
+    return tuple(char for char in string.printable if char not in excludes)
+
 
+def _text_args(charset, excludes):
     if not excludes:
         excludes = "\n\t\r\x0b\x0c"
-
+    # Arguments are made hashable for the cache
     if charset:
-        chars = list(charset)
-    else:
-        chars = []
-        for char in string.printable:
-            if char not in excludes:
-                chars.append(char)
+        charset = tuple(charset)
+    return _text_chars(charset, frozenset(excludes))
+
+
+@functools.lru_cache(maxsize=64)
+def _text_table(chars):
+    """
+    Get choices as a NumPy array of bytes if they are all single latin-1
+    characters, otherwise None.
+    """
+    if not all(len(char) == 1 for char in chars):
+        return None
+    try:
+        return numpy.frombuffer(''.join(chars).encode('latin-1'),
+                                dtype='uint8')
+    except UnicodeEncodeError:
+        return None
+
+
+def text(min_len=5, max_len=10, charset=None, excludes=None):
+    """
+    Generate a randomized string.
+    """
+    chars = _text_args(charset, excludes)
+    rng = _rng()
+    length = rng.randint(min_len, max_len)
+    return ''.join(rng.choices(chars, k=length))
 
-    length = random.randint(min_len, max_len)
 
-    result_str = ''.join(random.choice(chars) for _ in range(length))
+def text_array(size, min_len=5, max_len=10, charset=None, excludes=None):
+    """
+    Generate a list of strings distributed like text(). Characters of all
+    strings are generated at once.
 
-    return result_str
+    :param size: Number of strings to generate.
+    """
+    chars = _text_args(charset, excludes)
+    if numpy is None:
+        rng = _rng()
+        lengths = [rng.randint(min_len, max_len) for _ in range(size)]
+        pool = rng.choices(chars, k=sum(lengths))
+    else:
+        rng = _get_numpy_rng()
+        lengths = rng.integers(min_len, max_len + 1, size).tolist()
+        idxs = rng.integers(0, len(chars), sum(lengths))
+        table = _text_table(chars)
+        if table is not None:
+            # A string of which each character is a choice
+            pool = table[idxs].tobytes().decode('latin-1')
+        else:
+            pool = [chars[idx] for idx in idxs.tolist()]
+
+    res = []
+    start = 0
+    for length in lengths:
+        res.append(''.join(pool[start:start + length]))
+        start += length
+    return res
 
 
 ALL_CHARS = set(string.ascii_letters) - set('&\'"<>')
 # ALL_CHARS = set(string.printable)
+# Visible characters used when negation excludes all of ALL_CHARS
+_VISIBLE_CHARS = set(string.printable) - set(string.whitespace) - set('&\'"<>')
 
 
-def regex(re_str):
+def _negate(chars):
     """
-    Generate a random string matches given regular expression.
+    Get characters not in a set for negated character classes.
     """
-    def _end_chose(chosen, cmin, cmax):
-        current_group = result_stack[-1]
-        current_group.append((chosen, cmin, cmax, neg_chose))
-
-    def _start_group():
-        current_group = [[]]
-        result_stack.append(current_group[0])
-        result_stack[-2].append(current_group)
-
-    def _end_sub_group():
-        current_sub_group = []
-        result_stack[-2][-1].append(current_sub_group)
-        result_stack.pop()
-        result_stack.append(current_sub_group)
-
-    def _end_group(cmin, cmax):
-        parent_group = result_stack[-2]
-        result_stack.pop()
-        parent_group.append((tuple(parent_group.pop()), cmin, cmax))
-
-    def _randomize(stack):
-        if len(stack) == 3:
-            sub_stacks, cmin, cmax = stack
-            assert isinstance(sub_stacks, tuple)
-            sub_stacks = random.choice(sub_stacks)
-            assert isinstance(sub_stacks, list)
-        elif len(stack) == 4:
-            chose_str, cmin, cmax, neg = stack
-            sub_stacks = None
-            assert isinstance(chose_str, str)
-            if neg:
-                chose_str = ''.join(ALL_CHARS - set(chose_str))
-
-        if cmax is None:
-            cnt = int(random.expovariate(0.1)) + cmin
-        else:
-            cnt = random.randint(cmin, cmax)
+    rest = ALL_CHARS - chars
+    if not rest:
+        rest = _VISIBLE_CHARS - chars
+    return rest
 
-        rnd_str = ""
-        if sub_stacks is not None:
-            for _ in range(cnt):
-                for sub_stack in sub_stacks:
-                    rnd_str += _randomize(sub_stack)
-        else:
-            for _ in range(cnt):
-                rnd_str += random.choice(chose_str)
-        return rnd_str
-
-    spanning = False
-    escaping = False
-
-    chosen = []
-    choosing = False
-    neg_chose = False
-
-    counting = None
-    count_min = 0
-    count_max = None
-
-    root_result = []
-    result_stack = [[root_result], root_result]
-
-    _start_group()
-    char_list = list(re_str)
-    while char_list:
-        c = char_list.pop(0)
-        if choosing:
-            if spanning:
-                span_from = chosen[-1]
-                span_to = c
-                cur = ord(span_from)
-                while cur < ord(span_to):
-                    cur += 1
-                    chosen += chr(cur)
-                spanning = False
-                continue
 
-            if escaping:
-                if c == 'n':
-                    chosen += '\n'
-                elif c == 't':
-                    chosen += '\t'
-                elif c == 'r':
-                    chosen += '\r'
-                else:
-                    chosen += c
-                escaping = False
-                continue
+def _category_chars(category):
+    """
+    Get characters of a category like '\\d' in a regular expression.
+    """
+    name = str(category).upper()
+    negate = '_NOT_' in name
+    if name.endswith('DIGIT'):
+        chars = set(string.digits)
+    elif name.endswith('WORD'):
+        chars = set(string.ascii_letters + string.digits + '_')
+    elif name.endswith('SPACE'):
+        chars = set(' ')
+    else:
+        raise ValueError('Unsupported category %s' % category)
+    if negate:
+        chars = _negate(chars)
+    return chars
 
-            if c == ']':
-                choosing = False
-                if char_list and char_list[0] in '{?+*':
-                    counting = 'chose'
-                else:
-                    _end_chose(chosen, 1, 1)
-                continue
 
-            if c == '-':
-                spanning = True
-                continue
+class _Literal(object):
+    def __init__(self, literal):
+        self.text = literal
 
-            if c == '\\':
-                escaping = True
-                continue
+    def generate(self, out, rng):  # pylint: disable=unused-argument
+        out.append(self.text)
 
-            else:
-                chosen += c
-                continue
 
-        if counting:
-            if c == ',':
-                count_max = 0
-                continue
+class _Choice(object):
+    def __init__(self, chars):
+        if not chars:
+            raise ValueError('Empty character class')
+        self.chars = ''.join(sorted(chars))
 
-            if c == '}':
-                if count_max is None:
-                    count_max = count_min
-                if counting == 'chose':
-                    _end_chose(chosen, count_min, count_max)
-                elif counting == 'group':
-                    _end_group(count_min, count_max)
-                else:
-                    logger.error("Unknown counting type %s", counting)
-                counting = None
-                continue
-            if c in string.digits:
-                if count_max is None:
-                    count_min = 10 * count_min + int(c)
-                else:
-                    count_max = 10 * count_max + int(c)
-                continue
-            if c == '{':
-                count_min = 0
-                count_max = None
-                continue
-            if c in '?+*':
-                count_min = 0
-                count_max = None
-                if c == '+':
-                    count_min = 1
-                if c == '?':
-                    count_max = 1
-                if counting == 'chose':
-                    _end_chose(chosen, count_min, count_max)
-                elif counting == 'group':
-                    _end_group(count_min, count_max)
-                else:
-                    logger.error("Unknown counting type %s", counting)
-                counting = None
-                continue
-            logger.error("Not handled counting character: %s", c)
+    def generate(self, out, rng):
+        out.append(rng.choice(self.chars))
 
-        if escaping:
-            _end_chose(c, 1, 1)
-            escaping = False
-            continue
 
-        if c == '(':
-            _start_group()
-            continue
+class _Sequence(object):
+    def __init__(self, nodes):
+        self.nodes = nodes
 
-        if c == ')':
-            if char_list and char_list[0] in '{?+*':
-                counting = 'group'
-            else:
-                _end_group(1, 1)
-            continue
-
-        if c == '[':
-            choosing = True
-            if char_list[0] == '^':
-                char_list.pop(0)
-                neg_chose = True
-            chosen = ''
-            continue
-
-        if c == '\\':
-            escaping = True
-            continue
-
-        if c == '|':
-            _end_sub_group()
-            continue
-
-        chosen = c
-        if char_list and char_list[0] in '{?+*':
-            counting = 'chose'
+    def generate(self, out, rng):
+        for node in self.nodes:
+            node.generate(out, rng)
+
+
+class _Branch(object):
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def generate(self, out, rng):
+        rng.choice(self.nodes).generate(out, rng)
+
+
+class _Repeat(object):
+    def __init__(self, node, cmin, cmax):
+        self.node = node
+        self.cmin = cmin
+        self.cmax = cmax
+
+    def generate(self, out, rng):
+        if self.cmax is None:
+            cnt = int(rng.expovariate(0.1)) + self.cmin
         else:
-            _end_chose(chosen, 1, 1)
-        continue
-    _end_group(1, 1)
-    return _randomize(result_stack[0][0][0])
+            cnt = rng.randint(self.cmin, self.cmax)
+        for _ in range(cnt):
+            self.node.generate(out, rng)
+
+
+class RegexGenerator(object):
+    """
+    Generator of random strings matching a regular expression, compiled
+    once from the parsed pattern with precomputed character tables.
+
+    Negated character classes and '.' choose from ALL_CHARS.
+    """
+
+    def __init__(self, pattern):
+        """
+        :param pattern: The regular expression string.
+        """
+        self.pattern = pattern
+        try:
+            parsed = sre_parse.parse(pattern)
+        except re.error as detail:
+            raise ValueError('Invalid regular expression %r: %s' %
+                             (pattern, detail)) from detail
+        self.root = self._compile(parsed)
+
+    def _compile(self, parsed):
+        nodes = []
+        for opcode, arg in parsed:
+            node = self._compile_op(str(opcode), arg)
+            if node is None:
+                continue
+            # Merge adjacent literals
+            if (isinstance(node, _Literal) and nodes and
+                    isinstance(nodes[-1], _Literal)):
+                nodes[-1] = _Literal(nodes[-1].text + node.text)
+            else:
+                nodes.append(node)
+        if len(nodes) == 1:
+            return nodes[0]
+        return _Sequence(nodes)
+
+    def _compile_op(self, opcode, arg):
+        if opcode == 'LITERAL':
+            return _Literal(chr(arg))
+        elif opcode == 'NOT_LITERAL':
+            return _Choice(_negate(set(chr(arg))))
+        elif opcode == 'ANY':
+            return _Choice(ALL_CHARS)
+        elif opcode == 'IN':
+            return _Choice(self._compile_class(arg))
+        elif opcode in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            cmin, cmax, sub = arg
+            if cmax == sre_parse.MAXREPEAT:
+                cmax = None
+            return _Repeat(self._compile(sub), cmin, cmax)
+        elif opcode in ('SUBPATTERN', 'ATOMIC_GROUP'):
+            return self._compile(arg[-1] if opcode == 'SUBPATTERN' else arg)
+        elif opcode == 'BRANCH':
+            return _Branch([self._compile(sub) for sub in arg[1]])
+        elif opcode == 'AT':
+            return None
+        raise ValueError('Unsupported syntax %s in %r' %
+                         (opcode, self.pattern))
+
+    @staticmethod
+    def _compile_class(items):
+        chars = set()
+        negate = False
+        for opcode, arg in items:
+            opcode = str(opcode)
+            if opcode == 'NEGATE':
+                negate = True
+            elif opcode == 'LITERAL':
+                chars.add(chr(arg))
+            elif opcode == 'RANGE':
+                chars.update(chr(c) for c in range(arg[0], arg[1] + 1))
+            elif opcode == 'CATEGORY':
+                chars |= _category_chars(arg)
+            else:
+                raise ValueError('Unsupported character class item %s' %
+                                 opcode)
+        if negate:
+            chars = _negate(chars)
+        return chars
+
+    def generate(self):
+        """
+        Generate a random string matches the regular expression.
+        """
+        out = []
+        self.root.generate(out, _rng())
+        return ''.join(out)
+
+    def sample(self, size):
+        """
+        Generate a list of random strings match the regular expression.
+
+        :param size: Number of strings to generate.
+        """
+        generate = self.root.generate
+        rng = _rng()
+        res = []
+        for _ in range(size):
+            out = []
+            generate(out, rng)
+            res.append(''.join(out))
+        return res
+
+
+@functools.lru_cache(maxsize=256)
+def compile_regex(re_str):
+    """
+    Compile a regular expression to a generator of matching strings. Compiled
+    generators are cached.
+
+    :param re_str: The regular expression string.
+    :return: A RegexGenerator.
+    """
+    return RegexGenerator(re_str)
+
+
+def regex(re_str):
+    """
+    Generate a random string matches given regular expression.
+    """
+    return compile_regex(re_str).generate()
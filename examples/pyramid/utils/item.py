@@ -1,11 +1,12 @@
 import os
 
 from dice.core import item
-from dice import utils
 
 
 class Item(item.ItemBase):
-    def run(self):
-        cmdline = os.path.join(self.provider.path, 'pyramid')
-        cmdline += ' %s' % utils.escape(str(self.get('option')))
-        self.res = utils.run(cmdline)
+    def command(self):
+        option = self.get('option')
+        # Bytes options are passed as they are generated
+        if not isinstance(option, bytes):
+            option = str(option)
+        return [os.path.join(self.provider.path, 'pyramid'), option]
@@ -46,6 +46,19 @@ setup(
     long_description=__doc__,
     scripts=['scripts/dice'],
     packages=get_packages(),
+    package_data={'dice/utils': ['forksrv.c']},
+    python_requires='>=3.6',
+    classifiers=[
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
+    ],
     # Config file will be introduced later.
     # Currently this does nothing but fail rtd build.
 )
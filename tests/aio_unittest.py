@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+import unittest
+
+from dice.client import aio as client_aio
+from dice.utils import aio
+
+import fakes
+
+
+def _run(coro):
+    loop = aio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _running(arg):
+    """
+    Whether a process with an argument is running.
+    """
+    for pid in os.listdir('/proc'):
+        try:
+            with open('/proc/%s/cmdline' % pid, 'rb') as fp:
+                if arg.encode('ascii') in fp.read().split(b'\0'):
+                    return True
+        except (IOError, OSError, ValueError):
+            pass
+    return False
+
+
+class RunTest(unittest.TestCase):
+    def test_status(self):
+        res = _run(aio.run('echo out; echo err >&2'))
+        self.assertEqual(res.exit_status, 'success')
+        self.assertEqual(res.stdout, 'out\n')
+        self.assertEqual(res.stderr, 'err\n')
+
+        res = _run(aio.run(['sh', '-c', 'exit 3']))
+        self.assertEqual(res.exit_status, 'failure')
+        self.assertEqual(res.exit_code, 3)
+        self.assertEqual(res.cmdline, 'sh -c exit\\ 3')
+
+        # Commands which can't be executed fail like in the shell
+        res = _run(aio.run(['/nonexistent/cmd']))
+        self.assertEqual(res.exit_status, 'failure')
+        self.assertEqual(res.exit_code, 127)
+        self.assertIn('/nonexistent/cmd', res.stderr)
+
+    def test_timeout(self):
+        start = time.monotonic()
+        res = _run(aio.run(['sleep', '30.25'], timeout=0.2))
+        self.assertEqual(res.exit_status, 'timeout')
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertFalse(_running('30.25'))
+
+
+class _App(object):
+    pause = False
+
+    def __init__(self, commands, limit=None):
+        self.exiting = False
+        self.provider = fakes.Provider(commands=commands)
+        self.limit = limit
+        self.items = []
+
+    def _choose_provider(self):
+        return self.provider
+
+    def _process_item(self, item):
+        self.items.append(item)
+        if len(self.items) == self.limit:
+            self.exiting = True
+
+
+class RunTestsTest(unittest.TestCase):
+    def test_run_tests(self):
+        app = _App([], limit=4)
+        client_aio.run_tests(app, 2)
+        self.assertGreaterEqual(len(app.items), 4)
+        self.assertTrue(all(i.res.exit_status == 'success'
+                            for i in app.items))
+
+    def test_thread(self):
+        # The loop created in the main thread runs tests in another thread
+        app = _App([['sh', '-c', 'exit 3']], limit=4)
+        loop = aio.new_event_loop()
+        thread = threading.Thread(target=client_aio.run_tests,
+                                  args=(app, 2), kwargs={'loop': loop})
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(loop.is_closed())
+        self.assertIn(3, [i.res.exit_code for i in app.items])
+
+    def test_error(self):
+        # Items failed to report are logged and don't stop the others
+        app = _App([['false']], limit=3)
+        with self.assertLogs('dice', 'ERROR') as logs:
+            client_aio.run_tests(app, 2)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('broken report', logs.output[0])
+        self.assertGreaterEqual(len(app.items), 3)
+        self.assertNotIn(['false'], [i.argv for i in app.items])
+
+    def test_exit(self):
+        # Running items are killed when the engine stops
+        app = _App([['sleep', '30.5']], limit=2)
+        start = time.monotonic()
+        client_aio.run_tests(app, 2)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertFalse(_running('30.5'))
+
+
+if __name__ == '__main__':
+    unittest.main()
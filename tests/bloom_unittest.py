@@ -0,0 +1,56 @@
+import multiprocessing
+import unittest
+
+from dice.utils import bloom
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_add(self):
+        bfilter = bloom.BloomFilter(error_rate=0.01, max_bytes=1024)
+        keys = [str(i).encode('ascii') for i in range(500)]
+        present = [bfilter.add(key) for key in keys]
+        self.assertLess(sum(present), 10)
+        for key in keys:
+            self.assertIn(key, bfilter)
+            self.assertTrue(bfilter.add(key))
+
+        false_positives = len([i for i in range(1000, 11000)
+                               if str(i).encode('ascii') in bfilter])
+        self.assertLess(false_positives, 10000 * 0.03)
+
+    def test_capacity(self):
+        bfilter = bloom.BloomFilter(error_rate=0.01, max_bytes=16)
+        self.assertEqual(bfilter.num_hashes, 7)
+        for i in range(bfilter.capacity):
+            bfilter.add(str(i).encode('ascii'))
+        # Full filter is cleared to keep the error rate bounded
+        bfilter.add(b'new')
+        self.assertEqual(bfilter.count, 1)
+        self.assertNotIn(b'0', bfilter)
+
+    def test_fork(self):
+        # Keys added by forked processes are shared within the budget
+        bfilter = bloom.BloomFilter(error_rate=0.01, max_bytes=1024)
+        bfilter.add(b'parent')
+        context = multiprocessing.get_context('fork')
+        procs = [context.Process(target=bfilter.add, args=(key,))
+                 for key in (b'a', b'b')]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        self.assertIn(b'a', bfilter)
+        self.assertIn(b'b', bfilter)
+        self.assertEqual(bfilter.count, 3)
+        self.assertEqual(len(bfilter.bits), 1024)
+
+        # Clearing in another process also clears the shared filter
+        proc = context.Process(target=bfilter.clear)
+        proc.start()
+        proc.join()
+        self.assertNotIn(b'parent', bfilter)
+        self.assertEqual(bfilter.count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest import mock
+
+from dice import client
+from dice import utils
+from dice.core import item
+
+import fakes
+
+
+def _app():
+    # Skip parsing arguments and loading providers
+    app = client.DiceApp.__new__(client.DiceApp)
+    app.stats = dict((cat_name, {}) for cat_name in [
+        'skip', 'failure', 'success', 'timeout', 'expected_neg',
+        'unexpected_neg', 'unexpected_pass'])
+    app.metrics = {}
+    app.watching = ''
+    app.pause = False
+    return app
+
+
+def _item(exit_status, stderr='', fail_patts=()):
+    itm = item.ItemBase(fakes.Provider())
+    itm.res = utils.CmdResult('cmd')
+    itm.res.exit_status = exit_status
+    itm.res.stderr = stderr
+    itm.fail_patts = set(fail_patts)
+    return itm
+
+
+class StatResultTest(unittest.TestCase):
+    def test_new_signature(self):
+        app = _app()
+        self.assertTrue(app._stat_result(_item('failure', 'error a')))
+        self.assertFalse(app._stat_result(_item('failure', 'error a')))
+        self.assertTrue(app._stat_result(_item('timeout', 'slow')))
+        self.assertTrue(app._stat_result(
+            _item('failure', 'error b', ['error a'])))
+
+        # New keys of expected results are not error signatures
+        self.assertFalse(app._stat_result(_item('success', 'warning')))
+        self.assertFalse(app._stat_result(
+            _item('failure', 'error a', ['error a'])))
+        self.assertEqual(len(app.stats['success']), 1)
+
+
+class _Panel(object):
+    def __init__(self, cur_key):
+        self.cur_key = cur_key
+
+
+class MergeStatTest(unittest.TestCase):
+    def test_metrics(self):
+        # Metrics rows in the stat panel are ignored
+        app = _app()
+        app._merge_stat(_Panel(('metrics', 0)))
+        self.assertFalse(app.pause)
+        self.assertNotIn('metrics', app.stats)
+
+
+class UpdateWindowTest(unittest.TestCase):
+    def test_selected(self):
+        app = _app()
+        app.engine = None
+        app.window = mock.Mock()
+        app._stat_result(_item('failure', 'error a'))
+        app._stat_result(_item('failure', 'error b'))
+        app.cur_class = ('failure', 1)
+        app.cur_item = (None, None)
+        app.update_window()
+        app.window.items_panel.add_item.assert_called_once_with(
+            {'item': 'cmd'})
+        app.window.update.assert_called_once_with()
+
+
+class CountDuplicatesTest(unittest.TestCase):
+    def test_rate(self):
+        app = _app()
+        app.link = None
+        app.args = mock.Mock(server=None)
+        app.scheduler = mock.Mock()
+        for deduped, duplicates in [(True, 0), (True, 3), (False, 0)]:
+            itm = _item('success')
+            itm.deduped = deduped
+            itm.duplicates = duplicates
+            app._process_item(itm)
+        # Items generated without dedup are not counted
+        self.assertEqual(app.metrics['dedup unique'], 2)
+        self.assertEqual(app.metrics['dedup skipped'], 3)
+        self.assertEqual(app.metrics['dedup rate (%)'], 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
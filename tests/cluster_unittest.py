@@ -0,0 +1,57 @@
+import unittest
+
+from dice import utils
+from dice.client import cluster
+from dice.core import item
+
+import fakes
+
+
+class ClusterTest(unittest.TestCase):
+    def setUp(self):
+        self.providers = {'fake': fakes.Provider()}
+        self.coordinator = cluster.Coordinator(self.providers, '127.0.0.1', 0)
+        self.coordinator.start()
+
+    def tearDown(self):
+        self.coordinator.close()
+
+    def test_parse_address(self):
+        self.assertEqual(cluster.parse_address('8068'), ('', 8068))
+        self.assertEqual(cluster.parse_address('host:8068'),
+                         ('host', 8068))
+        self.assertRaises(cluster.ClusterError,
+                          cluster.parse_address, 'host')
+
+    def test_parse_stream(self):
+        self.assertEqual(cluster.parse_stream('1/3'), (1, 3))
+        for stream in ['3/3', '-1/2', '1', 'a/b']:
+            self.assertRaises(cluster.ClusterError,
+                              cluster.parse_stream, stream)
+
+    def test_send(self):
+        links = [cluster.WorkerLink(self.providers, *self.coordinator.address)
+                 for _ in range(2)]
+        for idx, link in enumerate(links):
+            sent = item.ItemBase(self.providers['fake'])
+            sent.res = utils.CmdResult('cmd %s' % idx)
+            sent.res.stderr = 'error'
+            sent.res.exit_code = 1
+            sent.res.exit_status = 'failure'
+            sent.fail_patts.add('err')
+            link.send(sent)
+            link.close()
+
+        received = [self.coordinator.get(timeout=5) for _ in links]
+        self.assertEqual(sorted(i.res.cmdline for i in received),
+                         ['cmd 0', 'cmd 1'])
+        for recv in received:
+            self.assertIs(recv.provider, self.providers['fake'])
+            self.assertEqual(recv.res.stderr, 'error')
+            self.assertEqual(recv.res.exit_code, 1)
+            self.assertEqual(recv.res.exit_status, 'failure')
+            self.assertEqual(recv.fail_patts, set(['err']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from dice.core import constraint
+from dice.core import item
+
+import fakes
+
+
+class ConditionTest(unittest.TestCase):
+    def setUp(self):
+        self.status = {
+            'a': 'success',
+            'b': 'fail',
+            'c': 'skipped',
+        }
+
+    def test_compare(self):
+        self.assertTrue(constraint.Condition('a is success')(self.status))
+        self.assertTrue(constraint.Condition('b is not Success')(self.status))
+        self.assertTrue(constraint.Condition('b == "fail"')(self.status))
+        self.assertTrue(
+            constraint.Condition('c in [fail, skipped]')(self.status))
+        self.assertFalse(constraint.Condition('a is b')(self.status))
+
+    def test_bool_ops(self):
+        cond = constraint.Condition('a and not b or c is fail')
+        self.assertTrue(cond(self.status))
+        self.assertEqual(cond.names, set(['a', 'b', 'c', 'fail']))
+        self.assertFalse(constraint.Condition('a and b')(self.status))
+        self.assertFalse(
+            constraint.Condition('not (a or c is skipped)')(self.status))
+
+    def test_depends_on_list(self):
+        self.assertFalse(constraint.Condition(['a', 'b'])(self.status))
+        self.assertTrue(constraint.Condition(['a'])(self.status))
+
+    def test_invalid(self):
+        for expr in ['a is', 'a < b', 'x = 1', 'f(a)', 'a is 1']:
+            self.assertRaises(constraint.ConstraintError,
+                              constraint.Condition, expr)
+
+    def test_pickle(self):
+        cond = pickle.loads(pickle.dumps(constraint.Condition('a or b')))
+        self.assertTrue(cond(self.status))
+
+
+class PlanTest(unittest.TestCase):
+    oracle = 'if x is Integer:\n    return SUCCESS()\n'
+
+    def _constraint(self, name, **kwargs):
+        return constraint.Constraint(name, None, oracle=self.oracle, **kwargs)
+
+    def test_order(self):
+        cstrs = [
+            self._constraint('a', require='b is success and c is fail'),
+            self._constraint('b', depends_on=['c']),
+            self._constraint('c', require='outer is success'),
+            self._constraint('d'),
+        ]
+        plan = constraint.ConstraintManager._plan(cstrs)
+        self.assertEqual([c.name for c in plan], ['c', 'd', 'b', 'a'])
+
+    def test_cycle(self):
+        cstrs = [
+            self._constraint('a', require='b is success'),
+            self._constraint('b', depends_on='a'),
+            self._constraint('c'),
+        ]
+        self.assertRaises(constraint.ConstraintError,
+                          constraint.ConstraintManager._plan, cstrs)
+
+
+class ChooseTest(unittest.TestCase):
+    oracle = ('if x is Integer:\n'
+              '    if x > 10:\n'
+              '        if x > 20:\n'
+              '            return SUCCESS()\n'
+              '        else:\n'
+              '            return SUCCESS()\n'
+              '    else:\n'
+              '        return SUCCESS()\n'
+              'else:\n'
+              '    return FAIL()\n')
+
+    def test_partitions(self):
+        cstr = constraint.Constraint('c', None, oracle=self.oracle)
+        self.assertEqual(len(cstr.passes), 3)
+        self.assertEqual(len(cstr.fails), 1)
+        self.assertEqual(cstr._choose(fail_ratio=1.0), cstr.fails[0])
+
+    def test_balance(self):
+        cstr = constraint.Constraint('c', None, oracle=self.oracle)
+        for _ in range(300):
+            cstr._choose(fail_ratio=0.0)
+        runs = [t.runs for t in cstr.passes]
+        self.assertTrue(max(runs) - min(runs) < 50, runs)
+
+        # Traces leading to more distinct outcomes are chosen less
+        cstr.passes[0].outcomes.update(['success', 'failure', 'timeout'])
+        for _ in range(300):
+            cstr._choose(fail_ratio=0.0)
+        runs = [t.runs for t in cstr.passes]
+        self.assertLess(runs[0], min(runs[1:]))
+
+    def test_replay(self):
+        cstr = constraint.Constraint('c', None, oracle=self.oracle)
+        first = cstr._choose(rng=random.Random(1))
+        self.assertIs(cstr._choose(rng=random.Random(1)), first)
+
+        # A given trace is chosen, drawing the same random numbers
+        rng = random.Random(1)
+        other = [t for t in cstr.traces if t is not first][0]
+        self.assertIs(cstr._choose(rng=rng, key=other.key), other)
+        expected = random.Random(1)
+        cstr._choose(rng=expected)
+        self.assertEqual(rng.getstate(), expected.getstate())
+
+
+class LoadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'oracles'))
+        with open(os.path.join(self.tmp_dir, 'oracles', 'a.yaml'), 'w') as fp:
+            fp.write('- name: a\n'
+                     '  require: b is success\n'
+                     '  oracle: |\n'
+                     '    if x is Integer:\n'
+                     '        return SUCCESS()\n'
+                     '- name: b\n'
+                     '  oracle: |\n'
+                     '    if y is Integer:\n'
+                     '        return SUCCESS()\n')
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.patcher = mock.patch.object(constraint, 'CACHE_DIR',
+                                         self.cache_dir)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache(self):
+        mgr = constraint.ConstraintManager(fakes.Provider(path=self.tmp_dir))
+        self.assertEqual([c.name for c in mgr.plan], ['b', 'a'])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # Warm load doesn't parse oracles again
+        with mock.patch.object(constraint.Constraint, '_oracle2traces',
+                               side_effect=AssertionError):
+            mgr = constraint.ConstraintManager(
+                fakes.Provider(path=self.tmp_dir))
+        self.assertEqual([c.name for c in mgr.plan], ['b', 'a'])
+        self.assertTrue(mgr.plan[1].require({'b': 'success'}))
+
+        # Caches made with other sources of dice.core are ignored
+        with mock.patch.object(constraint, '_source_digest',
+                               return_value='changed'):
+            with mock.patch.object(constraint.Constraint, '_oracle2traces',
+                                   side_effect=AssertionError):
+                self.assertRaises(AssertionError,
+                                  constraint.ConstraintManager,
+                                  fakes.Provider(path=self.tmp_dir))
+
+        # Broken cache is ignored
+        for fname in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, fname), 'wb') as fp:
+                fp.write(b'broken')
+        mgr = constraint.ConstraintManager(fakes.Provider(path=self.tmp_dir))
+        self.assertEqual(len(mgr.plan), 2)
+
+    def test_cache_prune(self):
+        fpath = os.path.join(self.tmp_dir, 'oracles', 'a.yaml')
+        constraint.ConstraintManager(fakes.Provider(path=self.tmp_dir))
+        with open(os.path.join(self.tmp_dir, 'oracles', 'b.yaml'), 'w') as fp:
+            fp.write('- name: c\n'
+                     '  oracle: |\n'
+                     '    return SUCCESS()\n')
+        constraint.ConstraintManager(fakes.Provider(path=self.tmp_dir))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        # Caches of previous contents of a file are removed
+        for idx in range(3):
+            with open(fpath, 'a') as fp:
+                fp.write('- name: x%d\n'
+                         '  oracle: |\n'
+                         '    return SUCCESS()\n' % idx)
+            mgr = constraint.ConstraintManager(
+                fakes.Provider(path=self.tmp_dir))
+            self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertEqual(len(mgr.constraints), 6)
+
+        # Files are only replaced by complete caches
+        with mock.patch.object(constraint.os, 'replace',
+                               side_effect=OSError):
+            with open(fpath, 'a') as fp:
+                fp.write('- name: y\n'
+                         '  oracle: |\n'
+                         '    return SUCCESS()\n')
+            constraint.ConstraintManager(fakes.Provider(path=self.tmp_dir))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def _write_child(self, name):
+        with open(os.path.join(self.child_dir, 'c.yaml'), 'w') as fp:
+            fp.write('- name: %s\n'
+                     '  oracle: |\n'
+                     '    if z is Integer:\n'
+                     '        return SUCCESS()\n' % name)
+
+    def test_child_cache(self):
+        self.child_dir = os.path.join(self.tmp_dir, 'children')
+        os.mkdir(self.child_dir)
+        self._write_child('c')
+        mgr = constraint.ConstraintManager(fakes.Provider(path=self.tmp_dir))
+        cstrs = mgr._load_child(self.child_dir)
+        self.assertEqual([c.name for c in cstrs], ['c'])
+        self.assertIn('c:0', mgr.traces)
+
+        # Files with the same stamps are not read again
+        with mock.patch.object(mgr, '_hash_files',
+                               side_effect=AssertionError):
+            self.assertIs(mgr._load_child(self.child_dir), cstrs)
+
+        # Touched files with the same contents are not parsed again
+        stat = os.stat(os.path.join(self.child_dir, 'c.yaml'))
+        os.utime(os.path.join(self.child_dir, 'c.yaml'),
+                 (stat.st_atime, stat.st_mtime + 10))
+        with mock.patch.object(mgr, '_load_constraints',
+                               side_effect=AssertionError):
+            self.assertIs(mgr._load_child(self.child_dir), cstrs)
+
+        # Modified files are parsed again
+        self._write_child('dd')
+        cstrs = mgr._load_child(self.child_dir)
+        self.assertEqual([c.name for c in cstrs], ['dd'])
+        self.assertIs(mgr._load_child(self.child_dir), cstrs)
+
+    def test_child_rebuild(self):
+        self.child_dir = os.path.join(self.tmp_dir, 'children')
+        os.mkdir(self.child_dir)
+        self._write_child('c')
+        mgr = constraint.ConstraintManager(fakes.Provider(path=self.tmp_dir))
+        cstrs = mgr._load_child(self.child_dir)
+        stat = os.stat(os.path.join(self.child_dir, 'c.yaml'))
+
+        mgr._remove_children([self.child_dir])
+        self.assertFalse(os.path.exists(self.child_dir))
+
+        # A directory rebuilt with the same stamps is still checked
+        os.mkdir(self.child_dir)
+        self._write_child('e')
+        os.utime(os.path.join(self.child_dir, 'c.yaml'),
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual([c.name for c in mgr._load_child(self.child_dir)],
+                         ['e'])
+
+        # Rebuilt with the same contents, it's not parsed again
+        mgr._remove_children([self.child_dir])
+        os.mkdir(self.child_dir)
+        self._write_child('e')
+        with mock.patch.object(mgr, '_load_constraints',
+                               side_effect=AssertionError):
+            self.assertEqual(
+                [c.name for c in mgr._load_child(self.child_dir)], ['e'])
+        self.assertIsNot(cstrs, mgr._load_child(self.child_dir))
+
+    def test_constrain_children(self):
+        with open(os.path.join(self.tmp_dir, 'oracles', 'p.yaml'), 'w') as fp:
+            fp.write('- name: p\n'
+                     '  child: ../children\n'
+                     '  oracle: |\n'
+                     '    if w is Integer:\n'
+                     '        return SUCCESS()\n')
+        self.child_dir = os.path.join(self.tmp_dir, 'children')
+        prvdr = fakes.Provider(path=self.tmp_dir)
+        mgr = constraint.ConstraintManager(prvdr)
+        for constrain in (mgr.constrain,
+                          lambda itm: mgr.constrain_batch([itm])):
+            # Generated directories of children are removed after use
+            os.mkdir(self.child_dir)
+            self._write_child('c')
+            itm = item.ItemBase(prvdr)
+            constrain(itm)
+            self.assertEqual(mgr.status['c'], 'success')
+            self.assertIsInstance(itm.get('z'), int)
+            self.assertFalse(os.path.exists(self.child_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import random
+import string
+import unittest
+
+from dice.utils import entropy
+
+
+class EntropyPoolTest(unittest.TestCase):
+    def test_read(self):
+        pool = entropy.EntropyPool(block_size=64)
+        first = pool.read(40)
+        second = pool.read(20)
+        self.assertEqual(len(first), 40)
+        self.assertEqual(len(second), 20)
+        # Slices don't copy the block
+        self.assertIsInstance(first, memoryview)
+        self.assertIs(first.obj, second.obj)
+
+        self.assertIsNot(pool.read(20).obj, first.obj)
+        self.assertEqual(len(pool.read(100)), 100)
+
+    def test_fork(self):
+        pool = entropy.EntropyPool(block_size=64)
+        pool.read(1)
+        pool.pid = -1
+        pool.read(1)
+        self.assertEqual(pool.pid, os.getpid())
+        self.assertEqual(pool.offset, 1)
+
+    def test_strings(self):
+        pool = entropy.EntropyPool(block_size=1024)
+        res = pool.nonzero_bytes(2000)
+        self.assertIsInstance(res, bytes)
+        self.assertNotIn(b'\0', res)
+
+        res = pool.printable(5000)
+        self.assertEqual(len(res), 5000)
+        self.assertTrue(set(res) <= set(string.printable))
+        self.assertEqual(set(res), set(string.printable))
+
+    def test_from_rng(self):
+        # Bytes follow the state of the random generator
+        res = [entropy.from_rng(random.Random(1)).printable(100)
+               for _ in range(2)]
+        self.assertEqual(res[0], res[1])
+
+        # Bytes are read from the generator without buffering
+        pool = entropy.from_rng(random.Random(1))
+        source = entropy._randbytes(random.Random(1))
+        for size in [10, 5, 0, 100]:
+            self.assertEqual(pool.read(size).tobytes(), source(size))
+
+    def test_randbytes(self):
+        # A generator without randbytes(), like the ones before Python 3.9
+        class _Random(object):
+            def __init__(self, seed):
+                self.rng = random.Random(seed)
+
+            def getrandbits(self, k):
+                return self.rng.getrandbits(k)
+
+        source = entropy._randbytes(_Random(1))
+        rng = random.Random(1)
+        for size in [10, 5, 0, 100]:
+            res = source(size)
+            self.assertEqual(len(res), size)
+            if hasattr(rng, 'randbytes'):
+                self.assertEqual(res, rng.randbytes(size))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import time
+
+from dice import utils
+from dice.core import item
+from dice.utils import memo
+
+# Fake providers keyed by name, which pickled providers refer to
+_providers = {}
+
+
+def _lookup(name):
+    return _providers[name]
+
+
+@memo.cached()
+def run_delay(name):
+    """
+    Get the seconds to take running an item of a provider, cached to count
+    calls in the processes running items.
+    """
+    return _providers[name].delay
+
+
+class Item(item.ItemBase):
+    """
+    A fake item. The engines run it with command(), while run() only takes
+    the delay of the provider instead of running a process.
+    """
+
+    def __init__(self, provider, argv=None, fail=False):
+        super(Item, self).__init__(provider)
+        self.argv = argv or ['true']
+        self.fail = fail
+        self.timeout = 60
+        self.res = None
+        self.ran = False
+        # Items reported by the provider when this one was generated
+        self.reports = provider.reports
+
+    def command(self):
+        return self.argv
+
+    def run(self):
+        time.sleep(run_delay(self.provider.name))
+        if self.fail:
+            raise ValueError('Bad item')
+        self.res = utils.CmdResult(' '.join(self.argv))
+        self.res.exit_status = 'success'
+        self.ran = True
+
+
+class Provider(object):
+    """
+    A fake provider generating Item objects. Like real providers, it's
+    pickled by name, so that forked processes refer to their own copy.
+    """
+    Item = Item
+
+    def __init__(self, name='fake', path=None, commands=None, delay=0.0,
+                 fail_every=0):
+        """
+        :param name: Name of the provider.
+        :param path: Directory of the provider.
+        :param commands: Argument lists of the first items generated, after
+                         which items run 'true'.
+        :param delay: Seconds to take running an item.
+        :param fail_every: Every nth item fails on generating and the next
+                           one on running.
+        """
+        self.name = name
+        self.path = path
+        self.commands = list(commands or [])
+        self.delay = delay
+        self.fail_every = fail_every
+        self.generated = 0
+        # Items reported in current process
+        self.reports = 0
+        _providers[name] = self
+
+    def __reduce__(self):
+        return (_lookup, (self.name,))
+
+    def split_seeds(self, index, count):
+        pass
+
+    def generate(self):
+        self.generated += 1
+        argv = self.commands.pop(0) if self.commands else None
+        if self.fail_every:
+            if self.generated % self.fail_every == 0:
+                raise ValueError('Bad provider')
+            if self.generated % self.fail_every == 1:
+                return Item(self, argv, fail=True)
+        return Item(self, argv)
+
+    def generate_batch(self, size):
+        return [self.generate() for _ in range(size)]
+
+    def report(self, itm):
+        # Items running 'false' fail to be reported
+        if itm.argv == ['false']:
+            raise RuntimeError('broken report')
+        self.reports += 1
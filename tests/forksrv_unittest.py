@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from dice.utils import forksrv
+
+
+class ForkServerTest(unittest.TestCase):
+    def setUp(self):
+        # Build the shim in a temporary directory instead of the user's one
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = mock.patch.object(
+            forksrv, 'SHIM_PATH', os.path.join(self.tmp_dir, 'forksrv.so'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        try:
+            forksrv.build_shim()
+        except forksrv.ForkServerError as detail:
+            self.skipTest(str(detail))
+        self.launcher = forksrv.Launcher()
+        self.addCleanup(self.launcher.close)
+
+    def test_run(self):
+        res = self.launcher.run(['/bin/sh', '-c', 'echo out; echo err >&2'])
+        self.assertEqual(res.stdout, 'out\n')
+        self.assertEqual(res.stderr, 'err\n')
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.exit_status, 'success')
+
+        res = self.launcher.run(['/bin/sh', '-c', 'exit 3'])
+        self.assertEqual(res.stdout, '')
+        self.assertEqual(res.exit_code, 3)
+        self.assertEqual(res.exit_status, 'failure')
+
+    def test_run_timeout(self):
+        res = self.launcher.run(['/bin/sh', '-c', 'sleep 10'], timeout=0.2)
+        self.assertIsNone(res.exit_code)
+        self.assertEqual(res.exit_status, 'timeout')
+
+        res = self.launcher.run(['/bin/sh', '-c', 'echo out'])
+        self.assertEqual(res.stdout, 'out\n')
+
+    def test_run_cmdline(self):
+        self.assertRaises(forksrv.ForkServerError,
+                          self.launcher.run, 'echo out')
+
+
+if __name__ == '__main__':
+    unittest.main()
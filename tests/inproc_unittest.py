@@ -0,0 +1,87 @@
+import ctypes
+import os
+import sys
+import time
+import unittest
+
+from dice.utils import inproc
+
+
+def _echo(text):
+    print(text)
+    sys.stderr.write('err')
+
+
+def _write_fds(text):
+    # Like C extensions writing to file descriptors and stdio
+    print(text)
+    os.write(1, b'fd out\n')
+    os.write(2, b'fd err')
+    ctypes.CDLL(None).puts(b'libc out')
+
+
+def _raise(text):
+    raise ValueError(text)
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+def _exit(code):
+    sys.exit(code)
+
+
+def _pid():
+    print(os.getpid())
+
+
+class CallPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = inproc.CallPool(size=1, max_calls=2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_call_success(self):
+        res = self.pool.call(_echo, ('out',))
+        self.assertEqual(res.stdout, 'out\n')
+        self.assertEqual(res.stderr, 'err')
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.exit_status, 'success')
+
+    def test_call_fds(self):
+        res = self.pool.call(_write_fds, ('out',))
+        self.assertEqual(res.stdout, 'out\nfd out\nlibc out\n')
+        self.assertEqual(res.stderr, 'fd err')
+        # Output of previous calls isn't returned again
+        res = self.pool.call(_echo, ('out',))
+        self.assertEqual(res.stdout, 'out\n')
+        self.assertEqual(res.stderr, 'err')
+
+    def test_call_exception(self):
+        res = self.pool.call(_raise, ('bad value',))
+        self.assertEqual(res.stderr, 'ValueError: bad value')
+        self.assertEqual(res.exit_status, 'failure')
+
+    def test_call_exit(self):
+        res = self.pool.call(_exit, (3,))
+        self.assertEqual(res.exit_code, 3)
+        self.assertEqual(res.exit_status, 'failure')
+
+    def test_call_timeout(self):
+        res = self.pool.call(_sleep, (10,), timeout=0.2)
+        self.assertIsNone(res.exit_code)
+        self.assertEqual(res.exit_status, 'timeout')
+        res = self.pool.call(_echo, ('out',))
+        self.assertEqual(res.exit_status, 'success')
+
+    def test_recycle(self):
+        pids = [self.pool.call(_pid).stdout for _ in range(4)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(pids[2], pids[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import time
+import unittest
+
+from dice.utils import memo
+
+
+class CachedTest(unittest.TestCase):
+    def test_lru(self):
+        calls = []
+
+        @memo.cached(maxsize=2)
+        def double(num):
+            calls.append(num)
+            return num * 2
+
+        self.assertEqual([double(1), double(2), double(1)], [2, 4, 2])
+        self.assertEqual(calls, [1, 2])
+        double(3)
+        double(2)
+        self.assertEqual(calls, [1, 2, 3, 2])
+        self.assertEqual(double.cache.stats(), {
+            'hits': 1, 'misses': 4, 'refreshes': 0, 'size': 2})
+        self.assertIn(double.cache.name, memo.stats())
+
+    def test_stale_while_revalidate(self):
+        values = [1, 2]
+
+        @memo.cached(ttl=0.01)
+        def value():
+            if len(values) > 1:
+                return values.pop(0)
+            return values[0]
+
+        self.assertEqual(value(), 1)
+        time.sleep(0.02)
+        # Stale result is returned while refreshing
+        self.assertEqual(value(), 1)
+        for _ in range(100):
+            if value.cache.refreshes:
+                break
+            time.sleep(0.01)
+        self.assertEqual(value(), 2)
+
+    def test_unhashable(self):
+        @memo.cached()
+        def length(seq):
+            return len(seq)
+
+        self.assertEqual(length([1, 2]), 2)
+        self.assertEqual(length.cache.stats()['size'], 0)
+
+    def test_merge(self):
+        self.assertEqual(memo.merge(
+            {'a': {'hits': 1, 'size': 2}},
+            {'a': {'hits': 3, 'size': 1}, 'b': {'hits': 1, 'size': 1}},
+        ), {'a': {'hits': 4, 'size': 3}, 'b': {'hits': 1, 'size': 1}})
+
+    def test_fork(self):
+        @memo.cached()
+        def double(num):
+            return num * 2
+
+        double(1)
+        double(1)
+        # Forked processes don't count statistics of their parent
+        double.cache.pid = -1
+        self.assertEqual(double.cache.stats(), {
+            'hits': 0, 'misses': 0, 'refreshes': 0, 'size': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
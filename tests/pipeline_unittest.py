@@ -0,0 +1,84 @@
+import time
+import unittest
+
+from dice.client import pipeline
+
+import fakes
+
+
+class PipelineTest(unittest.TestCase):
+    def _start(self, delay=0.0, fail_every=0, **kwargs):
+        prvdr = fakes.Provider('fake', delay=delay, fail_every=fail_every)
+        stages = pipeline.Pipeline({'fake': prvdr}, **kwargs)
+        stages.start()
+        self.addCleanup(stages.stop)
+        return stages
+
+    def test_feedback(self):
+        stages = self._start(generators=1, executors=2, queue_size=4,
+                             batch_size=2)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            stages.submit(lambda: 'fake')
+            item = stages.get(timeout=5)
+            self.assertTrue(item.ran)
+            # Results fed back are reported in the generator process
+            if item.reports > 0:
+                break
+        else:
+            self.fail('No result is fed back to the generator')
+
+        metrics = stages.metrics()
+        self.assertGreater(metrics['generated'], 0)
+        self.assertGreater(metrics['executed'], 0)
+        self.assertEqual(metrics['classified'], stages.classified)
+
+    def test_errors(self):
+        # Stages keep running after failing on an item
+        stages = self._start(fail_every=3, generators=1, executors=1,
+                             queue_size=4)
+        errors = []
+        items = []
+        deadline = time.monotonic() + 10
+        while len(items) < 5 and time.monotonic() < deadline:
+            stages.submit(lambda: 'fake')
+            try:
+                items.append(stages.get(timeout=5))
+            except pipeline.WorkerError as detail:
+                errors.append(str(detail))
+        self.assertEqual(len(items), 5)
+        self.assertTrue(all(item.ran for item in items))
+        self.assertTrue(any('Bad provider' in err for err in errors))
+        self.assertTrue(any('Bad item' in err for err in errors))
+
+    def test_cache_stats(self):
+        stages = self._start(generators=1, executors=1, queue_size=4)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            stages.submit(lambda: 'fake')
+            stages.get(timeout=5)
+            stat = stages.cache_stats().get(fakes.run_delay.cache.name)
+            if stat is not None and stat['hits'] >= 2:
+                break
+        else:
+            self.fail('No cache statistics from the executor')
+        self.assertEqual(stat['misses'], 1)
+
+    def test_stop(self):
+        # Fill all queues so that every process is blocked on sending
+        stages = self._start(delay=0.01, generators=2, executors=2,
+                             queue_size=2)
+        for _ in range(5):
+            stages.submit(lambda: 'fake')
+            time.sleep(0.1)
+        processes = list(stages.workers)
+
+        start = time.monotonic()
+        stages.stop(timeout=5.0)
+        self.assertLess(time.monotonic() - start, 5.0)
+        self.assertEqual(stages.workers, [])
+        self.assertFalse(any(p.is_alive() for p in processes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from dice.client import pool
+
+import fakes
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        providers = {'good': fakes.Provider('good'),
+                     'bad': fakes.Provider('bad', fail_every=1)}
+        self.workers = pool.WorkerPool(providers, 1)
+        self.workers.start()
+
+    def tearDown(self):
+        self.workers.stop()
+
+    def test_error(self):
+        # A failed item doesn't stop the worker
+        for name in ['bad', 'good']:
+            self.workers.submit(name)
+        self.assertRaises(pool.WorkerError, self.workers.get, 5)
+        self.assertEqual(self.workers.get(5).res.cmdline, 'true')
+        self.assertEqual(self.workers.pending, 0)
+
+    def test_cache_stats(self):
+        for _ in range(3):
+            self.workers.submit('good')
+            self.workers.get(5)
+        stat = self.workers.cache_stats()[fakes.run_delay.cache.name]
+        self.assertEqual((stat['hits'], stat['misses']), (2, 1))
+        # Calls in workers aren't counted in the parent
+        self.assertEqual(fakes.run_delay.cache.stats()['misses'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from dice.client import pipeline
+from dice.client import pool
+from dice.core import constraint
+from dice.core import provider
+
+
+class SeedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.tmp_dir, 'seeded')
+        os.makedirs(os.path.join(path, 'utils'))
+        os.makedirs(os.path.join(path, 'oracles'))
+        with open(os.path.join(path, 'utils', 'item.py'), 'w') as fp:
+            fp.write('from dice.core import item\n'
+                     '\n'
+                     '\n'
+                     'class Item(item.ItemBase):\n'
+                     '    def command(self):\n'
+                     "        return ['true']\n")
+        with open(os.path.join(path, 'oracles', 'a.yaml'), 'w') as fp:
+            fp.write('- name: number\n'
+                     '  oracle: |\n'
+                     '    if number is Integer:\n'
+                     '        if number > 100:\n'
+                     '            return FAIL()\n'
+                     '        else:\n'
+                     '            return SUCCESS()\n'
+                     '    else:\n'
+                     '        return FAIL()\n'
+                     '- name: data\n'
+                     '  oracle: |\n'
+                     '    if data is String:\n'
+                     '        return SUCCESS()\n')
+        self.patcher = mock.patch.object(
+            constraint, 'CACHE_DIR', os.path.join(self.tmp_dir, 'cache'))
+        self.patcher.start()
+        self.provider = provider.Provider(path)
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def _options(item):
+        return (item.get('number'), item.get('data'))
+
+    def test_unseeded(self):
+        item = self.provider.generate()
+        self.assertIsNone(item.seed)
+        self.assertIsNone(item.rng)
+
+    def test_regenerate(self):
+        self.provider.set_seed(42)
+        items = [self.provider.generate() for _ in range(20)]
+        items.extend(self.provider.generate_batch(20))
+        self.assertEqual(items[0].seed, 42 << 64)
+        self.assertEqual(len(set(i.seed for i in items)), 40)
+
+        for item in items:
+            self.assertIsNone(item.rng)
+            data = item.serialize()
+            again = self.provider.regenerate(data['seed'],
+                                             data['trace_keys'])
+            self.assertEqual(self._options(again), self._options(item))
+            self.assertEqual(again.trace_keys, item.trace_keys)
+
+    def test_set_seed(self):
+        self.assertRaises(provider.ProviderError,
+                          self.provider.set_seed, 2 ** 64)
+        self.assertRaises(provider.ProviderError,
+                          self.provider.set_seed, 1, 2, 2)
+
+        self.provider.set_seed(1, 1, 2)
+        self.provider.split_seeds(2, 3)
+        counters = [self.provider.generate().seed & (2 ** 64 - 1)
+                    for _ in range(3)]
+        self.assertEqual(counters, [5, 11, 17])
+
+    def _seeds(self, items):
+        seeds = [item.seed for item in items]
+        self.assertEqual(len(seeds), len(set(seeds)))
+        self.assertTrue(all(seed >> 64 == 7 for seed in seeds))
+        return seeds
+
+    def test_pool_streams(self):
+        self.provider.set_seed(7)
+        workers = pool.WorkerPool({self.provider.name: self.provider}, 2)
+        workers.start()
+        try:
+            for _ in range(20):
+                workers.submit(self.provider.name)
+            items = [workers.get(timeout=10) for _ in range(20)]
+        finally:
+            workers.stop()
+        self._seeds(items)
+
+    def test_pipeline_streams(self):
+        self.provider.set_seed(7)
+        stages = pipeline.Pipeline({self.provider.name: self.provider},
+                                   generators=2, queue_size=8, batch_size=4)
+        stages.start()
+        try:
+            items = []
+            while len(items) < 20:
+                stages.submit(lambda: self.provider.name)
+                items.append(stages.get(timeout=10))
+        finally:
+            stages.stop()
+        self._seeds(items)
+
+
+if __name__ == '__main__':
+    unittest.main()
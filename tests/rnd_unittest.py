@@ -1,5 +1,7 @@
+import random
 import re
 import unittest
+from unittest import mock
 
 from dice.utils import rnd
 
@@ -86,5 +88,91 @@ class RndRegexTest(unittest.TestCase):
                 m = re.match(patt + '$', res)
                 self.assertIsNotNone(m)
 
+    def test_compile_regex(self):
+        patts = [
+            r"\d{3}-\w+",
+            r"[\d\s]+\D\W",
+            r"a.b.?",
+            r"(ab|c){2,4}x*?",
+            r"^(?:[0-9a-f]{2}:){5}[0-9a-f]{2}$",
+        ]
+        for patt in patts:
+            gen = rnd.compile_regex(patt)
+            self.assertIs(gen, rnd.compile_regex(patt))
+            for res in gen.sample(50):
+                self.assertIsNotNone(re.match(patt + '$', res), (patt, res))
+
+        self.assertRaises(ValueError, rnd.compile_regex, r"(a)\1")
+        self.assertRaises(ValueError, rnd.compile_regex, r"(a")
+
+
+class RndUsingTest(unittest.TestCase):
+    def _values(self, seed):
+        with rnd.using(random.Random(seed)) as rng:
+            self.assertIs(rnd._rng(), rng)
+            return [rnd.regex('[a-z]{10}'), rnd.text(), rnd.int_exp(),
+                    rnd.integer(0, 1000), rnd.cpuset(max_len=5),
+                    rnd.int_exp_array(5), rnd.text_array(3)]
+
+    def test_using(self):
+        self.assertEqual(self._values(1), self._values(1))
+        self.assertNotEqual(self._values(1), self._values(2))
+        self.assertIs(rnd._rng(), random)
+
+        # Generators are restored after nested usage
+        rng = random.Random(1)
+        with rnd.using(rng):
+            with rnd.using(random.Random(2)):
+                pass
+            self.assertIs(rnd._rng(), rng)
+
+
+class RndTextTest(unittest.TestCase):
+    def test_text(self):
+        for _ in range(20):
+            text = rnd.text(excludes=['a', 'b'])
+            self.assertTrue(5 <= len(text) <= 10)
+            self.assertFalse(set(text) & set('ab'))
+            text = rnd.text(2, 4, charset=['xy', 'z'])
+            self.assertIsNotNone(re.match('(xy|z){2,4}$', text))
+
+
+class RndArrayTest(unittest.TestCase):
+    def _check_arrays(self):
+        values = rnd.int_exp_array(500, 5, 20)
+        self.assertEqual(len(values), 500)
+        self.assertTrue(all(5 <= v < 20 for v in values))
+        self.assertTrue(all(v >= -50 for v in rnd.int_exp_array(500, -50)))
+        self.assertTrue(all(0 <= v <= 3 for v in rnd.count_array(50, 0, 3)))
+        self.assertTrue(all(3 <= v <= 4 for v in rnd.integer_array(50, 3, 4)))
+
+        texts = rnd.text_array(100, 2, 4, charset='ab')
+        self.assertEqual(len(texts), 100)
+        for text in texts:
+            self.assertIsNotNone(re.match('[ab]{2,4}$', text))
+        for text in rnd.text_array(20, excludes='abc'):
+            self.assertTrue(5 <= len(text) <= 10)
+            self.assertFalse(set(text) & set('abc'))
+        # Each element of a charset is a choice
+        for text in rnd.text_array(50, 2, 4, charset=['xy', 'z']):
+            self.assertIsNotNone(re.match('(xy|z){2,4}$', text))
+
+        for cpus in rnd.cpuset_array(50, 0, 10, max_len=5):
+            self.assertIsNotNone(re.match(r'\^?\d+(-\d+)?(,\^?\d+(-\d+)?)*$',
+                                          cpus))
+            for entry in cpus.split(','):
+                nums = [int(num) for num in entry.lstrip('^').split('-')]
+                self.assertTrue(all(0 <= num <= 10 for num in nums))
+                self.assertEqual(nums, sorted(nums))
+
+    @unittest.skipIf(rnd.numpy is None, 'NumPy is not installed')
+    def test_arrays(self):
+        self._check_arrays()
+
+    def test_arrays_without_numpy(self):
+        with mock.patch.object(rnd, 'numpy', None):
+            self._check_arrays()
+
+
 if __name__ == '__main__':
     unittest.main()
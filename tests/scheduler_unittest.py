@@ -0,0 +1,29 @@
+import unittest
+
+from dice.client import scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_single(self):
+        sched = scheduler.Scheduler(['a'])
+        self.assertEqual(sched.choose(), 'a')
+
+    def test_prefer_yield(self):
+        sched = scheduler.Scheduler(['fruitful', 'barren'])
+        for _ in range(200):
+            sched.update('fruitful', 0.01, 0.09, 1)
+            sched.update('barren', 0.01, 0.09, 0)
+        chosen = [sched.choose() for _ in range(100)]
+        self.assertGreater(chosen.count('fruitful'), 90)
+
+    def test_prefer_cheap(self):
+        sched = scheduler.Scheduler(['cheap', 'costly'])
+        for _ in range(50):
+            sched.update('cheap', 0.01, 0.09, 1)
+            sched.update('costly', 0.1, 0.9, 1)
+        chosen = [sched.choose() for _ in range(100)]
+        self.assertGreater(chosen.count('cheap'), 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import time
+import unittest
+
+from dice.core import symbol
+
+
+class IntegerTest(unittest.TestCase):
+    def _integer(self, minimum=None, maximum=None, excs=None):
+        sym = symbol.Integer()
+        sym.minimum = minimum
+        sym.maximum = maximum
+        sym.excs = excs
+        return sym
+
+    def test_narrow(self):
+        sym = self._integer(1000, 1000)
+        start = time.time()
+        for _ in range(1000):
+            self.assertEqual(sym.model(), 1000)
+        self.assertLess(time.time() - start, 1.0)
+
+        sym = self._integer(-(2 ** 80), -(2 ** 80) + 3)
+        for _ in range(100):
+            self.assertTrue(-(2 ** 80) <= sym.model() <= -(2 ** 80) + 3)
+
+    def test_excs(self):
+        sym = self._integer(-2, 2, excs=[-1, 0, 1, 5, 'a'])
+        self.assertEqual(sym.intervals(), [(-2, -2), (2, 2)])
+        for _ in range(100):
+            self.assertIn(sym.model(), [-2, 2])
+
+        sym = self._integer(excs=[0])
+        self.assertEqual(sym.intervals(), [(None, -1), (1, None)])
+        for _ in range(100):
+            self.assertNotEqual(sym.model(), 0)
+
+    def test_heavy_tail(self):
+        sym = self._integer(minimum=0)
+        values = [sym.generate() for _ in range(2000)]
+        self.assertTrue(all(v >= 0 for v in values))
+        # Small magnitudes are preferred like the unbounded distribution
+        small = len([v for v in values if v < 2 ** 30])
+        self.assertTrue(500 < small < 1900)
+
+    def test_model_batch(self):
+        values = self._integer(-5, 5, excs=[0]).model_batch(200)
+        self.assertEqual(len(values), 200)
+        self.assertTrue(all(-5 <= v <= 5 and v != 0 for v in values))
+
+    def test_unsatisfiable(self):
+        self.assertRaises(symbol.SymbolError,
+                          self._integer(3, 2).generate)
+        self.assertRaises(symbol.SymbolError,
+                          self._integer(1, 2, excs=[1, 2]).generate)
+        self.assertRaises(symbol.SymbolError,
+                          symbol.Integer(exc_types=['Integer']).model)
+
+
+class BytesTest(unittest.TestCase):
+    def test_types(self):
+        for _ in range(50):
+            res = symbol.Bytes().model()
+            self.assertIsInstance(res, bytes)
+            self.assertNotIn(b'\0', res)
+            res = symbol.NonEmptyBytes().model()
+            self.assertIsInstance(res, bytes)
+            self.assertTrue(res)
+            self.assertIsInstance(symbol.String().model(), str)
+
+    def test_str_excs(self):
+        sym = symbol.Bytes(scope=[b'a', b'b'], excs=['a'])
+        for _ in range(20):
+            self.assertEqual(sym.model(), b'b')
+
+
+class ExclusionTest(unittest.TestCase):
+    def test_scope_excluded(self):
+        sym = symbol.Bytes(scope=['a', 'b'], excs=['b', 'a', 'c'])
+        self.assertRaises(symbol.SymbolError, sym.model)
+
+        sym = symbol.Bytes(excs=['a'], exc_types=['Bytes'])
+        self.assertRaises(symbol.SymbolError, sym.model)
+
+    def test_large_excs(self):
+        scope = [str(idx) for idx in range(100000)]
+        sym = symbol.Bytes(scope=scope, excs=scope[1:])
+        start = time.time()
+        self.assertEqual(sym.model_batch(100), ['0'] * 100)
+        self.assertLess(time.time() - start, 1.0)
+
+        sym = symbol.Bytes(scope=scope, excs=scope[:10])
+        for value in sym.model_batch(100):
+            self.assertNotIn(value, scope[:10])
+
+    def test_unhashable_scope(self):
+        # Lists and dicts in scope are sampled like other values
+        scope = [['a', 'b'], ['c']]
+        for value in symbol.Bytes(scope=scope).model_batch(20):
+            self.assertIn(value, scope)
+        self.assertEqual(symbol.Bytes(scope=[{'k': 1}]).model(), {'k': 1})
+
+        sym = symbol.Bytes(scope=scope, excs=[['c'], 'd'])
+        self.assertEqual(sym.model_batch(20), [['a', 'b']] * 20)
+        sym = symbol.Bytes(scope=[{'k': 1}, 'x'], excs=[{'k': 1}])
+        self.assertEqual(sym.model(), 'x')
+        sym = symbol.Bytes(scope=scope, exc_types=['Integer'])
+        self.assertIn(sym.model(), scope)
+
+    def test_exc_types(self):
+        sym = symbol.Bytes(scope=[b'12', '-3', b'x', 'y'],
+                           exc_types=['Integer'])
+        for value in sym.model_batch(50):
+            self.assertIn(value, [b'x', 'y'])
+
+        sym = symbol.Bytes(scope=['', 'a', '1'],
+                           exc_types=['Integer', 'NonEmptyBytes'])
+        self.assertEqual(sym.model(), '')
+        self.assertRaises(symbol.SymbolError,
+                          symbol.Bytes(exc_types=['Unknown']).model)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from dice import utils
+from dice.core import timing
+
+
+def _result(call_time, exit_status='success'):
+    res = utils.CmdResult('cmd')
+    res.call_time = call_time
+    res.exit_status = exit_status
+    return res
+
+
+class TimeoutEstimatorTest(unittest.TestCase):
+    def setUp(self):
+        self.estimator = timing.TimeoutEstimator(
+            factor=5.0, floor=0.1, ceiling=10.0, min_samples=10)
+
+    def test_no_samples(self):
+        self.assertEqual(self.estimator.timeout(['a:0']), 10.0)
+
+    def test_estimate(self):
+        for _ in range(20):
+            self.estimator.record(['a:0'], _result(0.2))
+            self.estimator.record(['b:0'], _result(0.4))
+        self.assertAlmostEqual(self.estimator.timeout(['a:0']), 1.0)
+        self.assertAlmostEqual(self.estimator.timeout(['a:0', 'b:0']), 2.0)
+        # Items without traces are estimated from samples of the provider
+        self.assertAlmostEqual(self.estimator.timeout([]), 2.0)
+        # Unknown traces get the ceiling until they have enough samples
+        self.assertEqual(self.estimator.timeout(['c:0']), 10.0)
+        self.assertEqual(self.estimator.timeout(['a:0', 'c:0']), 10.0)
+
+    def test_floor(self):
+        for _ in range(20):
+            self.estimator.record(['a:0'], _result(0.001))
+        self.assertEqual(self.estimator.timeout(['a:0']), 0.1)
+
+    def test_strikes(self):
+        self.estimator.record(['a:0'], _result(10.0, 'timeout'))
+        self.estimator.record(['a:0'], _result(5.0, 'timeout'))
+        self.assertEqual(self.estimator.timeout(['a:0']), 2.5)
+        self.estimator.record(['a:0'], _result(0.01))
+        self.assertEqual(self.estimator.timeout(['a:0']), 10.0)
+
+    def test_slow_trace(self):
+        # A slow trace isn't held at the estimate of fast ones
+        estimator = timing.TimeoutEstimator(min_samples=10)
+        for _ in range(100):
+            estimator.record(['fast:0'], _result(0.01))
+        for _ in range(10):
+            timeout = estimator.timeout(['slow:0'])
+            self.assertGreater(timeout, 3.0)
+            estimator.record(['slow:0'], _result(3.0))
+        self.assertEqual(estimator.timeout(['fast:0']), 1.0)
+        self.assertEqual(estimator.timeout(['slow:0']), 10.0)
+
+    def test_censored(self):
+        # Timed out runs count as samples of their limits
+        for _ in range(9):
+            self.estimator.record(['a:0'], _result(0.01))
+        self.estimator.record(['a:0'], _result(1.0, 'timeout'))
+        self.assertEqual(self.estimator.timeout(['a:0']), 5.0)
+        self.estimator.record(['a:0'], _result(0.01))
+        self.assertEqual(self.estimator.timeout(['a:0']), 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import pickle
+import random
+import sys
+import types
+import unittest
+
+from dice.core import constraint
+from dice.core import symbol
+from dice.core import trace
+from dice.utils import rnd
+
+import fakes
+
+
+class _Item(object):
+    rng = None
+
+    def __init__(self, options=None):
+        self.options = options or {}
+
+    def get(self, name):
+        return self.options.get(name)
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        lib = types.ModuleType('fake_utils.lib')
+        lib.modes = lambda: ['r', 'w']
+        lib.limit = lambda size: [size]
+        sys.modules['fake_utils.lib'] = lib
+
+    def tearDown(self):
+        del sys.modules['fake_utils.lib']
+
+    def _traces(self, oracle):
+        cstr = constraint.Constraint('c', fakes.Provider(), oracle=oracle)
+        return cstr.traces
+
+    def test_bounds(self):
+        t, = [t for t in self._traces(
+            'if x is Integer:\n'
+            '    if x > 3:\n'
+            '        if x < 6:\n'
+            '            return SUCCESS()\n') if t.result == 'success']
+        self.assertTrue(all(isinstance(op, trace._Compare) for op in t.plan))
+        for _ in range(20):
+            sol = t.solve(_Item())
+            self.assertIn(sol['x'], [4, 5])
+        self.assertIsInstance(t.symbols['x'], symbol.Integer)
+
+    def test_literals(self):
+        t = self._traces(
+            'if x == 3:\n'
+            '    if name == "abc":\n'
+            '        return FAIL("bad name")\n')[0]
+        self.assertEqual(t.result_patts, 'bad name')
+        self.assertEqual(t.solve(_Item()), {'x': 3, 'name': 'abc'})
+        self.assertIsInstance(t.symbols['x'], symbol.Integer)
+        self.assertIsInstance(t.symbols['name'], symbol.Bytes)
+
+    def test_call(self):
+        t = self._traces(
+            'if mode in lib.modes():\n'
+            '    return SUCCESS()\n')[0]
+        for _ in range(20):
+            self.assertIn(t.solve(_Item())['mode'], ['r', 'w'])
+
+        t = self._traces(
+            'if count in lib.limit(size):\n'
+            '    return SUCCESS()\n')[0]
+        self.assertEqual(t.solve(_Item({'size': 7})), {'count': 7})
+
+    def test_solve_batch(self):
+        t = self._traces(
+            'if mode in lib.modes():\n'
+            '    return SUCCESS()\n')[0]
+        sols = t.solve_batch([_Item() for _ in range(20)])
+        self.assertEqual(len(sols), 20)
+        self.assertTrue(all(sol['mode'] in ['r', 'w'] for sol in sols))
+
+        # Traces depending on options of items are solved one by one
+        t = self._traces(
+            'if count in lib.limit(size):\n'
+            '    return SUCCESS()\n')[0]
+        sols = t.solve_batch([_Item({'size': 1}), _Item({'size': 2})])
+        self.assertEqual(sols, [{'count': 1}, {'count': 2}])
+
+    def test_solve_batch_scopes(self):
+        # String lists are modeled from scopes like in solve()
+        t = self._traces(
+            'if opts is StringList:\n'
+            '    if all(opts in lib.modes()):\n'
+            '        return SUCCESS()\n')[0]
+        for sols in ([t.solve(_Item()) for _ in range(10)],
+                     t.solve_batch([_Item() for _ in range(10)])):
+            for sol in sols:
+                self.assertIsInstance(sol['opts'], list)
+                self.assertLessEqual(set(sol['opts']), {'r', 'w'})
+
+    def test_seeded(self):
+        lib = sys.modules['fake_utils.lib']
+        lib.name = lambda: rnd.regex('[a-z]{8}')
+        t = self._traces(
+            'if x is Integer:\n'
+            '    if name in lib.name():\n'
+            '        if data is Bytes:\n'
+            '            return SUCCESS()\n')[0]
+
+        def _solve(seed):
+            item = _Item()
+            item.rng = random.Random(seed)
+            return t.solve(item)
+
+        self.assertEqual(_solve(1), _solve(1))
+        self.assertNotEqual(_solve(1), _solve(2))
+
+        # Seeded items are solved one by one from their own generators
+        items = [_Item() for _ in range(3)]
+        for item in items:
+            item.rng = random.Random(1)
+        self.assertEqual(t.solve_batch(items), [_solve(1)] * 3)
+
+    def test_pickle(self):
+        t = self._traces(
+            'if mode in lib.modes():\n'
+            '    return SUCCESS()\n')[0]
+        t.solve(_Item())
+        t = pickle.loads(pickle.dumps(t.plan))
+        self.assertEqual(t[0].call.func, None)
+
+    def test_is_not(self):
+        t, = [t for t in self._traces(
+            'if x is Integer:\n'
+            '    return SUCCESS()\n'
+            'else:\n'
+            '    return FAIL()\n') if t.result == 'fail']
+        for _ in range(20):
+            self.assertFalse(symbol.Integer.accepts(t.solve(_Item())['x']))
+        self.assertEqual(t.symbols['x'].exc_types, ['Integer'])
+
+    def test_is_not_bytes(self):
+        for name in ['Bytes', 'NonEmptyBytes', 'String']:
+            sym_cls = getattr(symbol, name)
+            t, = [t for t in self._traces(
+                'if x is %s:\n'
+                '    return SUCCESS()\n'
+                'else:\n'
+                '    return FAIL()\n' % name) if t.result == 'fail']
+            for _ in range(20):
+                self.assertFalse(sym_cls.accepts(t.solve(_Item())['x']))
+
+        # Values of a symbol can't be excluded by a type accepting them all
+        t, = [t for t in self._traces(
+            'if x is String:\n'
+            '    if x is Bytes:\n'
+            '        return SUCCESS()\n'
+            '    else:\n'
+            '        return FAIL()\n') if t.result == 'fail']
+        self.assertRaises(trace.TraceError, t.solve, _Item())
+
+    def test_unknown_symbol(self):
+        self.assertRaises(trace.TraceError, self._traces,
+                          'if x is Unknown:\n    return SUCCESS()\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
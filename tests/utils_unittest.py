@@ -1,4 +1,11 @@
+import errno
+import os
+import statistics
+import time
 import unittest
+from unittest import mock
+
+from dice import utils
 
 
 class TestBase(unittest.TestCase):
@@ -6,5 +13,86 @@ class TestBase(unittest.TestCase):
         pass
 
 
+class RunTest(unittest.TestCase):
+    def test_run_success(self):
+        res = utils.run('echo out; echo err >&2')
+        self.assertEqual(res.stdout, 'out\n')
+        self.assertEqual(res.stderr, 'err\n')
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(res.exit_status, 'success')
+
+    def test_run_failure(self):
+        res = utils.run('exit 3')
+        self.assertEqual(res.exit_code, 3)
+        self.assertEqual(res.exit_status, 'failure')
+
+    def test_run_large_output(self):
+        res = utils.run('head -c 200000 /dev/zero | tr "\\0" a')
+        self.assertEqual(res.stdout, 'a' * 200000)
+
+    def test_run_timeout(self):
+        start = time.monotonic()
+        res = utils.run('sleep 60', timeout=0.2)
+        self.assertIsNone(res.exit_code)
+        self.assertEqual(res.exit_status, 'timeout')
+        # Killed at the timeout instead of waiting for the command
+        self.assertGreaterEqual(res.call_time, 0.2)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_run_argv(self):
+        res = utils.run(['printf', '%s', 'a b;$HOME'], env={'HOME': '/'})
+        self.assertEqual(res.stdout, 'a b;$HOME')
+        self.assertEqual(res.cmdline, r'printf %s a\ b\;\$HOME')
+
+    def test_run_missing(self):
+        # Commands which can't be executed fail like in the shell
+        res = utils.run(['/nonexistent/cmd'])
+        self.assertEqual(res.exit_code, 127)
+        self.assertEqual(res.exit_status, 'failure')
+        self.assertIn('/nonexistent/cmd', res.stderr)
+
+    def test_fork_exec(self):
+        # The fallback without posix_spawnp() fails like posix_spawnp()
+        out_r, out_w = os.pipe()
+        try:
+            with self.assertRaises(OSError) as ctx:
+                utils._fork_exec(['/nonexistent/cmd'], os.environ,
+                                 out_w, out_w)
+            self.assertEqual(ctx.exception.errno, errno.ENOENT)
+            self.assertIn('/nonexistent/cmd', str(ctx.exception))
+
+            pid = utils._fork_exec(['echo', 'out'], os.environ, out_w, out_w)
+            self.assertEqual(utils._reap(pid), 0)
+            self.assertEqual(os.read(out_r, 64), b'out\n')
+        finally:
+            os.close(out_r)
+            os.close(out_w)
+
+    def test_run_signaled(self):
+        res = utils.run(['sh', '-c', 'kill -9 $$'])
+        self.assertEqual(res.exit_code, -9)
+        self.assertEqual(res.exit_status, 'failure')
+
+    def test_run_fast(self):
+        # Woken by the exit instead of polling every 100 ms. The median is
+        # taken to tolerate a few slow runs on loaded machines.
+        times = []
+        for _ in range(21):
+            res = utils.run(['true'], timeout=60)
+            self.assertEqual(res.exit_status, 'success')
+            times.append(res.call_time)
+        self.assertLess(statistics.median(times), 0.05)
+
+    def test_run_without_pidfd(self):
+        # The exit is noticed before children holding the output exit
+        for pidfd_open in (utils._pidfd_open, lambda pid: None):
+            with mock.patch.object(utils, '_pidfd_open', pidfd_open):
+                start = time.monotonic()
+                res = utils.run('sleep 3 & echo hi', timeout=1.5)
+                self.assertEqual(res.exit_status, 'success')
+                self.assertEqual(res.stdout, 'hi\n')
+                self.assertLess(time.monotonic() - start, 1)
+
+
 if __name__ == '__main__':
     unittest.main()